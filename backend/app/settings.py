@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Opt-in (QUERY_INSTRUMENTATION=1); removes itself otherwise
+    'cash_flow.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -95,6 +97,13 @@ DATABASES = {
     }
 }
 
+# DB_ENGINE=sqlite3 runs the project (and the test suite) without a PostgreSQL server
+if os.getenv('DB_ENGINE') == 'sqlite3':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -114,6 +123,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The pages redirect anonymous users to the only login form of the project
+LOGIN_URL = 'admin:login'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -132,11 +144,49 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
+
+# Uploaded files (queued invoice imports)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# Per-process memory by default; point CACHE_BACKEND/CACHE_LOCATION to Redis or
+# Memcached to share lookup maps and dashboards across worker processes.
+# Must be shared by every process (web workers, run_import_worker, materialize_recurring):
+# cache versions bumped by one process are how the others learn that the ledger changed.
+# The process-local default only suits a single development process (check --deploy warns).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'zenos-finly'),
+    }
+}
+# Seconds the category/credit card lookup maps stay cached (they are also invalidated on writes)
+LOOKUP_CACHE_TIMEOUT = 60 * 60
+# Entries (dashboard fragments, lookup maps, search indexes) each process keeps in memory
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 1000))
+
+# Number of rows validated and written per chunk by the invoice importer
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+# Processes parsing the files of a multi-file import in parallel
+IMPORT_PARSE_WORKERS = int(os.getenv('IMPORT_PARSE_WORKERS', os.cpu_count() or 1))
+# Seconds an idle import worker (manage.py run_import_worker) waits before polling again
+IMPORT_WORKER_POLL_INTERVAL = float(os.getenv('IMPORT_WORKER_POLL_INTERVAL', 2))
+# Seconds a running import may go without progress before another worker reclaims it
+IMPORT_JOB_LEASE = int(os.getenv('IMPORT_JOB_LEASE', 600))
+
+# Per-request query count, DB time and Server-Timing header (cash_flow.middleware);
+# aggregates are served to staff and local clients at /metrics/queries/
+QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', '0').lower() in ('1', 'true', 'yes')
+# Identical statements run this many times in one request are reported as N+1 candidates
+QUERY_INSTRUMENTATION_REPEAT_THRESHOLD = int(os.getenv('QUERY_INSTRUMENTATION_REPEAT_THRESHOLD', 5))
+# Slowest statements kept per request and per route
+QUERY_INSTRUMENTATION_SLOWEST = 5
+
 # DRF & JWT configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -7,6 +7,10 @@ from .models import (
     CreditCardInvoice,
     Category,
     Transaction,
+    BalanceSnapshot,
+    CategoryRollup,
+    ImportJob,
+    ImportJobFile,
     RecurringTransaction,
 )
 
@@ -17,4 +21,8 @@ admin.site.register(CreditCard)
 admin.site.register(CreditCardInvoice)
 admin.site.register(Category)
 admin.site.register(Transaction)
+admin.site.register(BalanceSnapshot)
+admin.site.register(CategoryRollup)
+admin.site.register(ImportJob)
+admin.site.register(ImportJobFile)
 admin.site.register(RecurringTransaction)
\ No newline at end of file
@@ -1,3 +1,12 @@
 from .transaction_manager import TransactionManager
 from .bank_account_manager import AccountManager
-from .category_manager import CategoryManager
\ No newline at end of file
+from .category_manager import CategoryManager
+from .balance_snapshot_manager import BalanceSnapshotManager
+from .invoice_manager import InvoiceManager
+from .category_rollup_manager import CategoryRollupManager
+from .search_manager import SearchManager
+from .invoice_importer import InvoiceImporter
+from .transaction_ingestor import TransactionIngestor
+from .import_job_manager import ImportJobManager
+from .recurrence_manager import RecurrenceManager
+from .forecast_manager import ForecastManager
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .. import cache
+from ..helpers import CENTS, month_start
+from ..models import BalanceSnapshot, Transaction, User
+
+
+class BalanceSnapshotManager:
+    """
+    Maintain BalanceSnapshot rows: one per (bank account, month, status) holding the
+    sum and count of the transactions in that bucket.
+    """
+    queryset = BalanceSnapshot.objects.all()
+
+    def __init__(self, user=None):
+        self.user = user
+        self.queryset = self.queryset.filter(bank_account__user=user) if user else self.queryset
+
+    @staticmethod
+    def collect_deltas(transactions, sign=1):
+        """
+        Group transactions into snapshot deltas.
+        Parameters:
+        - transactions: iterable of Transaction instances (only bank_account_id, date,
+          status and amount are read).
+        - sign: 1 when the transactions are being added, -1 when removed.
+        Returns a dict {(bank_account_id, month, status): [amount, count]}.
+        """
+        deltas = defaultdict(lambda: [Decimal('0'), 0])
+        for tx in transactions:
+            if not tx.bank_account_id:
+                continue
+            bucket = deltas[(tx.bank_account_id, month_start(tx.date), tx.status)]
+            bucket[0] += sign * Decimal(tx.amount)
+            bucket[1] += sign
+        return deltas
+
+    @staticmethod
+    def merge_deltas(*deltas):
+        """
+        Merge several delta dicts returned by collect_deltas into one.
+        """
+        merged = defaultdict(lambda: [Decimal('0'), 0])
+        for delta in deltas:
+            for key, (amount, count) in delta.items():
+                merged[key][0] += amount
+                merged[key][1] += count
+        return merged
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """
+        Apply deltas to the snapshot table.
+        Missing buckets are created in one query; each touched bucket is then
+        incremented with an F() expression so concurrent writers do not lose updates.
+        Must be called inside the same atomic block that changed the ledger.
+        """
+        deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+        if not deltas:
+            return
+        BalanceSnapshot.objects.bulk_create(
+            [BalanceSnapshot(bank_account_id=account_id, month=month, status=status)
+             for account_id, month, status in deltas],
+            ignore_conflicts=True,
+        )
+        for (account_id, month, status), (amount, count) in deltas.items():
+            BalanceSnapshot.objects.filter(
+                bank_account_id=account_id, month=month, status=status
+            ).update(
+                amount=F('amount') + amount,
+                transaction_count=F('transaction_count') + count,
+            )
+
+    @classmethod
+    def add_transactions(cls, transactions):
+        cls.apply_deltas(cls.collect_deltas(transactions, sign=1))
+
+    @classmethod
+    def remove_transactions(cls, transactions):
+        cls.apply_deltas(cls.collect_deltas(transactions, sign=-1))
+
+    def transaction_count(self):
+        """
+        Number of transactions of the user's accounts, read from the snapshots
+        (transactions without a bank account are not counted).
+        """
+        return self.queryset.aggregate(total=Sum('transaction_count'))['total'] or 0
+
+    def ledger_totals(self):
+        """
+        Aggregate the raw ledger into the same buckets as the snapshot table.
+        Returns a dict {(bank_account_id, month, status): (amount, count)}.
+        """
+        transactions = Transaction.objects.filter(bank_account__isnull=False)
+        if self.user:
+            transactions = transactions.filter(bank_account__user=self.user)
+        rows = (
+            transactions
+            .annotate(month=TruncMonth('date'))
+            .values('bank_account_id', 'month', 'status')
+            .annotate(amount=Sum('amount'), transaction_count=Count('id'))
+            .order_by()
+        )
+        return {
+            (row['bank_account_id'], row['month'], row['status']): (row['amount'], row['transaction_count'])
+            for row in rows.iterator()
+        }
+
+    def snapshot_totals(self):
+        """
+        Return the stored snapshots as {(bank_account_id, month, status): (amount, count)},
+        leaving out empty buckets.
+        """
+        rows = self.queryset.exclude(amount=0, transaction_count=0).values_list(
+            'bank_account_id', 'month', 'status', 'amount', 'transaction_count')
+        return {(account_id, month, status): (amount, count)
+                for account_id, month, status, amount, count in rows.iterator()}
+
+    def verify(self):
+        """
+        Compare the snapshots against the raw ledger.
+        Returns a list of dicts describing every bucket that drifted:
+        {'key': (bank_account_id, month, status), 'expected': (amount, count), 'stored': (amount, count)}
+        """
+        expected = self.ledger_totals()
+        stored = self.snapshot_totals()
+        drift = []
+        for key in expected.keys() | stored.keys():
+            exp = expected.get(key, (Decimal('0'), 0))
+            got = stored.get(key, (Decimal('0'), 0))
+            # SQLite sums decimals as floats
+            if Decimal(exp[0]).quantize(CENTS) != Decimal(got[0]).quantize(CENTS) or exp[1] != got[1]:
+                drift.append({'key': key, 'expected': exp, 'stored': got})
+        return sorted(drift, key=lambda item: (item['key'][0], item['key'][1], item['key'][2]))
+
+    def rebuild(self, batch_size=1000):
+        """
+        Drop and recompute the snapshots from the raw ledger, invalidating the
+        users' cached ledger views on commit.
+        Returns the number of snapshot rows written.
+        """
+        with db_transaction.atomic():
+            totals = self.ledger_totals()
+            self.queryset.delete()
+            BalanceSnapshot.objects.bulk_create(
+                [BalanceSnapshot(bank_account_id=account_id, month=month, status=status,
+                                 amount=amount, transaction_count=count)
+                 for (account_id, month, status), (amount, count) in totals.items()],
+                batch_size=batch_size,
+            )
+            # cached balances and forecasts start from the snapshots
+            user_ids = [self.user.pk] if self.user else User.objects.values_list('id', flat=True)
+            for user_id in user_ids:
+                cache.bump_version_on_commit('ledger', user_id)
+        return len(totals)
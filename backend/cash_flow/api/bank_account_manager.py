@@ -1,8 +1,27 @@
 from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-from ..helpers import norm_str
-from ..models import CreditCard, Transaction, BankAccount
+from .. import cache
+from ..helpers import month_start, norm_str
+from ..models import BalanceSnapshot, CreditCard, BankAccount, Transaction
+
+ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _subquery_sum(queryset):
+    """
+    Correlated subquery returning SUM(amount) of `queryset` for the outer account.
+    """
+    return Subquery(
+        queryset.order_by().values('bank_account').annotate(total=Sum('amount')).values('total')[:1],
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
 
 class AccountManager:
     queryset = BankAccount.objects.all()
@@ -10,35 +29,139 @@ class AccountManager:
     def __init__(self, user=None):
         self.user = user
         self.queryset = self.queryset.filter(user=user) if user else self.queryset
-        self.get_credit_cards()
+        self.credit_card_queryset = CreditCard.objects.filter(bank_account__user=user) if user else CreditCard.objects.all()
+        self.accounts_by_id = {}
+        self.accounts_by_name = {}
+        # Credit card maps are loaded lazily from the shared lookup cache.
+        self._credit_cards = None
+        self._credit_cards_by_name = None
+        self._first_accounts = None
 
-    @classmethod
-    def get_account_balance(cls, account_id):
+    @property
+    def cache_scope(self):
+        return getattr(self.user, 'pk', self.user)
+
+    @property
+    def credit_cards(self):
+        if self._credit_cards is None:
+            self.get_credit_cards()
+        return self._credit_cards
+
+    @property
+    def credit_cards_by_name(self):
+        if self._credit_cards_by_name is None:
+            self.get_credit_cards()
+        return self._credit_cards_by_name
+
+    @staticmethod
+    def _annotate_balances(queryset, as_of=None, include_planned=True):
+        statuses = ['CONFIRMED', 'PLANNED'] if include_planned else ['CONFIRMED']
+        # Whole months come from the snapshot table; only the tail of the as_of month
+        # is summed from the raw ledger.
+        snapshots = BalanceSnapshot.objects.filter(bank_account=OuterRef('pk'), status__in=statuses)
+        if as_of is not None:
+            snapshots = snapshots.filter(month__lt=month_start(as_of))
+        balance = F('balance_initial') + Coalesce(_subquery_sum(snapshots), ZERO)
+        if as_of is not None:
+            tail = Transaction.objects.filter(
+                bank_account=OuterRef('pk'),
+                status__in=statuses,
+                date__gte=month_start(as_of),
+                date__lte=as_of,
+            )
+            balance = balance + Coalesce(_subquery_sum(tail), ZERO)
+        return (
+            queryset
+            .annotate(
+                balance=ExpressionWrapper(balance, output_field=DecimalField(max_digits=14, decimal_places=2)),
+                currency_symbol=F('currency__symbol'),
+            )
+            .values('id', 'name', 'bank_name', 'currency_symbol', 'balance')
+            .order_by('id')
+        )
+
+    def balances_queryset(self, as_of=None, include_planned=True):
         """
-        Retrieve the balance of a specific bank account by its ID.
+        Build a queryset that computes the balance of every account of the manager.
+        Parameters:
+        - as_of: Optional date; only transactions up to (and including) it are summed.
+        - include_planned: When False only CONFIRMED transactions are summed,
+          otherwise PLANNED ones are included as well. CANCELLED never count.
+        Returns a values() queryset with id, name, bank_name, currency and balance.
         """
-        account = get_object_or_404(BankAccount, id=account_id)
-        transactions = Transaction.objects.filter(bank_account=account)
-        balance = account.balance_initial
-        for transaction in transactions:
-            balance += transaction.amount
-        # transactions.aggregate(total_amount=Sum('amount'))['total_amount'] or 0
+        return self._annotate_balances(self.queryset, as_of, include_planned)
+
+    @staticmethod
+    def _balance_row(row):
         return {
-                'balance': balance, 
-                'name': account.name, 
-                'currency': account.currency.symbol if account.currency else None, 
-                'bank_name': account.bank_name
+                'balance': row['balance'],
+                'name': row['name'],
+                'currency': row['currency_symbol'],
+                'bank_name': row['bank_name'],
                 }
 
-    def list_accounts(self):
+    @classmethod
+    def get_account_balance(cls, account_id, as_of=None, include_planned=True):
+        """
+        Retrieve the balance of a specific bank account by its ID.
+        """
+        queryset = BankAccount.objects.filter(id=account_id)
+        row = cls._annotate_balances(queryset, as_of, include_planned).first()
+        if row is None:
+            raise Http404("No BankAccount matches the given query.")
+        return cls._balance_row(row)
+
+    def list_accounts(self, as_of=None, include_planned=True):
         """
-        List all bank accounts with their balances.
-        returns account_balances: dict {account_id: balance}        
+        List all bank accounts with their balances, computed in a single grouped query.
+        Parameters:
+        - as_of: Optional date; balances are computed up to (and including) it.
+        - include_planned: Include PLANNED transactions (default) or only CONFIRMED ones.
+        returns account_balances: dict {account_id: {'balance', 'name', 'currency', 'bank_name'}}
         """
-        accounts = self.queryset.prefetch_related('transactions')
-        account_balances = {account.id: self.get_account_balance(account.id) for account in accounts}
-        return account_balances
+        rows = self.balances_queryset(as_of=as_of, include_planned=include_planned)
+        return {row['id']: self._balance_row(row) for row in rows}
     
+    def get_account(self, account):
+        """
+        Return one of the user's bank accounts from an instance or an ID.
+        Raises ValueError for an account that does not exist or belongs to another user.
+        """
+        if isinstance(account, BankAccount):
+            if not self._owns(account):
+                raise ValueError(f"Unknown bank account: {account.pk}")
+            return account
+        if account not in self.accounts_by_id:
+            self._cache_accounts(self.queryset.filter(id=account))
+        if account not in self.accounts_by_id:
+            raise ValueError(f"Unknown bank account: {account}")
+        return self.accounts_by_id[account]
+
+    def _owns(self, account):
+        return self.user is None or account.user_id == self.cache_scope
+
+    def default_account(self):
+        """
+        Account that cards created by name are linked to when no bank account is
+        given: the user's only account, or None when there are several (or none).
+        """
+        if self._first_accounts is None:
+            self._first_accounts = list(self.queryset.order_by('id')[:2])
+            self._cache_accounts(self._first_accounts)
+        return self._first_accounts[0] if len(self._first_accounts) == 1 else None
+
+    def get_credit_card(self, credit_card):
+        """
+        Return one of the user's credit cards from an instance or an ID.
+        Raises ValueError for a card that does not exist or belongs to another user.
+        """
+        card_id = credit_card.pk if isinstance(credit_card, CreditCard) else credit_card
+        if card_id not in self.credit_cards:
+            self._cache_credit_cards(self.credit_card_queryset.filter(id=card_id).select_related('bank_account'))
+        if card_id not in self.credit_cards:
+            raise ValueError(f"Unknown credit card: {card_id}")
+        return self.credit_cards[card_id]
+
     def create_account(self, name, bank_name=None, initial_balance=0, currency=None):
         """
         Create a new bank account for a user.
@@ -49,7 +172,7 @@ class AccountManager:
         - initial_balance: Initial balance of the account, default is 0.
         - currency: Currency instance for the account, can be null.
         """
-        account = self.queryset.filter(name=name).first()
+        account = self.accounts_by_name.get(name) or self.queryset.filter(name=name).first()
         if account:
             return account
         account = BankAccount.objects.create(
@@ -59,34 +182,197 @@ class AccountManager:
             balance_initial=initial_balance,
             currency=currency
         )
+        self._cache_accounts([account], created=True)
         return account
+
+    def update_account(self, account_id, name=None, bank_name=None, initial_balance=None, currency=None):
+        """
+        Update one of the user's bank accounts by ID.
+        Example:
+        update_account(account_id=1, name='Conta corrente', initial_balance=150.00)
+        """
+        account = get_object_or_404(self.queryset, id=account_id)
+        if name is not None:
+            self.accounts_by_name.pop(account.name, None)
+            account.name = name
+        if bank_name is not None:
+            account.bank_name = bank_name
+        if initial_balance is not None:
+            account.balance_initial = initial_balance
+        if currency is not None:
+            account.currency = currency
+        account.save()
+        self._cache_accounts([account])
+        self.ledger_changed()
+        return account
+
+    def delete_account(self, account_id):
+        """
+        Delete one of the user's bank accounts (and its transactions) by ID.
+        """
+        account = get_object_or_404(self.queryset, id=account_id)
+        account.delete()
+        self.accounts_by_id.pop(account_id, None)
+        self.accounts_by_name.pop(account.name, None)
+        cache.bump_version_on_commit('credit_cards', self.cache_scope)
+        self.ledger_changed()
+
+    def ledger_changed(self):
+        """
+        Invalidate everything cached from this user's ledger (dashboard, forecasts)
+        once the current database transaction commits.
+        """
+        scope = self.cache_scope
+        db_transaction.on_commit(lambda: cache.bump_version('ledger', scope))
     
-    def create_credit_card(self, name, bank_account):
+    def create_credit_card(self, name, bank_account=None, limit=0, closing_day=1, due_day=10):
         """
         Create a new credit card for a user.
         Parameters:
         - name: Name of the credit card.
-        - bank_account: BankAccount instance to which the credit card is linked.
+        - bank_account: the user's account the card is linked to (instance, ID, name or
+          dict, see resolve_account); defaults to default_account(). A card is never
+          created without an account: ValueError is raised when there is none to pick.
+        - limit, closing_day, due_day: card details, defaulted for cards created on the fly by imports.
         """
         credit_card = self.credit_cards_by_name.get(norm_str(name))
         if credit_card:
             return credit_card
+        bank_account = self.resolve_account(bank_account) if bank_account else self.default_account()
+        if bank_account is None:
+            raise ValueError(f"Unknown credit card: {name} (give the bank_account it belongs to)")
         credit_card = CreditCard.objects.create(
             bank_account=bank_account,
             name=name,
+            limit=limit,
+            closing_day=closing_day,
+            due_day=due_day,
         )
+        self._cache_credit_cards([credit_card], created=True)
         return credit_card
+
+    def _cache_accounts(self, accounts, created=False):
+        for account in accounts:
+            self.accounts_by_id[account.id] = account
+            self.accounts_by_name[account.name] = account
+        if created:
+            self.ledger_changed()
+
+    def _cache_credit_cards(self, credit_cards, created=False):
+        for credit_card in credit_cards:
+            self.credit_cards[credit_card.id] = credit_card
+            self.credit_cards_by_name[norm_str(credit_card.name)] = credit_card
+        if created:
+            cache.bump_version_on_commit('credit_cards', self.cache_scope)
+            self.ledger_changed()
+
+    @staticmethod
+    def _reference(value):
+        """
+        Classify a bank_account/credit_card reference as ('id', id), ('name', name) or (None, None).
+        """
+        if isinstance(value, bool):
+            return None, None
+        if isinstance(value, int):
+            return 'id', value
+        if isinstance(value, str) and value.strip():
+            return 'name', value
+        if isinstance(value, dict):
+            if value.get('id'):
+                return 'id', value['id']
+            if value.get('name'):
+                return 'name', value['name']
+        return None, None
+
+    def resolve_references(self, rows):
+        """
+        Resolve the bank_account and credit_card references of a batch of rows at once.
+        Accounts are fetched with one IN query, cards by ID with another one, and the
+        accounts/cards referenced by a name that does not exist yet are bulk-created.
+        New cards are linked to the row's account, or to default_account() when the
+        row names none (e.g. a statement that only has a card column).
+        Rows are updated in place with the resolved instances, so the per-row
+        resolve_account_and_card call that follows no longer hits the database.
+        IDs are only looked up among the user's accounts and cards; unknown ones are
+        left in place for resolve_account_and_card to report.
+        Parameters:
+        - rows: list of transaction dictionaries (see TransactionManager.create_transactions).
+        """
+        account_ids, account_names = set(), {}
+        for data in rows:
+            kind, value = self._reference(data.get('bank_account'))
+            if kind == 'id' and value not in self.accounts_by_id:
+                account_ids.add(value)
+            elif kind == 'name' and value not in self.accounts_by_name:
+                details = data['bank_account'] if isinstance(data['bank_account'], dict) else {}
+                account_names.setdefault(value, details)
+
+        if account_ids or account_names:
+            self._cache_accounts(self.queryset.filter(Q(id__in=account_ids) | Q(name__in=account_names)))
+            missing = [name for name in account_names if name not in self.accounts_by_name]
+            if missing:
+                self._cache_accounts(BankAccount.objects.bulk_create([
+                    BankAccount(
+                        user_id=getattr(self.user, 'pk', self.user),
+                        name=name,
+                        bank_name=account_names[name].get('bank_name'),
+                        balance_initial=account_names[name].get('initial_balance', 0),
+                        currency=account_names[name].get('currency'),
+                    ) for name in missing
+                ]), created=True)
+
+        card_ids, card_names = set(), {}
+        for data in rows:
+            kind, value = self._reference(data.get('bank_account'))
+            if kind == 'id':
+                data['bank_account'] = self.accounts_by_id.get(value, data['bank_account'])
+            elif kind == 'name':
+                data['bank_account'] = self.accounts_by_name.get(value, data['bank_account'])
+
+            kind, value = self._reference(data.get('credit_card'))
+            if kind == 'id' and value not in self.credit_cards:
+                card_ids.add(value)
+            elif kind == 'name' and norm_str(value) not in self.credit_cards_by_name:
+                bank_account = data['credit_card'].get('bank_account') if isinstance(data['credit_card'], dict) else None
+                bank_account = bank_account or data.get('bank_account') or self.default_account()
+                # cards without a resolved account of the user are left to resolve_account_and_card to report
+                if isinstance(bank_account, BankAccount) and self._owns(bank_account):
+                    card_names.setdefault(norm_str(value), (value, bank_account))
+
+        if card_ids:
+            self._cache_credit_cards(self.credit_card_queryset.filter(id__in=card_ids).select_related('bank_account'))
+        if card_names:
+            self._cache_credit_cards(CreditCard.objects.bulk_create([
+                CreditCard(bank_account=bank_account, name=name, limit=0, closing_day=1, due_day=10)
+                for name, bank_account in card_names.values()
+            ]), created=True)
+
+        for data in rows:
+            kind, value = self._reference(data.get('credit_card'))
+            if kind == 'id':
+                data['credit_card'] = self.credit_cards.get(value, data['credit_card'])
+            elif kind == 'name':
+                data['credit_card'] = self.credit_cards_by_name.get(norm_str(value), data['credit_card'])
+        return rows
     
     def get_credit_cards(self):
         """
         Retrieve all credit cards associated with the user's bank accounts.
+        The map is shared through the lookup cache and invalidated when a card is created.
         """
-        self.credit_cards = defaultdict(CreditCard)
+        self._credit_cards = defaultdict(CreditCard, cache.get_or_build('credit_cards', self.cache_scope, self.load_credit_cards))
+        self._credit_cards_by_name = {norm_str(cc.name): cc for cc in self._credit_cards.values()}
+        return self._credit_cards
+
+    def load_credit_cards(self):
+        """
+        Build the id -> CreditCard map of the user's cards from the database.
+        """
+        credit_cards = {}
         accounts = self.queryset.prefetch_related('credit_cards')
         for account in accounts:
-            self.credit_cards.update({cc.id: cc for cc in account.credit_cards.all()})
-        self.credit_cards_by_name = {norm_str(cc.name): cc for cc in self.credit_cards.values()}
-        return self.credit_cards
+            credit_cards.update({cc.id: cc for cc in account.credit_cards.all()})
+        return credit_cards
     
     def resolve_account_and_card(self, bank_account=None, credit_card=None):
         """
@@ -94,15 +380,20 @@ class AccountManager:
         Parameters:
         - bank_account: Can be a BankAccount instance, an ID, a name, or a dict with details.
         - credit_card: Can be a CreditCard instance, an ID, a name, or a dict with details.
+        Instances and IDs must belong to the user, otherwise ValueError is raised.
         Returns:
         - (BankAccount instance, CreditCard instance or None)
         """
-        if not isinstance(credit_card, CreditCard):
+        if credit_card == '':
+            credit_card = None
+        if isinstance(credit_card, CreditCard):
+            credit_card = self.get_credit_card(credit_card)
+        else:
             if isinstance(credit_card, int):
-                # If credit_card is an ID, fetch the BankAccount instance
-                credit_card = get_object_or_404(CreditCard, id=credit_card)
+                # If credit_card is an ID, fetch the CreditCard instance
+                credit_card = self.get_credit_card(credit_card)
             elif isinstance(credit_card, str):
-                # If credit_card is a string, assume it is the name and get or create a new account
+                # If credit_card is a string, assume it is the name and get or create the card
                 credit_card = self.create_credit_card(
                     name=credit_card,
                     bank_account=bank_account
@@ -110,9 +401,9 @@ class AccountManager:
             elif isinstance(credit_card, dict):
                 # If credit_card is a dict, assume it contains the ID
                 if 'id' in credit_card:
-                    credit_card = get_object_or_404(CreditCard, id=credit_card['id'])
+                    credit_card = self.get_credit_card(credit_card['id'])
                 else:
-                    self.create_credit_card(
+                    credit_card = self.create_credit_card(
                         name=credit_card['name'],
                         bank_account=credit_card.get('bank_account', bank_account)
                     )
@@ -120,26 +411,32 @@ class AccountManager:
             # If credit_card is provided, get its associated bank account
             bank_account = credit_card.bank_account
             return bank_account, credit_card
-        
-        if not isinstance(bank_account, BankAccount):
-            if isinstance(bank_account, int):
-                # If bank_account is an ID, fetch the BankAccount instance
-                bank_account = get_object_or_404(BankAccount, id=bank_account)
-            elif isinstance(bank_account, str):
-                # If bank_account is a string, assume it is the name and get or create a new account
+        return self.resolve_account(bank_account), None
+
+    def resolve_account(self, bank_account):
+        """
+        Resolve a bank account reference: a BankAccount instance or an ID of one of the
+        user's accounts, or a name (or dict with details) of an account to get or create.
+        """
+        if isinstance(bank_account, BankAccount):
+            bank_account = self.get_account(bank_account)
+        elif isinstance(bank_account, int):
+            # If bank_account is an ID, fetch the BankAccount instance
+            bank_account = self.get_account(bank_account)
+        elif isinstance(bank_account, str):
+            # If bank_account is a string, assume it is the name and get or create a new account
+            bank_account = self.create_account(
+                name=bank_account
+            )
+        elif isinstance(bank_account, dict):
+            # If bank_account is a dict, assume it contains the ID
+            if 'id' in bank_account:
+                bank_account = self.get_account(bank_account['id'])
+            else:
                 bank_account = self.create_account(
-                    name=bank_account
+                    name=bank_account['name'],
+                    bank_name=bank_account.get('bank_name'),
+                    initial_balance=bank_account.get('initial_balance', 0),
+                    currency=bank_account.get('currency')
                 )
-            elif isinstance(bank_account, dict):
-                # If bank_account is a dict, assume it contains the ID
-                if 'id' in bank_account:
-                    bank_account = get_object_or_404(BankAccount, id=bank_account['id'])
-                else:
-                    self.create_account(
-                        name=bank_account['name'],
-                        bank_name=bank_account.get('bank_name'),
-                        initial_balance=bank_account.get('initial_balance', 0),
-                        currency=bank_account.get('currency')
-                    )
-            bank_account = bank_account
-        return bank_account, None
\ No newline at end of file
+        return bank_account
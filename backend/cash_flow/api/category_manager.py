@@ -1,5 +1,6 @@
 from django.shortcuts import get_object_or_404
 
+from .. import cache
 from ..helpers import norm_str
 from ..models import Category
 
@@ -8,7 +9,15 @@ class CategoryManager:
 
     def __init__(self, user):
         self.user = user
-        self.category_by_name = {norm_str(cat.name): cat for cat in self.queryset}
+        # Shared, versioned name -> Category map; copied because create_category extends it.
+        self.category_by_name = dict(cache.get_or_build('categories', None, self.load_categories))
+
+    @classmethod
+    def load_categories(cls):
+        """
+        Build the normalized name -> Category map from the database.
+        """
+        return {norm_str(cat.name): cat for cat in cls.queryset.all()}
     
     def get_category_by_name(self, name):
         """
@@ -16,6 +25,20 @@ class CategoryManager:
         """
         return self.category_by_name.get(norm_str(name))
 
+    def get_category(self, category):
+        """
+        Return a category from an instance or an ID; ValueError when it does not exist.
+        """
+        category_id = category.pk if isinstance(category, Category) else int(category)
+        for cat in self.category_by_name.values():
+            if cat.id == category_id:
+                return cat
+        cat = Category.objects.filter(id=category_id).first()
+        if cat is None:
+            raise ValueError(f"Unknown category: {category_id}")
+        self.category_by_name[norm_str(cat.name)] = cat
+        return cat
+
     def create_category(self, name, is_approved=False):
         """
         Create a new category with the given name and type.
@@ -25,8 +48,35 @@ class CategoryManager:
             return category
         category = Category.objects.create(name=name, is_approved=is_approved)
         self.category_by_name[norm_str(name)] = category
+        cache.bump_version_on_commit('categories')
         return category
 
+    def resolve_references(self, rows):
+        """
+        Resolve the 'category' of a batch of transaction rows at once.
+        Names are matched against the normalized lookup map and every missing
+        category is created with a single bulk insert. Rows are updated in place
+        with the Category instances (empty names become None).
+        """
+        missing = {}
+        for data in rows:
+            name = data.get('category')
+            if isinstance(name, Category) or name is None:
+                continue
+            if not str(name).strip():
+                data['category'] = None
+            elif norm_str(name) not in self.category_by_name:
+                missing.setdefault(norm_str(name), str(name).strip())
+        if missing:
+            for category in Category.objects.bulk_create([Category(name=name) for name in missing.values()]):
+                self.category_by_name[norm_str(category.name)] = category
+            cache.bump_version_on_commit('categories')
+        for data in rows:
+            name = data.get('category')
+            if name is not None and not isinstance(name, Category):
+                data['category'] = self.get_category_by_name(name)
+        return rows
+
     def update_category(self, category_id, name=None, is_approved=None):
         """
         Update an existing category by ID.
@@ -39,6 +89,7 @@ class CategoryManager:
         if is_approved is not None:
             category.is_approved = is_approved
         category.save()
+        cache.bump_version_on_commit('categories')
         return category
 
     def delete_category(self, category_id):
@@ -46,4 +97,5 @@ class CategoryManager:
         Delete a category by ID.
         """
         category = get_object_or_404(Category, id=category_id)
-        category.delete()
\ No newline at end of file
+        category.delete()
+        cache.bump_version_on_commit('categories')
\ No newline at end of file
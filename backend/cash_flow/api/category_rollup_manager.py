@@ -0,0 +1,176 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .. import cache
+from ..helpers import add_months, month_start
+from ..models import BankAccount, CategoryRollup, CreditCard, Transaction, User
+
+
+class CategoryRollupManager:
+    """
+    Maintain CategoryRollup rows: one per (user, month, category, type) holding the
+    sum and count of the transactions that are not cancelled.
+    """
+    queryset = CategoryRollup.objects.all()
+
+    def __init__(self, user=None):
+        self.user = user
+        self.queryset = self.queryset.filter(user=user) if user else self.queryset
+
+    @staticmethod
+    def counts(tx):
+        return tx.status != 'CANCELLED'
+
+    @staticmethod
+    def owners(transactions):
+        """
+        Map the accounts and cards of `transactions` to their user ids.
+        Returns ({bank_account_id: user_id}, {credit_card_id: user_id}).
+        """
+        account_ids = {tx.bank_account_id for tx in transactions if tx.bank_account_id}
+        card_ids = {tx.credit_card_id for tx in transactions if tx.credit_card_id and not tx.bank_account_id}
+        accounts = dict(BankAccount.objects.filter(id__in=account_ids).values_list('id', 'user_id')) if account_ids else {}
+        cards = dict(
+            CreditCard.objects.filter(id__in=card_ids).values_list('id', 'bank_account__user_id')
+        ) if card_ids else {}
+        return accounts, cards
+
+    @classmethod
+    def collect_deltas(cls, transactions, sign=1, user_id=None):
+        """
+        Group transactions into rollup deltas.
+        Parameters:
+        - transactions: iterable of Transaction instances (only bank_account_id, credit_card_id,
+          category_id, type, date, status and amount are read).
+        - sign: 1 when the transactions are being added, -1 when removed.
+        - user_id: owner of every transaction, when known; otherwise it is looked up
+          from the accounts and cards.
+        Returns a dict {(user_id, month, category_id, type): [amount, count]}.
+        """
+        transactions = [tx for tx in transactions if cls.counts(tx)]
+        accounts, cards = cls.owners(transactions) if user_id is None else ({}, {})
+        deltas = defaultdict(lambda: [Decimal('0'), 0])
+        for tx in transactions:
+            owner = user_id or accounts.get(tx.bank_account_id) or cards.get(tx.credit_card_id)
+            if not owner:
+                continue
+            bucket = deltas[(owner, month_start(tx.date), tx.category_id, tx.type)]
+            bucket[0] += sign * Decimal(tx.amount)
+            bucket[1] += sign
+        return deltas
+
+    @staticmethod
+    def merge_deltas(*deltas):
+        merged = defaultdict(lambda: [Decimal('0'), 0])
+        for delta in deltas:
+            for key, (amount, count) in delta.items():
+                merged[key][0] += amount
+                merged[key][1] += count
+        return merged
+
+    @staticmethod
+    def apply_deltas(deltas):
+        """
+        Apply deltas to the rollup table with one F() update per touched bucket.
+        Missing buckets are created in one query first. Must be called inside the
+        same atomic block that changed the ledger.
+        """
+        deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+        if not deltas:
+            return
+        CategoryRollup.objects.bulk_create(
+            [CategoryRollup(user_id=user_id, month=month, category_id=category_id, type=type_)
+             for user_id, month, category_id, type_ in deltas if category_id is not None],
+            ignore_conflicts=True,
+        )
+        for (user_id, month, category_id, type_), (amount, count) in deltas.items():
+            bucket = CategoryRollup.objects.filter(user_id=user_id, month=month, category_id=category_id, type=type_)
+            if category_id is None:
+                # NULL never conflicts in a unique constraint, so the uncategorized bucket
+                # (which also receives rows of deleted categories) is updated through one row
+                row_id = bucket.order_by('id').values_list('id', flat=True).first()
+                if row_id is None:
+                    CategoryRollup.objects.create(user_id=user_id, month=month, type=type_,
+                                                  amount=amount, transaction_count=count)
+                    continue
+                bucket = CategoryRollup.objects.filter(id=row_id)
+            bucket.update(amount=F('amount') + amount, transaction_count=F('transaction_count') + count)
+
+    @classmethod
+    def add_transactions(cls, transactions, user_id=None):
+        cls.apply_deltas(cls.collect_deltas(transactions, sign=1, user_id=user_id))
+
+    @classmethod
+    def remove_transactions(cls, transactions, user_id=None):
+        cls.apply_deltas(cls.collect_deltas(transactions, sign=-1, user_id=user_id))
+
+    def report(self, months=24, end=None, type=None):
+        """
+        Spending and income per category and month for the last `months` months
+        (including the month of `end`, default today), read from the rollups.
+        Returns a list of dicts ordered by month and category:
+        [{'month': date(2024, 1, 1), 'category_id': 3, 'category_name': 'Mercado', 'type': 'PIX', 'amount': Decimal('-120.00'), 'count': 4}, ...]
+        """
+        last_month = month_start(end or date.today())
+        queryset = self.queryset.filter(month__gte=add_months(last_month, 1 - months), month__lte=last_month)
+        if type:
+            queryset = queryset.filter(type=type)
+        rows = (
+            queryset
+            .values('month', 'category_id', 'type')
+            .annotate(category_name=F('category__name'), amount=Sum('amount'), count=Sum('transaction_count'))
+            .exclude(amount=0, count=0)
+            .order_by('month', 'category_name', 'type')
+        )
+        return list(rows)
+
+    def ledger_totals(self):
+        """
+        Aggregate the raw ledger into the same buckets as the rollup table.
+        Returns a dict {(user_id, month, category_id, type): (amount, count)}.
+        """
+        transactions = (
+            Transaction.objects
+            .exclude(status='CANCELLED')
+            .annotate(owner=Coalesce('bank_account__user', 'credit_card__bank_account__user'))
+            .filter(owner__isnull=False)
+        )
+        if self.user:
+            transactions = transactions.filter(owner=self.user.pk)
+        rows = (
+            transactions
+            .annotate(month=TruncMonth('date'))
+            .values('owner', 'month', 'category_id', 'type')
+            .annotate(amount=Sum('amount'), transaction_count=Count('id'))
+            .order_by()
+        )
+        return {
+            (row['owner'], row['month'], row['category_id'], row['type']): (row['amount'], row['transaction_count'])
+            for row in rows.iterator()
+        }
+
+    def rebuild(self, batch_size=1000):
+        """
+        Drop and recompute the rollups from the raw ledger, invalidating the
+        users' cached ledger views on commit.
+        Returns the number of rollup rows written.
+        """
+        with db_transaction.atomic():
+            totals = self.ledger_totals()
+            self.queryset.delete()
+            CategoryRollup.objects.bulk_create(
+                [CategoryRollup(user_id=user_id, month=month, category_id=category_id, type=type_,
+                                amount=amount, transaction_count=count)
+                 for (user_id, month, category_id, type_), (amount, count) in totals.items()],
+                batch_size=batch_size,
+            )
+            # cached balances and category reports are built from these rows
+            user_ids = [self.user.pk] if self.user else User.objects.values_list('id', flat=True)
+            for user_id in user_ids:
+                cache.bump_version_on_commit('ledger', user_id)
+        return len(totals)
@@ -0,0 +1,115 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db.models import Sum
+
+from cash_flow.api.bank_account_manager import AccountManager
+from cash_flow.api.recurrence_manager import RecurrenceManager
+from .. import cache, schedule
+from ..helpers import CENTS, add_months
+from ..models import CreditCardInvoice, Transaction
+
+LEDGER_STATUSES = ['CONFIRMED', 'PLANNED']
+
+
+class ForecastManager:
+    """
+    Project the daily balance of every bank account of a user.
+
+    Card purchases move cash on their invoice's due date, not on the purchase date,
+    so purchases of invoices not yet due are taken out of the opening balance and
+    each invoice total is charged to the card's account on its due date.
+    """
+    max_months = 60
+
+    def __init__(self, user):
+        self.user = user
+        self.account_manager = AccountManager(user)
+        self.recurrence_manager = RecurrenceManager(user)
+
+    def forecast(self, months=12, start=None):
+        """
+        Daily balances from `start` (default today) through `months` months later,
+        cached per user until the next ledger write.
+        Returns:
+        {'start': '2024-01-31', 'end': '2024-07-31', 'dates': ['2024-01-31', ...],
+         'accounts': [{'id': 1, 'name': 'Conta', 'currency': 'R$', 'balances': ['100.00', ...]}],
+         'total': ['100.00', ...]}
+        """
+        months = min(max(int(months), 1), self.max_months)
+        start = start or date.today()
+        return cache.get_or_build(
+            'ledger', self.user.pk, lambda: self.build(start, months), key=f"forecast:{start}:{months}")
+
+    def build(self, start, months):
+        end = add_months(start, months)
+        days = (end - start).days + 1
+        accounts = self.account_manager.list_accounts(as_of=start)
+        deltas = {account_id: [Decimal('0')] * days for account_id in accounts}
+        opening = {account_id: account['balance'] or Decimal('0') for account_id, account in accounts.items()}
+
+        def add(account_id, when, amount):
+            if account_id in deltas and start < when <= end:
+                deltas[account_id][(when - start).days] += amount
+
+        # Card purchases already in the balance but paid only when their invoice is due
+        pending = (
+            Transaction.objects
+            .filter(bank_account_id__in=accounts, status__in=LEDGER_STATUSES,
+                    invoice__due_date__gt=start, date__lte=start)
+            .values('bank_account_id').annotate(total=Sum('amount')).order_by()
+        )
+        for row in pending:
+            opening[row['bank_account_id']] -= row['total']
+
+        invoices = (
+            CreditCardInvoice.objects
+            .filter(credit_card__bank_account_id__in=accounts, due_date__gt=start, due_date__lte=end)
+            .values_list('credit_card__bank_account_id', 'due_date', 'total_amount')
+        )
+        for account_id, due_date, total in invoices:
+            add(account_id, due_date, -total)
+
+        # Future transactions outside card invoices (card purchases are in the totals above)
+        future = (
+            Transaction.objects
+            .filter(bank_account_id__in=accounts, status__in=LEDGER_STATUSES,
+                    date__gt=start, date__lte=end, invoice__isnull=True)
+            .values_list('bank_account_id', 'date', 'amount', 'fingerprint')
+        )
+        written = set()
+        for account_id, when, amount, fingerprint in future:
+            add(account_id, when, amount)
+            if fingerprint:
+                written.add(fingerprint)
+
+        # Occurrences not yet materialized; the ones already written as transactions are skipped
+        rules = self.recurrence_manager.queryset.select_related('bank_account').filter(
+            next_occurrence__isnull=False, next_occurrence__lte=end)
+        for rule in rules:
+            first = max(rule.next_occurrence, start + timedelta(days=1))
+            for when in schedule.occurrences(rule.date, rule.frequency, rule.interval, first, end, until=rule.end_date):
+                if self.recurrence_manager.occurrence_fingerprint(rule, when) not in written:
+                    add(rule.bank_account_id, when, rule.amount)
+
+        series = {}
+        for account_id, account_deltas in deltas.items():
+            account_deltas[0] += opening[account_id]
+            series[account_id] = list(accumulate(account_deltas))
+        total = [sum(values) for values in zip(*series.values())] if series else [Decimal('0')] * days
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'dates': [(start + timedelta(days=i)).isoformat() for i in range(days)],
+            'accounts': [
+                {
+                    'id': account_id,
+                    'name': accounts[account_id]['name'],
+                    'currency': accounts[account_id]['currency'],
+                    'balances': [str(value.quantize(CENTS)) for value in values],
+                }
+                for account_id, values in series.items()
+            ],
+            'total': [str(value.quantize(CENTS)) for value in total],
+        }
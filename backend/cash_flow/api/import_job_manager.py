@@ -0,0 +1,196 @@
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from cash_flow.api.invoice_importer import InvoiceImporter
+from ..models import ImportJob, ImportJobFile
+
+
+class LeaseLost(Exception):
+    """
+    The job was reclaimed by another worker (see ImportJobManager.claim_next).
+    """
+
+
+class ImportJobManager:
+    queryset = ImportJob.objects.all()
+
+    def __init__(self, user=None):
+        self.user = user
+        self.queryset = self.queryset.filter(user=user) if user else self.queryset
+
+    def enqueue(self, uploaded):
+        """
+        Store an uploaded statement and queue it for the import worker.
+        Parameters:
+        - uploaded: Django UploadedFile (XLSX or CSV).
+        Returns the created ImportJob.
+        """
+        return ImportJob.objects.create(user=self.user, file=uploaded, filename=uploaded.name)
+
+    def enqueue_files(self, uploads):
+        """
+        Store several uploaded statements and queue them as one import job, so the
+        worker parses them in parallel and writes their rows as a single batch.
+        Parameters:
+        - uploads: list of Django UploadedFile (XLSX or CSV).
+        Returns the created ImportJob.
+        """
+        if len(uploads) == 1:
+            return self.enqueue(uploads[0])
+        filename_length = ImportJob._meta.get_field('filename').max_length
+        with db_transaction.atomic():
+            job = ImportJob.objects.create(
+                user=self.user, filename=', '.join(uploaded.name for uploaded in uploads)[:filename_length])
+            for uploaded in uploads:
+                ImportJobFile.objects.create(job=job, file=uploaded, filename=uploaded.name[:filename_length])
+        return job
+
+    def get_status(self, job_id):
+        """
+        Return the progress of one of the user's import jobs as a dict.
+        """
+        job = get_object_or_404(self.queryset, id=job_id)
+        return {
+            'id': job.id,
+            'filename': job.filename,
+            'status': job.status,
+            'rows': job.rows,
+            'created': job.created_count,
+            'skipped': job.skipped_count,
+            'error_count': job.error_count,
+            'errors': job.errors,
+            'message': job.message,
+            'files': [{'filename': file.filename, 'rows': file.rows} for file in job.files.all()],
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'heartbeat_at': job.heartbeat_at,
+        }
+
+    @staticmethod
+    def default_worker_name():
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    @classmethod
+    def claim_next(cls, worker=None, lease=None):
+        """
+        Atomically claim the oldest queued job, or a running job whose worker has not
+        reported progress for `lease` seconds (settings.IMPORT_JOB_LEASE): its worker
+        is assumed dead and the import starts over; rows it already wrote are skipped
+        by their fingerprints.
+        Rows locked by other workers are skipped (SELECT ... FOR UPDATE SKIP LOCKED),
+        so several workers can drain the queue in parallel without a broker.
+        Returns the claimed ImportJob or None when the queue is empty.
+        """
+        now = timezone.now()
+        expired = now - timedelta(seconds=settings.IMPORT_JOB_LEASE if lease is None else lease)
+        with db_transaction.atomic():
+            job = (
+                ImportJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status='QUEUED')
+                    | Q(status='RUNNING', heartbeat_at__lt=expired)
+                    # claimed before heartbeats were recorded
+                    | Q(status='RUNNING', heartbeat_at__isnull=True, started_at__lt=expired)
+                )
+                .order_by('created_at', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            if job.status == 'RUNNING':
+                last_seen = job.heartbeat_at or job.started_at
+                job.message = f"Reclaimed from {job.worker} (no progress since {last_seen:%Y-%m-%d %H:%M:%S})"
+            job.status = 'RUNNING'
+            job.worker = worker or cls.default_worker_name()
+            job.started_at = job.heartbeat_at = now
+            job.save(update_fields=['status', 'worker', 'started_at', 'heartbeat_at', 'message'])
+        return job
+
+    @staticmethod
+    def _source(field):
+        # parse workers open local files by path; other storages are read into memory
+        try:
+            return field.path
+        except NotImplementedError:
+            with field.open('rb') as file:
+                return file.read()
+
+    @staticmethod
+    def renew(job, **fields):
+        """
+        Renew the lease of a job this worker holds and store `fields` on it.
+        Raises LeaseLost when another worker reclaimed the job.
+        """
+        if not ImportJob.objects.filter(id=job.id, worker=job.worker).update(heartbeat_at=timezone.now(), **fields):
+            raise LeaseLost(f"Import job {job.id} was reclaimed by another worker")
+
+    @classmethod
+    def run(cls, job, batch_size=None):
+        """
+        Import the file(s) of a claimed job chunk by chunk, recording progress after every chunk.
+        Jobs with several files go through InvoiceImporter.run_files.
+        Every write is conditioned on the job still belonging to this worker: when
+        its lease expired and another worker reclaimed the job, the import stops
+        and the job is returned as the other worker left it.
+        """
+        def progress(report):
+            cls.renew(
+                job,
+                rows=report['rows'],
+                created_count=report['created'],
+                skipped_count=report['skipped'],
+                error_count=report['error_count'],
+                errors=report['errors'],
+            )
+
+        try:
+            importer = InvoiceImporter(job.user, batch_size=batch_size, progress=progress,
+                                       heartbeat=lambda: cls.renew(job))
+            if job.file:
+                with job.file.open('rb') as file:
+                    report = importer.run(file, job.filename)
+            else:
+                files = list(job.files.all())
+                report = importer.run_files([(file.filename, cls._source(file.file)) for file in files])
+                for file, parsed in zip(files, report['files']):
+                    file.rows = parsed['rows']
+                ImportJobFile.objects.bulk_update(files, ['rows'])
+        except LeaseLost:
+            job.refresh_from_db()
+            return job
+        except Exception as e:
+            job.status = 'FAILED'
+            job.message = str(e)
+        else:
+            job.status = 'DONE'
+            job.rows = report['rows']
+            job.created_count = report['created']
+            job.skipped_count = report['skipped']
+            job.error_count = report['error_count']
+            job.errors = report['errors']
+        job.finished_at = timezone.now()
+        fields = ['status', 'message', 'rows', 'created_count', 'skipped_count', 'error_count', 'errors', 'finished_at']
+        try:
+            cls.renew(job, **{field: getattr(job, field) for field in fields})
+        except LeaseLost:
+            job.refresh_from_db()
+        return job
+
+    @classmethod
+    def run_next(cls, worker=None, batch_size=None):
+        """
+        Claim and run the next queued job. Returns the job, or None if the queue is empty.
+        """
+        job = cls.claim_next(worker)
+        if job is not None:
+            cls.run(job, batch_size=batch_size)
+        return job
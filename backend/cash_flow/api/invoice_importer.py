@@ -0,0 +1,275 @@
+import csv
+import io
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+
+import django
+from django.conf import settings
+from openpyxl import load_workbook
+
+from cash_flow.api.transaction_manager import TransactionManager
+from ..helpers import norm_str, to_date, to_decimal
+from ..models import Transaction
+
+TRANSACTION_FIELDS = {field.name for field in Transaction._meta.fields} - {'id'}
+
+
+def _init_parse_worker():
+    # spawned workers start without Django; parse workers never touch the database
+    if not django.apps.apps.ready:
+        django.setup()
+
+
+def _row_key(data):
+    """
+    Key telling apart the purchases of a statement: the same purchase exported in
+    two overlapping files has the same key. None when the row cannot be keyed
+    (it is imported as is and validation reports the error).
+    """
+    try:
+        day = to_date(data.get('date'))
+        amount = to_decimal(data.get('amount'))
+    except ValueError:
+        return None
+    if day is None or amount is None:
+        return None
+    return (
+        day,
+        abs(amount),
+        norm_str(str(data.get('description') or ''), remove_punctuation=True),
+        norm_str(str(data.get('credit_card') or '')),
+    )
+
+
+def _parse_file(index, filename, source):
+    """
+    Read every row of one statement. Runs in the parse workers.
+    Parameters:
+    - index: position of the file in the upload, used to order the merged rows.
+    - filename: original name of the file, which selects the CSV or XLSX reader.
+    - source: path of the file or its content as bytes.
+    Returns a list of (sort key, dedupe key, row number, row) tuples.
+    """
+    file = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    with file:
+        parsed = []
+        for row_number, data in enumerate(InvoiceImporter.read_rows(file, filename), start=2):
+            key = _row_key(data)
+            parsed.append(((key[0] if key else date.max, index, row_number), key, row_number, data))
+    return parsed
+
+
+class InvoiceImporter:
+    """
+    Stream a credit card statement (XLSX or CSV) into the ledger in bounded chunks.
+    """
+    mapping_dict = {
+        'data': 'date',
+        'descricao': 'description',
+        'valor': 'amount',
+        'categoria': 'category',
+        'cartao': 'credit_card',
+    }
+    max_reported_errors = 100
+    # statements parsed in the calling process; a pool is not worth its start-up below this
+    min_parallel_files = 2
+    # seconds between heartbeats while statements are parsed
+    heartbeat_interval = 30
+
+    def __init__(self, user, batch_size=None, progress=None, heartbeat=None):
+        """
+        Parameters:
+        - user: owner of the imported transactions.
+        - batch_size: rows per chunk, defaults to settings.IMPORT_BATCH_SIZE.
+        - progress: optional callable receiving the running report after each chunk.
+        - heartbeat: optional callable run after each parsed file and every
+          `heartbeat_interval` seconds while files are parsed, before any chunk is written.
+        """
+        self.user = user
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.progress = progress
+        self.heartbeat = heartbeat or (lambda: None)
+        self.parse_workers = max(settings.IMPORT_PARSE_WORKERS, 1)
+        self.transaction_manager = TransactionManager(user)
+
+    @classmethod
+    def normalize_headers(cls, header_row):
+        """
+        Map the raw header cells to Transaction field names.
+        """
+        headers = []
+        for i, h in enumerate(header_row):
+            if h is None:
+                headers.append(f'col_{i}')
+            else:
+                headers.append(cls.mapping_dict.get(norm_str(str(h)), norm_str(str(h))))
+        return headers
+
+    @classmethod
+    def read_rows(cls, file, filename):
+        """
+        Yield one dict per data row of `file`, keyed by the normalized headers.
+        Blank rows are skipped. The file is never fully loaded into memory.
+        """
+        extension = os.path.splitext(filename or '')[1].lower()
+        values = cls._iter_csv(file) if extension == '.csv' else cls._iter_xlsx(file)
+        headers = None
+        for row in values:
+            if headers is None:
+                headers = cls.normalize_headers(row)
+                continue
+            if all(cell is None or cell == '' for cell in row):
+                continue
+            yield {headers[i]: (row[i] if i < len(row) and row[i] is not None else '') for i in range(len(headers))}
+
+    @staticmethod
+    def _iter_xlsx(file):
+        wb = load_workbook(filename=file, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _iter_csv(file):
+        text = io.TextIOWrapper(getattr(file, 'file', file), encoding='utf-8-sig', newline='')
+        try:
+            sample = text.read(4096)
+            text.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+            except csv.Error:
+                dialect = csv.excel
+            yield from csv.reader(text, dialect)
+        finally:
+            text.detach()
+
+    @staticmethod
+    def prepare_row(data):
+        """
+        Turn a statement row into Transaction data: unknown columns are dropped and
+        card purchases are always outflows.
+        """
+        data = {key: value for key, value in data.items() if key in TRANSACTION_FIELDS}
+        data['type'] = 'CREDITCARD'
+        amount = to_decimal(data.get('amount'))
+        data['amount'] = -abs(amount) if amount is not None else None
+        return data
+
+    def run(self, file, filename=None):
+        """
+        Import every row of `file`.
+        Returns a report dict:
+        {'rows': 1000, 'created': 980, 'skipped': 10, 'chunks': 2, 'error_count': 10, 'errors': [{'row': 7, 'error': '...'}]}
+        Rows already imported from an earlier upload are counted as skipped.
+        Only the first `max_reported_errors` messages are kept.
+        """
+        report = {'rows': 0, 'created': 0, 'skipped': 0, 'chunks': 0, 'error_count': 0, 'errors': []}
+        chunks = self.transaction_manager.iter_create_transactions(
+            self.read_rows(file, filename or getattr(file, 'name', '')),
+            batch_size=self.batch_size,
+            first_row=2,
+            prepare=self.prepare_row,
+            fingerprint=True,
+        )
+        for chunk in chunks:
+            report['chunks'] = chunk['chunk']
+            report['rows'] += chunk['rows']
+            report['created'] += len(chunk['created'])
+            report['skipped'] += chunk['skipped']
+            report['error_count'] += len(chunk['errors'])
+            free = self.max_reported_errors - len(report['errors'])
+            report['errors'].extend({'row': row, 'error': error} for row, error in chunk['errors'][:max(free, 0)])
+            if self.progress is not None:
+                self.progress(report)
+        return report
+
+    def parse_files(self, files):
+        """
+        Parse several statements, in parallel processes when there is more than one.
+        Parameters:
+        - files: list of (filename, source) pairs, source being a path or the file content as bytes.
+        Returns one list of parsed rows per file (see _parse_file), in the order of `files`.
+        """
+        arguments = [(index, filename, source) for index, (filename, source) in enumerate(files)]
+        workers = min(len(files), self.parse_workers)
+        if len(files) < self.min_parallel_files or workers == 1:
+            parsed = []
+            for args in arguments:
+                parsed.append(_parse_file(*args))
+                self.heartbeat()
+            return parsed
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_parse_worker) as pool:
+            futures = [pool.submit(_parse_file, *args) for args in arguments]
+            pending = futures
+            while pending:
+                pending = wait(pending, timeout=self.heartbeat_interval, return_when=FIRST_COMPLETED).not_done
+                self.heartbeat()
+            return [future.result() for future in futures]
+
+    def run_files(self, files):
+        """
+        Import several statements as one ledger write.
+        The files are parsed in parallel (see parse_files), then their rows are merged
+        by date, file and row number and written in chunks like a single statement.
+        A purchase present in more than one file (overlapping exports) is written
+        once: for every (date, amount, description, card) the merged batch keeps as
+        many rows as the file holding the most of them.
+        Parameters:
+        - files: list of (filename, source) pairs, source being a path or the file content as bytes.
+        Returns the report of `run` with per-file row counts and the number of
+        cross-file duplicates (counted as skipped); errors name their file:
+        {'rows': 1500, 'created': 1180, 'skipped': 310, 'duplicates': 300, 'chunks': 3, 'error_count': 10,
+         'files': [{'filename': 'jan.xlsx', 'rows': 1000}, {'filename': 'fev.csv', 'rows': 500}],
+         'errors': [{'file': 'fev.csv', 'row': 7, 'error': '...'}]}
+        """
+        parsed = self.parse_files(files)
+        report = {
+            'rows': 0, 'created': 0, 'skipped': 0, 'duplicates': 0, 'chunks': 0, 'error_count': 0,
+            'files': [{'filename': filename, 'rows': len(rows)} for (filename, _), rows in zip(files, parsed)],
+            'errors': [],
+        }
+        kept = Counter()
+        for rows in parsed:
+            for key, count in Counter(key for _, key, _, _ in rows if key is not None).items():
+                kept[key] = max(kept[key], count)
+
+        merged = sorted((row for rows in parsed for row in rows), key=lambda row: row[0])
+        del parsed
+        origins, batch = [], []
+        for (_, index, row_number), key, _, data in merged:
+            if key is not None:
+                if not kept[key]:
+                    report['duplicates'] += 1
+                    continue
+                kept[key] -= 1
+            origins.append((files[index][0], row_number))
+            batch.append(data)
+        del merged
+        report['rows'] = report['skipped'] = report['duplicates']
+
+        chunks = self.transaction_manager.iter_create_transactions(
+            batch,
+            batch_size=self.batch_size,
+            first_row=0,
+            prepare=self.prepare_row,
+            fingerprint=True,
+        )
+        for chunk in chunks:
+            report['chunks'] = chunk['chunk']
+            report['rows'] += chunk['rows']
+            report['created'] += len(chunk['created'])
+            report['skipped'] += chunk['skipped']
+            report['error_count'] += len(chunk['errors'])
+            free = self.max_reported_errors - len(report['errors'])
+            report['errors'].extend(
+                {'file': origins[position][0], 'row': origins[position][1], 'error': error}
+                for position, error in chunk['errors'][:max(free, 0)]
+            )
+            if self.progress is not None:
+                self.progress(report)
+        return report
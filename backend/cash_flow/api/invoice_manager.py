@@ -0,0 +1,180 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Sum
+
+from .. import cache
+from ..helpers import add_months, invoice_dates, month_start
+from ..models import CreditCard, CreditCardInvoice, Transaction, User
+
+
+class InvoiceManager:
+    """
+    Assign card transactions to their CreditCardInvoice and keep each invoice's
+    total_amount (the amount owed: purchases minus refunds) current.
+    """
+    queryset = CreditCardInvoice.objects.all()
+
+    def __init__(self, user=None):
+        self.user = user
+        self.queryset = self.queryset.filter(credit_card__bank_account__user=user) if user else self.queryset
+
+    @staticmethod
+    def counts(tx):
+        """
+        Whether a transaction adds to its invoice total; cancelled purchases do not.
+        """
+        return tx.status != 'CANCELLED'
+
+    @classmethod
+    def assign_invoices(cls, transactions):
+        """
+        Set `invoice_id` on every card transaction that has none, from the card's
+        closing_day and due_day.
+        Missing invoices are created with one bulk insert; cards and invoices are
+        read with one query each, whatever the number of transactions.
+        Returns the transactions that were assigned.
+        """
+        pending = [tx for tx in transactions if tx.credit_card_id and not tx.invoice_id]
+        if not pending:
+            return []
+        cards = {
+            card_id: (closing_day, due_day)
+            for card_id, closing_day, due_day in CreditCard.objects.filter(
+                id__in={tx.credit_card_id for tx in pending}
+            ).values_list('id', 'closing_day', 'due_day')
+        }
+        keys, closing_dates = [], {}
+        for tx in pending:
+            closing_date, due_date = invoice_dates(tx.date, *cards[tx.credit_card_id])
+            keys.append((tx.credit_card_id, due_date))
+            closing_dates[keys[-1]] = closing_date
+
+        existing = cls.fetch_invoices(closing_dates.keys())
+        missing = closing_dates.keys() - existing.keys()
+        if missing:
+            CreditCardInvoice.objects.bulk_create(
+                [CreditCardInvoice(credit_card_id=card_id, due_date=due_date,
+                                   closing_date=closing_dates[(card_id, due_date)])
+                 for card_id, due_date in missing],
+                ignore_conflicts=True,
+            )
+            # ignore_conflicts does not return primary keys on every backend
+            existing.update(cls.fetch_invoices(missing))
+        for tx, key in zip(pending, keys):
+            tx.invoice_id = existing[key]
+        return pending
+
+    @staticmethod
+    def fetch_invoices(keys):
+        """
+        Map (credit_card_id, due_date) keys to invoice ids with one query.
+        """
+        keys = set(keys)
+        rows = CreditCardInvoice.objects.filter(
+            credit_card_id__in={card_id for card_id, _ in keys},
+            due_date__in={due_date for _, due_date in keys},
+        ).values_list('credit_card_id', 'due_date', 'id')
+        return {(card_id, due_date): invoice_id for card_id, due_date, invoice_id in rows
+                if (card_id, due_date) in keys}
+
+    @classmethod
+    def collect_deltas(cls, transactions, sign=1):
+        """
+        Group transactions into invoice total deltas.
+        Parameters:
+        - transactions: iterable of Transaction instances (only invoice_id, status and amount are read).
+        - sign: 1 when the transactions are being added, -1 when removed.
+        Returns a dict {invoice_id: amount owed}.
+        """
+        deltas = defaultdict(lambda: Decimal('0'))
+        for tx in transactions:
+            if tx.invoice_id and cls.counts(tx):
+                # card purchases are negative amounts; the invoice total is what is owed
+                deltas[tx.invoice_id] -= sign * Decimal(tx.amount)
+        return deltas
+
+    @staticmethod
+    def merge_deltas(*deltas):
+        merged = defaultdict(lambda: Decimal('0'))
+        for delta in deltas:
+            for invoice_id, amount in delta.items():
+                merged[invoice_id] += amount
+        return merged
+
+    @staticmethod
+    def apply_deltas(deltas):
+        """
+        Increment each touched invoice with an F() expression.
+        Must be called inside the same atomic block that changed the ledger.
+        """
+        for invoice_id, amount in deltas.items():
+            if amount:
+                CreditCardInvoice.objects.filter(id=invoice_id).update(total_amount=F('total_amount') + amount)
+
+    @classmethod
+    def add_transactions(cls, transactions):
+        cls.apply_deltas(cls.collect_deltas(transactions, sign=1))
+
+    @classmethod
+    def remove_transactions(cls, transactions):
+        cls.apply_deltas(cls.collect_deltas(transactions, sign=-1))
+
+    def list_invoices(self, credit_card=None, month=None, limit=None):
+        """
+        Invoices of the user's cards, latest due date first, with their precomputed totals.
+        Parameters:
+        - credit_card: card id or part of the card name.
+        - month: any date; only invoices due in that month are returned.
+        - limit: maximum number of invoices.
+        """
+        queryset = self.queryset.select_related('credit_card').order_by('-due_date', 'credit_card__name')
+        if credit_card:
+            credit_card = str(credit_card).strip()
+            if credit_card.isdigit():
+                queryset = queryset.filter(credit_card_id=int(credit_card))
+            else:
+                queryset = queryset.filter(credit_card__name__icontains=credit_card)
+        if month:
+            first_day = month_start(month)
+            queryset = queryset.filter(due_date__gte=first_day, due_date__lt=add_months(first_day, 1))
+        return queryset[:limit] if limit else queryset
+
+    def rebuild(self, batch_size=1000):
+        """
+        Reassign every card transaction to its invoice and recompute all totals from the ledger,
+        invalidating the users' cached ledger views on commit.
+        Returns (transactions assigned, invoices updated).
+        """
+        transactions = Transaction.objects.filter(credit_card__isnull=False)
+        if self.user:
+            transactions = transactions.filter(credit_card__bank_account__user=self.user)
+        assigned = 0
+        with db_transaction.atomic():
+            last_id = 0
+            while True:
+                batch = list(transactions.filter(id__gt=last_id).order_by('id')
+                             .only('id', 'credit_card_id', 'date', 'invoice_id')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+                for tx in batch:
+                    tx.invoice_id = None
+                assigned += len(self.assign_invoices(batch))
+                Transaction.objects.bulk_update(batch, fields=['invoice'])
+
+            totals = dict(
+                transactions.exclude(status='CANCELLED').filter(invoice__isnull=False)
+                .values('invoice_id').annotate(total=Sum('amount')).order_by()
+                .values_list('invoice_id', 'total')
+            )
+            invoices = list(self.queryset.only('id', 'total_amount'))
+            for invoice in invoices:
+                invoice.total_amount = -totals.get(invoice.id, Decimal('0'))
+            CreditCardInvoice.objects.bulk_update(invoices, fields=['total_amount'], batch_size=batch_size)
+            # the dashboard and forecasts read the invoice totals
+            user_ids = [self.user.pk] if self.user else User.objects.values_list('id', flat=True)
+            for user_id in user_ids:
+                cache.bump_version_on_commit('ledger', user_id)
+        return assigned, len(invoices)
@@ -0,0 +1,106 @@
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from cash_flow.api.transaction_manager import TransactionManager
+from .. import schedule
+from ..helpers import transaction_fingerprint
+from ..models import RecurringTransaction, Transaction
+
+
+class RecurrenceManager:
+    queryset = RecurringTransaction.objects.all()
+
+    def __init__(self, user=None):
+        self.user = user
+        self.queryset = self.queryset.filter(bank_account__user=user) if user else self.queryset
+
+    def expand(self, start, end, rules=None):
+        """
+        Expand recurring rules into their occurrences inside [start, end] in one pass.
+        Parameters:
+        - start, end: window (inclusive).
+        - rules: optional iterable of RecurringTransaction; defaults to the user's rules.
+        Returns a date-ordered list of (rule, date) pairs.
+        """
+        if rules is None:
+            rules = self.queryset.select_related('bank_account').filter(date__lte=end).exclude(end_date__lt=start)
+        return schedule.expand(rules, start, end)
+
+    @staticmethod
+    def occurrence_fingerprint(rule, occurrence_date):
+        """
+        Fingerprint of the transaction generated by `rule` on `occurrence_date`, so the
+        same occurrence is never written twice.
+        """
+        user_id = rule.bank_account.user_id if rule.bank_account_id else None
+        return transaction_fingerprint(user_id, occurrence_date, rule.amount, rule.description, f"rt{rule.id}")
+
+    def build_transactions(self, occurrences, status='PLANNED'):
+        """
+        Build (unsaved) Transaction instances for (rule, date) pairs.
+        """
+        return [
+            Transaction(
+                bank_account_id=rule.bank_account_id,
+                category_id=rule.category_id,
+                description=rule.description,
+                type=rule.type,
+                amount=rule.amount,
+                date=occurrence_date,
+                status=status,
+                fingerprint=self.occurrence_fingerprint(rule, occurrence_date),
+            )
+            for rule, occurrence_date in occurrences
+        ]
+
+    def generate_transactions(self, start, end, rules=None, status='PLANNED', batch_size=None):
+        """
+        Write the planned transactions of every occurrence inside [start, end] with a
+        single bulk insert. Occurrences generated before are skipped by fingerprint,
+        so projecting the same window again is a no-op.
+        Returns the list of transactions created.
+        """
+        transactions = self.build_transactions(self.expand(start, end, rules), status=status)
+        if not transactions:
+            return []
+        return TransactionManager.bulk_create_transactions(
+            transactions, batch_size=batch_size or settings.IMPORT_BATCH_SIZE)
+
+    def materialize_due(self, today=None, batch_size=None):
+        """
+        Write the transactions of every occurrence that became due up to `today` and
+        advance next_occurrence, catching up any missed days.
+        Rules are claimed in batches through the indexed next_occurrence <= today
+        predicate with SELECT ... FOR UPDATE SKIP LOCKED, so several nodes can run
+        this concurrently; each batch is expanded, inserted with one bulk_create and
+        advanced with one bulk_update inside a single atomic block.
+        Returns (rules_processed, transactions_created).
+        """
+        today = today or date.today()
+        batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        rules_processed = transactions_created = 0
+        while True:
+            with db_transaction.atomic():
+                rules = list(
+                    self.queryset
+                    .select_for_update(skip_locked=True, of=('self',))
+                    .select_related('bank_account')
+                    .filter(next_occurrence__lte=today)
+                    .order_by('next_occurrence', 'id')[:batch_size]
+                )
+                if not rules:
+                    break
+                occurrences = []
+                for rule in rules:
+                    occurrences.extend((rule, d) for d in schedule.occurrences(
+                        rule.date, rule.frequency, rule.interval, rule.next_occurrence, today, until=rule.end_date))
+                    rule.next_occurrence = schedule.next_occurrence(
+                        rule.date, rule.frequency, rule.interval, today, until=rule.end_date)
+                transactions = self.build_transactions(occurrences)
+                if transactions:
+                    transactions_created += len(TransactionManager.bulk_create_transactions(transactions))
+                RecurringTransaction.objects.bulk_update(rules, ['next_occurrence'])
+                rules_processed += len(rules)
+        return rules_processed, transactions_created
@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .. import cache
+from ..helpers import search_tokens
+
+# Must stay identical to the expression of the tx_search_document_idx GIN index (migration 0016).
+TSVECTOR = "to_tsvector('simple'::regconfig, search_document)"
+
+
+class SearchManager:
+    """
+    Full-text search over a user's transactions.
+
+    A transaction matches when every word of the query is the prefix of a word of its
+    description, or of the name of its category, account or card; case and accents
+    are ignored (see helpers.search_tokens). Descriptions are matched through the
+    tsvector GIN index on PostgreSQL and through an in-memory inverted index on other
+    databases. Names live in small tables and are matched in Python against the
+    lookup caches.
+    """
+
+    def __init__(self, user, queryset, account_manager, category_manager):
+        """
+        Parameters:
+        - user: owner of the transactions.
+        - queryset: the user's transactions (TransactionManager.queryset).
+        - account_manager, category_manager: the caller's managers, reused for their name maps.
+        """
+        self.user = user
+        self.queryset = queryset
+        self.account_manager = account_manager
+        self.category_manager = category_manager
+
+    @staticmethod
+    def document(description):
+        """
+        Normalized text stored in Transaction.search_document.
+        """
+        return ' '.join(search_tokens(description))
+
+    @staticmethod
+    def tsquery(tokens):
+        # tokens only hold [a-z0-9_], so they are safe inside a raw tsquery
+        return ' & '.join(f"{token}:*" for token in tokens)
+
+    @staticmethod
+    def words_match(words, tokens):
+        return all(any(word.startswith(token) for word in words) for token in tokens)
+
+    @property
+    def use_tsvector(self):
+        return connection.vendor == 'postgresql'
+
+    def reference_filter(self, tokens):
+        """
+        Q matching transactions whose category, account or card name contains every token.
+        """
+        category_ids = [category.id for category in self.category_manager.category_by_name.values()
+                        if self.words_match(search_tokens(category.name), tokens)]
+        account_ids = [account_id for account_id, name in self.account_manager.queryset.values_list('id', 'name')
+                       if self.words_match(search_tokens(name), tokens)]
+        card_ids = [card.id for card in self.account_manager.credit_cards.values()
+                    if self.words_match(search_tokens(card.name), tokens)]
+        q = Q(pk__in=[])
+        if category_ids:
+            q |= Q(category_id__in=category_ids)
+        if account_ids:
+            q |= Q(bank_account_id__in=account_ids)
+        if card_ids:
+            q |= Q(credit_card_id__in=card_ids)
+        return q
+
+    def build_index(self):
+        """
+        Inverted index of the user's descriptions: (sorted words, {word: [transaction ids]}).
+        """
+        postings = defaultdict(list)
+        for tx_id, document in self.queryset.order_by().values_list('id', 'search_document').iterator(chunk_size=5000):
+            for word in set(document.split()):
+                postings[word].append(tx_id)
+        return sorted(postings), dict(postings)
+
+    def index(self):
+        """
+        The user's inverted index, kept in this process only and rebuilt when the
+        'search' version moves (see documents_changed), not on every ledger write.
+        Deleted transactions may linger in its postings; callers filter the ids
+        through the user's queryset, which drops them.
+        """
+        return cache.get_or_build('search', self.user.pk, self.build_index, shared=False)
+
+    @staticmethod
+    def documents_changed(user_ids):
+        """
+        Invalidate the inverted indexes of these users once the current database
+        transaction commits; called when transactions are added or their search
+        documents change.
+        """
+        for user_id in set(user_ids):
+            db_transaction.on_commit(lambda user_id=user_id: cache.bump_version('search', user_id))
+
+    def index_matches(self, tokens):
+        """
+        Ids of the transactions whose description has a word starting with each token.
+        """
+        words, postings = self.index()
+        matches = None
+        for token in tokens:
+            ids = set()
+            for i in range(bisect_left(words, token), len(words)):
+                if not words[i].startswith(token):
+                    break
+                ids.update(postings[words[i]])
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return set()
+        return matches
+
+    def description_filter(self, tokens):
+        if self.use_tsvector:
+            return Q(RawSQL(f"{TSVECTOR} @@ to_tsquery('simple', %s)", [self.tsquery(tokens)],
+                            output_field=BooleanField()))
+        return Q(pk__in=sorted(self.index_matches(tokens)))
+
+    def filter(self, queryset, search):
+        """
+        Restrict `queryset` to the transactions matching `search`.
+        """
+        tokens = search_tokens(search)
+        if not tokens:
+            return queryset
+        return queryset.filter(self.description_filter(tokens) | self.reference_filter(tokens))
+
+    def search(self, query, limit=20):
+        """
+        Ranked search: description matches first (by ts_rank on PostgreSQL, by the number
+        of whole-word hits elsewhere), then name matches, newest first within a rank.
+        Returns a list of Transaction instances.
+        """
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        queryset = self.filter(self.queryset, query).select_related('category', 'bank_account', 'credit_card')
+        if self.use_tsvector:
+            rank = RawSQL(f"ts_rank({TSVECTOR}, to_tsquery('simple', %s))", [self.tsquery(tokens)],
+                          output_field=FloatField())
+            return list(queryset.annotate(rank=rank).order_by('-rank', '-date', '-id')[:limit])
+
+        def score(row):
+            tx_id, document, date = row
+            words = document.split()
+            return (self.words_match(words, tokens), sum(token in words for token in tokens), date, tx_id)
+
+        rows = sorted(queryset.values_list('id', 'search_document', 'date'), key=score, reverse=True)[:limit]
+        by_id = queryset.in_bulk([tx_id for tx_id, _, _ in rows])
+        return [by_id[tx_id] for tx_id, _, _ in rows]
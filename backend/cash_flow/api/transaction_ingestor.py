@@ -0,0 +1,184 @@
+import json
+
+from django.conf import settings
+
+from cash_flow.api.transaction_manager import TransactionManager
+from ..models import Transaction
+
+# Fields a client may send; invoices, fingerprints and search documents are computed here.
+INGEST_FIELDS = {field.name for field in Transaction._meta.fields} - {'id', 'invoice', 'fingerprint', 'search_document'}
+
+
+class TransactionIngestor:
+    """
+    Stream a JSON body of transactions (NDJSON or a JSON array) into the ledger in
+    bounded chunks. The body is decoded one object at a time, so only the current
+    chunk is ever held in memory.
+    """
+    read_size = 64 * 1024
+    max_batch_size = 5000
+
+    def __init__(self, user, batch_size=None, fingerprint=True):
+        """
+        Parameters:
+        - user: owner of the ingested transactions.
+        - batch_size: rows per chunk, defaults to settings.IMPORT_BATCH_SIZE.
+        - fingerprint: skip rows already stored (same date, amount, description and account).
+        """
+        self.user = user
+        self.batch_size = min(batch_size or settings.IMPORT_BATCH_SIZE, self.max_batch_size)
+        self.fingerprint = fingerprint
+        self.transaction_manager = TransactionManager(user)
+
+    def read_rows(self, stream, content_type=''):
+        """
+        Yield one decoded value per row of `stream`.
+        A JSON array is expected when the content type is application/json or the
+        body starts with '['; anything else is read as NDJSON (one object per line).
+        Undecodable NDJSON lines are yielded as ValueError instances so they are
+        reported against their own row; a malformed array stops the stream.
+        """
+        head = self._skip_whitespace(stream)
+        if head[:1] == b'[' or (content_type.split(';')[0].strip() == 'application/json' and head):
+            yield from self._iter_array(stream, head)
+        else:
+            yield from self._iter_ndjson(stream, head)
+
+    def _skip_whitespace(self, stream):
+        while True:
+            head = stream.read(self.read_size)
+            if not head:
+                return b''
+            head = head.lstrip()
+            if head:
+                return head
+
+    def _iter_ndjson(self, stream, head):
+        pending = head
+        while True:
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                yield from self._decode_line(line)
+            block = stream.read(self.read_size)
+            if not block:
+                break
+            pending += block
+        yield from self._decode_line(pending)
+
+    @staticmethod
+    def _decode_line(line):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+    def _iter_array(self, stream, head):
+        if head[:1] != b'[':
+            raise ValueError("Expected a JSON array")
+        decoder = json.JSONDecoder()
+        # Rows are decoded from a text buffer; a multi-byte character split across
+        # reads is kept as bytes until the next read completes it.
+        text, raw = '', head[1:]
+        expect_value, empty, finished = True, True, False
+        while not finished:
+            block = stream.read(self.read_size)
+            raw += block
+            try:
+                text += raw.decode('utf-8')
+                raw = b''
+            except UnicodeDecodeError as e:
+                if not block or e.start < len(raw) - 3:
+                    raise ValueError("Body is not valid UTF-8")
+                text += raw[:e.start].decode('utf-8')
+                raw = raw[e.start:]
+            position = 0
+            while True:
+                while position < len(text) and text[position].isspace():
+                    position += 1
+                if position == len(text):
+                    break
+                if text[position] == ']' and (not expect_value or empty):
+                    finished = True
+                    break
+                if not expect_value:
+                    if text[position] != ',':
+                        raise ValueError(f"Expected ',' or ']' in the JSON array, got {text[position]!r}")
+                    position += 1
+                    expect_value = True
+                    continue
+                try:
+                    value, end = decoder.raw_decode(text, position)
+                except ValueError:
+                    if not block:
+                        raise ValueError("Truncated or invalid JSON array")
+                    # the value continues in the next read
+                    break
+                if end == len(text) and block and not isinstance(value, (dict, list, str)):
+                    # a bare number may continue in the next read
+                    break
+                yield value
+                position, expect_value, empty = end, False, False
+            text = text[position:]
+            if not block and not finished:
+                raise ValueError("Truncated JSON array")
+
+    @staticmethod
+    def prepare_row(data):
+        """
+        Check that a decoded row is an object of Transaction fields.
+        """
+        if isinstance(data, ValueError):
+            raise data
+        if not isinstance(data, dict):
+            raise ValueError("Each row must be a JSON object")
+        unknown = data.keys() - INGEST_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return dict(data)
+
+    def run(self, stream, content_type=''):
+        """
+        Ingest every row of `stream`; each chunk is committed on its own.
+        Returns a report dict:
+        {'rows': 3, 'created': 1, 'skipped': 1, 'chunks': 1, 'error_count': 1,
+         'results': [{'row': 1, 'status': 'created', 'id': 10},
+                     {'row': 2, 'status': 'skipped'},
+                     {'row': 3, 'status': 'error', 'error': 'Missing required field: date'}]}
+        A body that cannot be decoded past some row ends the report with an error
+        for the next row number; the rows before it are kept.
+        """
+        report = {'rows': 0, 'created': 0, 'skipped': 0, 'chunks': 0, 'error_count': 0, 'results': []}
+        rows = self.read_rows(stream, content_type)
+        chunks = self.transaction_manager.iter_create_transactions(
+            self._guard(rows, report),
+            batch_size=self.batch_size,
+            prepare=self.prepare_row,
+            fingerprint=self.fingerprint,
+        )
+        for chunk in chunks:
+            report['chunks'] = chunk['chunk']
+            report['rows'] += chunk['rows']
+            report['created'] += len(chunk['created'])
+            report['skipped'] += chunk['skipped']
+            report['error_count'] += len(chunk['errors'])
+            results = [
+                {'row': row, 'status': 'created', 'id': tx.pk} if tx.pk else {'row': row, 'status': 'skipped'}
+                for row, tx in chunk['transactions']
+            ]
+            results.extend({'row': row, 'status': 'error', 'error': error} for row, error in chunk['errors'])
+            report['results'].extend(sorted(results, key=lambda result: result['row']))
+        if report.get('stream_error'):
+            report['error_count'] += 1
+            report['results'].append({'row': report['rows'] + 1, 'status': 'error', 'error': report.pop('stream_error')})
+        return report
+
+    @staticmethod
+    def _guard(rows, report):
+        # A decoding error ends the input without discarding the chunk being built.
+        try:
+            yield from rows
+        except ValueError as e:
+            report['stream_error'] = str(e)
@@ -1,17 +1,47 @@
+import hashlib
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction as db_transaction
+from django.db.models import CharField, Model, Q
 from django.shortcuts import get_object_or_404
 
 from cash_flow.api.category_manager import CategoryManager
 from cash_flow.api.bank_account_manager import AccountManager
-from ..models import Transaction, RecurringTransaction
+from cash_flow.api.balance_snapshot_manager import BalanceSnapshotManager
+from cash_flow.api.invoice_manager import InvoiceManager
+from cash_flow.api.category_rollup_manager import CategoryRollupManager
+from cash_flow.api.search_manager import SearchManager
+from .. import cache
+from ..helpers import CENTS, batched, decode_cursor, encode_cursor, month_start, to_date, to_decimal, transaction_fingerprint
+from ..models import BankAccount, Category, CreditCardInvoice, Transaction, RecurringTransaction
+
+# Fields a RecurringTransaction is built from; next_occurrence is seeded from the date
+RECURRING_FIELDS = {field.name for field in RecurringTransaction._meta.fields} - {'id', 'next_occurrence'}
+# Text columns whose max_length is checked per row (see TransactionManager.validate_values)
+TEXT_FIELDS = {field.name: field for field in Transaction._meta.fields if isinstance(field, CharField)}
+
 
 class TransactionManager:
     queryset = Transaction.objects.all()
+    # Columns read back from deleted rows: everything the snapshots, invoices and rollups are keyed on
+    DELETED_COLUMNS = ['bank_account_id', 'credit_card_id', 'invoice_id', 'category_id', 'type', 'date', 'status', 'amount']
 
     def __init__(self, user):
         self.user = user
         self.queryset = self.queryset.filter(bank_account__user=user)
         self.account_manager = AccountManager(self.user)
         self.category_manager = CategoryManager(self.user)
+        self._search_manager = None
+
+    @property
+    def search_manager(self):
+        if self._search_manager is None:
+            self._search_manager = SearchManager(self.user, self.queryset, self.account_manager, self.category_manager)
+        return self._search_manager
 
     def create_transactions(self, transactions_data):
         """
@@ -42,18 +72,275 @@ class TransactionManager:
         ]
         """
         transactions = []
+        self.resolve_references(transactions_data)
         for data in transactions_data:
             self.pre_create_validation(data)
             # Ensure all required fields are present
             transaction = Transaction(**data)
             transactions.append(transaction)
-        Transaction.objects.bulk_create(transactions)
-        return transactions
+        return self.bulk_create_transactions(transactions)
+
+    @classmethod
+    def bulk_create_transactions(cls, transactions, batch_size=None):
+        """
+        Insert already validated Transaction instances, assign card purchases to
+        their invoices and update the balance snapshots, invoice totals and
+        category rollups in the same atomic block.
+        Transactions carrying a fingerprint that already exists in the ledger (or that
+        repeats within the batch) are skipped, checked with a single IN query.
+        Returns the list of transactions actually inserted.
+        """
+        for tx in transactions:
+            tx.search_document = SearchManager.document(tx.description)
+        for attempt in range(2):
+            fresh = cls.exclude_duplicates(transactions)
+            assigned = []
+            try:
+                with db_transaction.atomic():
+                    assigned = InvoiceManager.assign_invoices(fresh)
+                    Transaction.objects.bulk_create(fresh, batch_size=batch_size)
+                    BalanceSnapshotManager.add_transactions(fresh)
+                    InvoiceManager.add_transactions(fresh)
+                    CategoryRollupManager.add_transactions(fresh)
+                    owners = cls.ledger_owners(fresh)
+                    cls.ledger_changed(owners)
+                    SearchManager.documents_changed(owners)
+                return fresh
+            except IntegrityError:
+                # invoices created in the rolled back block no longer exist
+                for tx in assigned:
+                    tx.invoice_id = None
+                # A concurrent import inserted some of the same fingerprints; filter again.
+                if attempt or not any(tx.fingerprint for tx in fresh):
+                    raise
+
+    @staticmethod
+    def ledger_owners(transactions):
+        """
+        Ids of the users owning the accounts or cards of `transactions`, with one query.
+        """
+        account_ids = {tx.bank_account_id for tx in transactions if tx.bank_account_id}
+        card_ids = {tx.credit_card_id for tx in transactions if tx.credit_card_id}
+        if not account_ids and not card_ids:
+            return set()
+        return set(
+            BankAccount.objects.filter(Q(id__in=account_ids) | Q(credit_cards__id__in=card_ids))
+            .values_list('user_id', flat=True).distinct()
+        )
+
+    @staticmethod
+    def ledger_changed(user_ids):
+        """
+        Invalidate everything cached from the ledger of these users (e.g. forecasts)
+        once the current database transaction commits.
+        """
+        for user_id in set(user_ids):
+            db_transaction.on_commit(lambda user_id=user_id: cache.bump_version('ledger', user_id))
+
+    @staticmethod
+    def exclude_duplicates(transactions):
+        """
+        Drop transactions whose fingerprint is already stored or repeated earlier in the list.
+        """
+        fingerprints = {tx.fingerprint for tx in transactions if tx.fingerprint}
+        if not fingerprints:
+            return list(transactions)
+        seen = set(Transaction.objects.filter(fingerprint__in=fingerprints).values_list('fingerprint', flat=True))
+        fresh = []
+        for tx in transactions:
+            if tx.fingerprint:
+                if tx.fingerprint in seen:
+                    continue
+                seen.add(tx.fingerprint)
+            fresh.append(tx)
+        return fresh
+
+    def fingerprint(self, data, occurrences):
+        """
+        Compute the fingerprint of a validated row.
+        Parameters:
+        - data: row already passed through pre_create_validation.
+        - occurrences: dict shared by all rows of one import, counting identical rows.
+        """
+        credit_card = data.get('credit_card')
+        bank_account = data.get('bank_account')
+        source = f"cc{credit_card.pk}" if credit_card else f"ba{bank_account.pk}" if bank_account else ''
+        base = transaction_fingerprint(self.user.pk, data['date'], data['amount'], data.get('description'), source)
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+        return transaction_fingerprint(self.user.pk, data['date'], data['amount'], data.get('description'), source, occurrence)
+
+    def iter_create_transactions(self, rows, batch_size=None, first_row=1, prepare=None, fingerprint=False):
+        """
+        Validate and create transactions from an iterable of dictionaries in bounded chunks.
+        Rows are consumed lazily, so only one chunk is held in memory at a time.
+        Parameters:
+        - rows: iterable of dictionaries accepted by create_transactions.
+        - batch_size: number of rows per chunk, defaults to settings.IMPORT_BATCH_SIZE.
+        - first_row: number reported for the first row (e.g. 2 for a sheet with a header).
+        - prepare: optional callable applied to each row before validation; errors
+          it raises are reported like validation errors.
+        - fingerprint: fingerprint every row so that rows imported before are skipped.
+        Yields one dict per chunk:
+        {'chunk': 1, 'rows': 500, 'created': [Transaction, ...], 'skipped': 0, 'errors': [(row_number, message), ...],
+         'transactions': [(row_number, Transaction), ...]}
+        Valid rows that were not inserted (duplicates) keep `pk` None in 'transactions'.
+        """
+        batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        chunk_number = 0
+        occurrences = {}
+        for chunk in batched(enumerate(rows, start=first_row), batch_size):
+            chunk_number += 1
+            prepared, transactions, errors, numbered = [], [], [], []
+            for row_number, data in chunk:
+                try:
+                    prepared.append((row_number, prepare(data) if prepare is not None else data))
+                except Exception as e:
+                    errors.append((row_number, str(e)))
+            try:
+                self.resolve_references([data for _, data in prepared])
+            except Exception:
+                # Fall back to per-row resolution so the offending rows get their own error.
+                pass
+            for row_number, data in prepared:
+                try:
+                    self.pre_create_validation(data)
+                    if fingerprint:
+                        data['fingerprint'] = self.fingerprint(data, occurrences)
+                    transactions.append(Transaction(**data))
+                    numbered.append((row_number, transactions[-1]))
+                except Exception as e:
+                    errors.append((row_number, str(e)))
+            errors.sort()
+            created = self.bulk_create_transactions(transactions) if transactions else []
+            yield {
+                'chunk': chunk_number,
+                'rows': len(chunk),
+                'created': created,
+                'skipped': len(transactions) - len(created),
+                'errors': errors,
+                'transactions': numbered,
+            }
     
-    def update_transactions(self, transaction_data):
+    def search_filter(self, queryset, search):
+        """
+        Restrict `queryset` to transactions matching `search` (see SearchManager).
+        """
+        return self.search_manager.filter(queryset, search)
+
+    def search(self, query, limit=20):
+        """
+        Ranked full-text search over descriptions and category, account and card names.
+        """
+        return self.search_manager.search(query, limit=limit)
+
+    def page(self, cursor=None, limit=10, search=None):
         """
-        Update a transaction with the given ID using the provided data.
-        The data should be a dictionary containing the fields to update.
+        Fetch one page of the user's transactions, newest first, using keyset pagination.
+        Pages are addressed by an opaque cursor encoding the (date, id) of the last row
+        of the previous page, so no COUNT(*) or OFFSET is needed and every page costs
+        the same at any depth. Each account is read with its own LIMITed scan of the
+        (bank_account, -date, -id) index and the results are merged in Python.
+        Parameters:
+        - cursor: next_cursor returned by the previous page, None for the first page.
+        - limit: page size.
+        - search: optional text matched against category and account names.
+        Returns:
+        {'results': [Transaction, ...], 'next_cursor': 'MjAyNC0wMS0zMToxMjM' or None, 'has_next': bool}
+        """
+        queryset = self.page_queryset(cursor=cursor, search=search)
+        account_ids = self.account_manager.queryset.values_list('id', flat=True)
+        merged = heapq.merge(
+            *(queryset.filter(bank_account_id=account_id)[:limit + 1] for account_id in account_ids),
+            key=lambda tx: (tx.date, tx.id),
+            reverse=True,
+        )
+        return self.page_result(list(islice(merged, limit + 1)), limit)
+
+    def page_queryset(self, cursor=None, search=None, filters=None):
+        """
+        Transactions after `cursor` in page order (newest first), matching `search`
+        and `filters`, shared by page() and the async API.
+        Callers restrict it to the user's accounts and slice limit + 1 rows for page_result.
+        Parameters:
+        - filters: optional {lookup: value} applied as is; empty values are ignored.
+        Raises ValueError for a malformed cursor.
+        """
+        queryset = Transaction.objects.select_related('category', 'bank_account', 'credit_card').order_by('-date', '-id')
+        if filters:
+            queryset = queryset.filter(**{key: value for key, value in filters.items() if value})
+        if search:
+            queryset = self.search_filter(queryset, search)
+        if cursor:
+            last_date, last_id = decode_cursor(cursor)
+            queryset = queryset.filter(Q(date__lt=last_date) | Q(date=last_date, id__lt=last_id))
+        return queryset
+
+    @staticmethod
+    def page_result(rows, limit):
+        """
+        Build the page returned by page() from up to limit + 1 rows in page order.
+        """
+        has_next = len(rows) > limit
+        results = rows[:limit]
+        return {
+            'results': results,
+            'next_cursor': encode_cursor(results[-1].date, results[-1].id) if has_next else None,
+            'has_next': has_next,
+        }
+
+    def cached(self, key, builder):
+        """
+        Read-through cache for anything derived from the user's ledger; entries are
+        dropped by ledger_changed, i.e. after every write to the user's transactions,
+        accounts or cards.
+        """
+        return cache.get_or_build('ledger', self.user.pk, builder, key=key)
+
+    def dashboard(self, search=None, first_page=True, limit=10):
+        """
+        Fragments of the home page, each served from the ledger cache.
+        Parameters:
+        - search: text filter of the first page.
+        - first_page: also return the first page of transactions.
+        - limit: page size.
+        Returns:
+        {'accounts': {...}, 'total': Decimal, 'approximate_count': 1234, 'page': {...} or None}
+        """
+        accounts = self.cached('home:accounts', self.account_manager.list_accounts)
+        page = None
+        if first_page:
+            # category names are rendered in the page, so a rename must not serve it stale
+            search_key = hashlib.sha1(search.encode('utf-8')).hexdigest() if search else ''
+            page = self.cached(
+                f"home:page:{limit}:{cache.get_version('categories')}:{search_key}",
+                lambda: self.page(limit=limit, search=search),
+            )
+        return {
+            'accounts': accounts,
+            'total': sum((account['balance'] or 0 for account in accounts.values()), Decimal('0')),
+            'approximate_count': self.cached('home:count', self.approximate_count),
+            'page': page,
+        }
+
+    def approximate_count(self):
+        """
+        Total number of the user's transactions, read from the balance snapshots.
+        """
+        return BalanceSnapshotManager(self.user).transaction_count()
+
+    def update_transactions(self, transaction_data, batch_size=None):
+        """
+        Update multiple transactions of the user.
+        Each dictionary holds the id of a transaction and the fields to change; None
+        values are left untouched. Foreign keys accept an instance or a primary key of
+        one of the user's accounts, cards or invoices (or any category); anything else
+        raises ValueError before a row is written. A new credit card also moves the
+        transaction to the card's account.
+        Updates are grouped by the set of fields they change, every target is fetched
+        (and locked) with one query and each group is written with one UPDATE per
+        batch: a plain UPDATE ... WHERE id IN when the whole group gets the same
+        values, a bulk_update otherwise.
         Example:
         transaction_data = [{
             'transaction_id': 1,
@@ -61,31 +348,200 @@ class TransactionManager:
             'amount': 120.00,
             'status': 'CONFIRMED',
         }]
+        Parameters:
+        - batch_size: rows per UPDATE statement, defaults to settings.IMPORT_BATCH_SIZE.
+        Returns the updated transactions.
         """
-        transactions = []
-        transaction_ids = [transaction.pop('transaction_id') for transaction in transaction_data]
-        transactions_qs = self.queryset.filter(id__in=transaction_ids).first()
-        for transaction in transactions_qs:
-            for key, value in transaction_data.items():
-                if key in Transaction._meta.fields and value is not None:
-                    setattr(transaction, key, value)
-                else:
+        fields = {field.name: field for field in Transaction._meta.fields if field.name != 'id'}
+        updates = {}
+        for data in transaction_data:
+            data = dict(data)
+            transaction_id = data.pop('transaction_id')
+            for key in data:
+                if key not in fields:
                     raise ValueError(f"Invalid field: {key}")
-            transactions.append(transaction)
+            updates.setdefault(transaction_id, {}).update(
+                (key, value) for key, value in data.items() if value is not None)
+        if not updates:
+            return []
+        for data in updates.values():
+            self.validate_values(data)
+            self.resolve_update_references(data)
 
-        with transaction.atomic():
-            Transaction.objects.bulk_update(transactions, fields=transaction_data.keys())
+        with db_transaction.atomic():
+            transactions = list(self.queryset.filter(id__in=updates.keys()).select_for_update())
+            previous = [Transaction(bank_account_id=tx.bank_account_id, credit_card_id=tx.credit_card_id,
+                                    invoice_id=tx.invoice_id, category_id=tx.category_id, type=tx.type,
+                                    date=tx.date, status=tx.status, amount=tx.amount) for tx in transactions]
+            groups = defaultdict(list)
+            for transaction, before in zip(transactions, previous):
+                data = updates[transaction.id]
+                changed = set(data)
+                for key, value in data.items():
+                    setattr(transaction, key, value)
+                if 'date' in changed:
+                    transaction.date = to_date(transaction.date)
+                if 'amount' in changed:
+                    transaction.amount = to_decimal(transaction.amount)
+                if 'description' in changed:
+                    transaction.search_document = SearchManager.document(transaction.description)
+                    changed.add('search_document')
+                if (transaction.credit_card_id, transaction.date) != (before.credit_card_id, before.date) \
+                        and 'invoice' not in data:
+                    # moved to another card or billing cycle
+                    transaction.invoice_id = None
+                if transaction.invoice_id != before.invoice_id or transaction.credit_card_id and not transaction.invoice_id:
+                    changed.add('invoice')
+                groups[frozenset(changed)].append(transaction)
+            InvoiceManager.assign_invoices(transactions)
+
+            batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+            for changed, group in groups.items():
+                attnames = [Transaction._meta.get_field(name).attname for name in sorted(changed)]
+                values = {tuple(getattr(tx, attname) for attname in attnames) for tx in group}
+                if len(values) == 1:
+                    # same new values for the whole group (e.g. PLANNED -> CONFIRMED): plain UPDATE ... WHERE id IN
+                    new_values = dict(zip(attnames, values.pop()))
+                    for ids in batched([tx.id for tx in group], batch_size):
+                        Transaction.objects.filter(id__in=ids).update(**new_values)
+                else:
+                    Transaction.objects.bulk_update(group, fields=sorted(changed), batch_size=batch_size)
+            BalanceSnapshotManager.apply_deltas(BalanceSnapshotManager.merge_deltas(
+                BalanceSnapshotManager.collect_deltas(previous, sign=-1),
+                BalanceSnapshotManager.collect_deltas(transactions, sign=1),
+            ))
+            InvoiceManager.apply_deltas(InvoiceManager.merge_deltas(
+                InvoiceManager.collect_deltas(previous, sign=-1),
+                InvoiceManager.collect_deltas(transactions, sign=1),
+            ))
+            CategoryRollupManager.apply_deltas(CategoryRollupManager.merge_deltas(
+                CategoryRollupManager.collect_deltas(previous, sign=-1, user_id=self.user.pk),
+                CategoryRollupManager.collect_deltas(transactions, sign=1, user_id=self.user.pk),
+            ))
+            self.ledger_changed([self.user.pk])
+            if any('description' in data for data in updates.values()):
+                SearchManager.documents_changed([self.user.pk])
         return transactions
-    
-    def delete_transactions(self, transaction_ids):
+
+    def resolve_update_references(self, data):
         """
-        Delete multiple transactions by their IDs.
+        Replace the foreign keys of one update (instances or primary keys) with the
+        instances they name, checking that the accounts, cards and invoices are the user's.
+        """
+        if data.get('credit_card') is not None:
+            data['credit_card'] = self.account_manager.get_credit_card(self._pk_or_instance(data['credit_card']))
+            data['bank_account'] = data['credit_card'].bank_account
+        elif data.get('bank_account') is not None:
+            data['bank_account'] = self.account_manager.get_account(self._pk_or_instance(data['bank_account']))
+        if data.get('category') is not None:
+            data['category'] = self.category_manager.get_category(data['category'])
+        if data.get('invoice') is not None:
+            invoice = data['invoice']
+            invoice_id = invoice.pk if isinstance(invoice, CreditCardInvoice) else int(invoice)
+            data['invoice'] = InvoiceManager(self.user).queryset.filter(id=invoice_id).first()
+            if data['invoice'] is None:
+                raise ValueError(f"Unknown invoice: {invoice_id}")
+        return data
+
+    @staticmethod
+    def _pk_or_instance(value):
+        return value if isinstance(value, Model) else int(value)
+
+    def delete_transactions(self, transaction_ids, batch_size=None):
+        """
+        Delete multiple transactions of the user by their IDs.
+        Each batch is one set-based DELETE ... RETURNING (no per-object collection or
+        signals; nothing references transactions), and the returned rows are used to
+        correct the balance snapshots, invoice totals and category rollups in the
+        same atomic block. Ids of other users' transactions are ignored.
         Example:
         transaction_ids = [1, 2, 3]
+        Parameters:
+        - batch_size: ids per DELETE statement, defaults to settings.IMPORT_BATCH_SIZE.
+        Returns (deleted_count, {(bank_account_id, month): amount removed}).
+        """
+        ids = sorted({int(transaction_id) for transaction_id in transaction_ids})
+        removed = []
+        with db_transaction.atomic():
+            for batch in batched(ids, batch_size or settings.IMPORT_BATCH_SIZE):
+                removed.extend(self._delete_batch(batch))
+            BalanceSnapshotManager.remove_transactions(removed)
+            InvoiceManager.remove_transactions(removed)
+            CategoryRollupManager.remove_transactions(removed, user_id=self.user.pk)
+            if removed:
+                self.ledger_changed([self.user.pk])
+        deltas = defaultdict(lambda: Decimal('0'))
+        for tx in removed:
+            if tx.bank_account_id:
+                deltas[(tx.bank_account_id, month_start(tx.date))] += tx.amount
+        return len(removed), dict(deltas)
+
+    @staticmethod
+    def can_delete_returning():
+        """
+        Whether the database runs DELETE ... RETURNING: PostgreSQL, and SQLite from 3.35.
+        """
+        if connection.vendor == 'postgresql':
+            return True
+        return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+    def _delete_batch(self, ids):
+        """
+        Delete the user's transactions among `ids` with one statement.
+        Returns unsaved Transaction instances holding the DELETED_COLUMNS of the removed rows.
         """
-        transactions = Transaction.objects.filter(id__in=transaction_ids)
-        deleted_count, _ = transactions.delete()
-        return deleted_count
+        fields = [Transaction._meta.get_field(column.removesuffix('_id')) for column in self.DELETED_COLUMNS]
+        if self.can_delete_returning():
+            quote = connection.ops.quote_name
+            sql = (
+                f"DELETE FROM {quote(Transaction._meta.db_table)} "
+                f"WHERE {quote('id')} IN ({', '.join(['%s'] * len(ids))}) "
+                f"AND {quote('bank_account_id')} IN "
+                f"(SELECT {quote('id')} FROM {quote(BankAccount._meta.db_table)} WHERE {quote('user_id')} = %s) "
+                f"RETURNING {', '.join(quote(column) for column in self.DELETED_COLUMNS)}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [*ids, self.user.pk])
+                rows = cursor.fetchall()
+        else:
+            # no DELETE ... RETURNING: read the rows first, then delete them by id (Django
+            # fast-deletes without collecting objects, since nothing references transactions)
+            rows = list(self.queryset.filter(id__in=ids).values_list('id', *self.DELETED_COLUMNS))
+            Transaction.objects.filter(id__in=[row[0] for row in rows]).delete()
+            rows = [row[1:] for row in rows]
+        removed = []
+        for row in rows:
+            tx = Transaction(**{column: field.to_python(value) for column, field, value in zip(self.DELETED_COLUMNS, fields, row)})
+            # SQLite hands decimals back as floats
+            tx.amount = tx.amount.quantize(CENTS)
+            removed.append(tx)
+        return removed
+
+    def resolve_references(self, rows):
+        """
+        Resolve the accounts, cards and categories referenced by a batch of rows with
+        one query per model (plus one bulk insert per model for the missing ones),
+        so that pre_create_validation is pure in-memory work afterwards.
+        """
+        with db_transaction.atomic():
+            self.account_manager.resolve_references(rows)
+            self.category_manager.resolve_references(rows)
+        return rows
+
+    @staticmethod
+    def validate_values(data):
+        """
+        Check the status and the length of the text fields of one row, so that a bad
+        value is reported against its row instead of failing the whole INSERT or
+        UPDATE of a chunk (PostgreSQL rejects strings longer than max_length).
+        """
+        if 'status' in data and data['status'] not in dict(Transaction.STATUS_CHOICES):
+            raise ValueError(f"Invalid transaction status: {data['status']}")
+        for name, value in data.items():
+            field = TEXT_FIELDS.get(name)
+            if field is not None and isinstance(value, str) and len(value) > field.max_length:
+                raise ValueError(f"{name} is longer than {field.max_length} characters")
+
     def pre_create_validation(self, data):
         """
         Validate the data before creating a transaction.
@@ -95,46 +551,68 @@ class TransactionManager:
         for field in required_fields:
             if field not in data or data[field] is None:
                 raise ValueError(f"Missing required field: {field}")
+        data['date'] = to_date(data['date'])
         if data['date'] is None:
             raise ValueError("Date cannot be null")
+        data['amount'] = to_decimal(data['amount'])
+        if data['amount'] is None:
+            raise ValueError("Amount cannot be null")
         if data['type'] not in dict(Transaction.TYPE_CHOICES):
             raise ValueError(f"Invalid transaction type: {data['type']}")
+        if data.get('status') in (None, ''):
+            # statement columns left blank get the model default
+            data.pop('status', None)
+        data['description'] = '' if data.get('description') is None else str(data['description'])
+        self.validate_values(data)
         if not data.get('bank_account') and not data.get('credit_card'):
             raise ValueError("Either bank_account or credit_card must be provided")
 
         data['bank_account'], data['credit_card'] = self.account_manager.resolve_account_and_card(
             bank_account=data.get('bank_account'),
             credit_card=data.get('credit_card'))
-        data['category'] = self.category_manager.create_category(
-            name=data.get('category')
-        )
+        if not isinstance(data.get('category'), Category):
+            data['category'] = self.category_manager.create_category(
+                name=data.get('category')
+            ) if data.get('category') else None
 
     def create_recurrent_transactions(self, recurring_data):
         """
         Create recurring transactions based on the provided data.
-        This method should handle the logic for creating multiple transactions
-        based on a recurring schedule.
+        Rules are tied to a bank account and have no status: their occurrences are
+        written by RecurrenceManager, so 'status' and 'credit_card' are validated like
+        a transaction's and then left out of the rule.
         Example:
-        recurring_data = {
+        recurring_data = [{
             'bank_account': bank_account_instance,
             'category': category_instance,
             'description': 'Monthly Subscription',
-            'type': 'EXPENSE',
+            'type': 'PIX',
             'amount': 50.00,
-            'start_date': '2023-10-01',
+            'date': '2023-10-01',
             'frequency': 'MONTHLY',  # or 'WEEKLY', etc.
+            'interval': 1,  # Optional
             'end_date': '2024-10-01'  # Optional
-        }
+        }]
         """
         rec_transactions = []
         for rec_data in recurring_data:
+            rec_data = dict(rec_data)
             self.pre_create_validation(rec_data)
+            if rec_data.get('frequency') not in dict(RecurringTransaction.FREQUENCY_CHOICES):
+                raise ValueError(f"Invalid frequency: {rec_data.get('frequency')}")
+            rec_data['interval'] = int(rec_data.get('interval') or 1)
+            rec_data['end_date'] = to_date(rec_data.get('end_date'))
+            rec_data = {key: value for key, value in rec_data.items() if key in RECURRING_FIELDS}
             # Create a RecurringTransaction instance
             recurring_transaction = RecurringTransaction(**rec_data)
+            # bulk_create does not call save(), so seed next_occurrence here
+            if recurring_transaction.next_occurrence is None:
+                recurring_transaction.next_occurrence = recurring_transaction.date
             rec_transactions.append(recurring_transaction)
         try:
             RecurringTransaction.objects.bulk_create(rec_transactions)
         except(Exception) as e:
             raise ValueError(f"Error creating recurring transactions: {e}")
+        self.ledger_changed([self.user.pk])
         return rec_transactions
 
@@ -0,0 +1,160 @@
+"""
+JSON endpoints for the ledger (served under /api/v1/).
+
+The read endpoints run natively under ASGI (app/asgi.py) and use Django's async
+ORM, so one worker serves many slow clients without tying up a thread per request.
+They are authenticated by the session cookie or by a simplejwt access token
+(Authorization: Bearer <token>). The bulk ingest endpoint is a regular DRF view
+and only accepts the JWT access token.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from cash_flow.api.bank_account_manager import AccountManager
+from cash_flow.api.invoice_manager import InvoiceManager
+from cash_flow.api.transaction_ingestor import TransactionIngestor
+from cash_flow.api.transaction_manager import TransactionManager
+from .helpers import to_date
+from .models import CreditCard
+from .views import _transaction_to_dict
+
+
+async def authenticate(request):
+    """
+    Return the user of the session, or of the JWT access token, or None.
+    """
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def async_api(view):
+    """
+    Authenticate the request (401 when anonymous) and turn ValueError into a 400 response.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return JsonResponse({'error': 'Method not allowed'}, status=405)
+        user = await authenticate(request)
+        if user is None:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        try:
+            return await view(request, user, *args, **kwargs)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return wrapper
+
+
+def _flag(value, default=True):
+    if value is None:
+        return default
+    return value.lower() not in ('0', 'false', 'no')
+
+
+@async_api
+async def accounts(request, user):
+    rows = AccountManager(user).queryset.values('id', 'name', 'bank_name', 'balance_initial', 'currency__code').order_by('id')
+    cards = (
+        CreditCard.objects.filter(bank_account__user=user)
+        .values('id', 'name', 'bank_account_id', 'limit', 'closing_day', 'due_day').order_by('id')
+    )
+    return JsonResponse({
+        'results': [row async for row in rows],
+        'credit_cards': [card async for card in cards],
+    })
+
+
+@async_api
+async def balances(request, user):
+    as_of = to_date(request.GET.get('as_of'))
+    rows = AccountManager(user).balances_queryset(
+        as_of=as_of, include_planned=_flag(request.GET.get('include_planned')))
+    results = [row async for row in rows]
+    return JsonResponse({
+        'as_of': as_of,
+        'results': results,
+        'total': sum((row['balance'] or 0 for row in results), 0),
+    })
+
+
+@async_api
+async def transactions(request, user):
+    """
+    Keyset-paginated transactions, newest first.
+    Filters: q, account, credit_card, category, status, type, date_from, date_to; page with cursor/limit.
+    """
+    limit = min(max(int(request.GET.get('limit', 50)), 1), 500)
+    account_ids = [pk async for pk in AccountManager(user).queryset.values_list('id', flat=True)]
+    filters = {
+        'bank_account_id': request.GET.get('account'),
+        'credit_card_id': request.GET.get('credit_card'),
+        'category_id': request.GET.get('category'),
+        'status': request.GET.get('status'),
+        'type': request.GET.get('type'),
+        'date__gte': to_date(request.GET.get('date_from')),
+        'date__lte': to_date(request.GET.get('date_to')),
+    }
+    # building the search filter reads the lookup caches, which is sync code
+    queryset = await sync_to_async(lambda: TransactionManager(user).page_queryset(
+        cursor=request.GET.get('cursor'), search=request.GET.get('q'), filters=filters))()
+    rows = [tx async for tx in queryset.filter(bank_account_id__in=account_ids)[:limit + 1]]
+    page = TransactionManager.page_result(rows, limit)
+    return JsonResponse({
+        'results': [_transaction_to_dict(tx) for tx in page['results']],
+        'next_cursor': page['next_cursor'],
+    })
+
+
+@async_api
+async def invoices(request, user):
+    month = to_date(request.GET.get('month'))
+    queryset = InvoiceManager(user).list_invoices(
+        credit_card=request.GET.get('credit_card'), month=month, limit=None if month else 24)
+    return JsonResponse({
+        'results': [
+            {
+                'id': invoice.id,
+                'credit_card_id': invoice.credit_card_id,
+                'credit_card': invoice.credit_card.name,
+                'closing_date': invoice.closing_date,
+                'due_date': invoice.due_date,
+                'status': invoice.status,
+                'total_amount': invoice.total_amount,
+            }
+            async for invoice in queryset
+        ],
+    })
+
+
+@api_view(['POST'])
+def ingest_transactions(request):
+    """
+    Bulk create transactions from an NDJSON body (one object per line) or a JSON array.
+    The body is read as a stream and written in chunks of `batch_size` rows, each
+    chunk in its own database transaction. Rows already in the ledger are skipped
+    unless `dedupe=0`.
+    Returns the TransactionIngestor report with one result per row.
+    """
+    try:
+        batch_size = int(request.query_params.get('batch_size') or 0) or None
+    except ValueError:
+        return Response({'error': 'batch_size must be an integer'}, status=400)
+    ingestor = TransactionIngestor(
+        request.user, batch_size=batch_size, fingerprint=_flag(request.query_params.get('dedupe')))
+    # request.stream is the raw body; request.data would parse it whole
+    if request.stream is None:
+        return Response({'error': 'Empty body'}, status=400)
+    report = ingestor.run(request.stream, request.content_type or '')
+    return Response(report)
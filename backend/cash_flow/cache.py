@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction as db_transaction
+
+
+class LocalCache:
+    """
+    Process-local copies of recently used entries, {(namespace, scope, key): (version, expires, value)},
+    bounded to settings.LOCAL_CACHE_MAX_ENTRIES (least recently used first out).
+    Expired entries are dropped when read.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, entry_key):
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[entry_key]
+                return None
+            self._entries.move_to_end(entry_key)
+            return entry
+
+    def set(self, entry_key, entry):
+        with self._lock:
+            self._entries[entry_key] = entry
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > settings.LOCAL_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def drop(self, namespace, scope):
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[:2] == (namespace, scope)]:
+                del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalCache()
+# Backends whose entries (and version counters) only exist in the process that wrote them
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared():
+    """
+    Whether the default cache is seen by every process. Version counters are
+    bumped by whichever process writes (web workers, run_import_worker,
+    materialize_recurring), so they only reach the others through a shared backend.
+    """
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def require_shared():
+    """
+    Raise ImproperlyConfigured when the default cache is process-local; called by
+    the commands that write to the ledger outside the web processes.
+    """
+    if not is_shared():
+        raise ImproperlyConfigured(
+            f"CACHES['default'] uses {settings.CACHES['default']['BACKEND']}, which is local to each process: "
+            "the web processes would keep serving cached data after this command writes. "
+            "Set CACHE_BACKEND/CACHE_LOCATION to a shared backend (Redis, Memcached, database or file-based cache)."
+        )
+
+
+def _version_key(namespace, scope):
+    return f"zf:{namespace}:{scope}:version"
+
+
+def get_version(namespace, scope=None):
+    """
+    Current version of a cached namespace (e.g. 'categories' or 'credit_cards' for a user).
+    A missing counter is seeded from the clock, so an evicted counter never
+    comes back at a value that older entries were stored under.
+    """
+    key = _version_key(namespace, scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, scope=None):
+    """
+    Invalidate every entry cached under `namespace`/`scope`.
+    """
+    key = _version_key(namespace, scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    _local.drop(namespace, scope)
+
+
+def bump_version_on_commit(namespace, scope=None):
+    """
+    bump_version once the current database transaction commits (right away outside
+    one). Bumping earlier lets another process cache a map that misses the rows
+    being written under the new version and keep it for the whole timeout.
+    """
+    db_transaction.on_commit(lambda: bump_version(namespace, scope))
+
+
+def get_or_build(namespace, scope, builder, timeout=None, key=None, shared=True):
+    """
+    Return the value cached for `namespace`/`scope` at its current version, calling
+    `builder()` to compute it on a miss.
+    `key` tells apart several entries sharing one version (e.g. forecasts of
+    different lengths for the same user); bump_version invalidates all of them.
+    The value is kept in this process for at most LOOKUP_CACHE_TIMEOUT seconds and,
+    unless `shared` is False, in Django's cache, so other processes reuse it as long
+    as CACHES points to a shared backend (see is_shared). Large values that are cheap
+    to rebuild locally pass shared=False. Callers must treat the returned value as read-only.
+    """
+    version = get_version(namespace, scope)
+    local = _local.get((namespace, scope, key))
+    if local is not None and local[0] == version:
+        return local[2]
+    cache_key = f"zf:{namespace}:{scope}:v{version}" + (f":{key}" if key is not None else '')
+    value = cache.get(cache_key) if shared else None
+    if value is None:
+        value = builder()
+        if shared:
+            cache.set(cache_key, value, timeout if timeout is not None else settings.LOOKUP_CACHE_TIMEOUT)
+    _local.set((namespace, scope, key), (version, time.monotonic() + settings.LOOKUP_CACHE_TIMEOUT, value))
+    return value
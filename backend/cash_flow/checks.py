@@ -0,0 +1,20 @@
+from django.core.checks import Tags, Warning, register
+
+from . import cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cached dashboards, forecasts and lookup maps are invalidated by bumping version
+    counters in the default cache; with a process-local backend the bumps of one
+    process never reach the others.
+    """
+    if cache.is_shared():
+        return []
+    return [Warning(
+        "The default cache is local to each process, so writes made by another process "
+        "(another web worker, run_import_worker, materialize_recurring) leave cached pages stale.",
+        hint="Set CACHE_BACKEND/CACHE_LOCATION to a shared backend such as Redis or Memcached.",
+        id='cash_flow.W001',
+    )]
@@ -1,7 +1,15 @@
+import base64
+import hashlib
 import re
 import unicodedata
+from calendar import monthrange
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
 from typing import Optional
 
+CENTS = Decimal('0.01')
+
 
 def norm_str(s: Optional[str],
                      lower: bool = True,
@@ -44,4 +52,178 @@ def norm_str(s: Optional[str],
     # collapse any whitespace sequence into the given separator and trim again
     s = re.sub(r'\s+', sep, s).strip()
 
-    return s
\ No newline at end of file
+    return s
+
+
+def search_tokens(text: Optional[str]) -> list:
+    """
+    Split text into the lowercase, accent-free words used by the search index.
+
+    >>> search_tokens("Café  do Pão-de-Açúcar")
+    ['cafe', 'do', 'paodeacucar']
+    """
+    return norm_str(text, remove_punctuation=True, sep=' ').split()
+
+
+def to_date(value) -> Optional[date]:
+    """
+    Coerce a date-like value into a `datetime.date`.
+
+    Accepts `date`/`datetime` instances and strings in ISO (`2023-10-01`) or
+    Brazilian (`01/10/2023`) format. Empty values return None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S', '%d/%m/%y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {value}")
+
+
+def to_decimal(value) -> Optional[Decimal]:
+    """
+    Coerce a numeric value into a `Decimal` with two decimal places.
+
+    Strings may use `1,234.56` or the Brazilian `1.234,56` notation and an
+    optional currency prefix (`R$ 10,00`): the last `,` or `.` is the decimal
+    separator and the other one must group thousands. A lone separator followed
+    by three digits (`1.234`, `1,234`) could be either and raises ValueError, as
+    do NaN and infinities. Empty values return None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        number = value if isinstance(value, Decimal) else Decimal(str(value))
+    else:
+        number = Decimal(_amount_digits(value))
+    if not number.is_finite():
+        raise ValueError(f"Invalid amount: {value}")
+    return number.quantize(CENTS)
+
+
+def _amount_digits(value) -> str:
+    """
+    Rewrite an amount string as `[-]digits[.digits]` for Decimal (see to_decimal).
+    """
+    cleaned = re.sub(r'[^\d,.\-]', '', str(value))
+    separators = [c for c in cleaned if c in ',.']
+    if separators:
+        decimal_sep = separators[-1]
+        thousands_sep = '.' if decimal_sep == ',' else ','
+        grouped = rf'-?\d{{1,3}}(?:{re.escape(thousands_sep)}\d{{3}})+'
+        if separators.count(decimal_sep) > 1:
+            # the same separator repeated only groups thousands (1.234.567)
+            integer, fraction = cleaned, ''
+            grouped = rf'-?\d{{1,3}}(?:{re.escape(decimal_sep)}\d{{3}})+'
+        else:
+            integer, fraction = cleaned.split(decimal_sep)
+            if thousands_sep not in integer and len(fraction) == 3 and re.fullmatch(r'-?[1-9]\d{0,2}', integer):
+                raise ValueError(f"Ambiguous amount: {value}")
+        if (thousands_sep in integer or not fraction) and not re.fullmatch(grouped, integer):
+            raise ValueError(f"Invalid amount: {value}")
+        cleaned = re.sub(r'[,.]', '', integer) + (f'.{fraction}' if fraction else '')
+    if not re.fullmatch(r'-?\d+(?:\.\d+)?', cleaned):
+        raise ValueError(f"Invalid amount: {value}")
+    return cleaned
+
+
+def month_start(value: date) -> date:
+    """
+    Return the first day of the month of `value`.
+    """
+    return value.replace(day=1)
+
+
+def add_months(value: date, months: int) -> date:
+    """
+    Shift `value` by a number of months, clamping the day to the end of the
+    target month (Jan 31 + 1 month -> Feb 28/29).
+    """
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    month += 1
+    return value.replace(year=year, month=month, day=min(value.day, monthrange(year, month)[1]))
+
+
+def day_of_month(year: int, month: int, day: int) -> date:
+    """
+    Build a date, clamping `day` to the last day of the month (day 31 in April -> April 30).
+    """
+    return date(year, month, min(day, monthrange(year, month)[1]))
+
+
+def invoice_dates(value: date, closing_day: int, due_day: int):
+    """
+    Return the (closing_date, due_date) of the credit card invoice a purchase made
+    on `value` belongs to.
+
+    Purchases before the closing day go to the invoice closing that month; purchases
+    on or after it go to the next one. The due date is the first `due_day` after
+    the closing date. Days beyond the end of a month are clamped.
+    """
+    closing = day_of_month(value.year, value.month, closing_day)
+    if value >= closing:
+        following = add_months(month_start(value), 1)
+        closing = day_of_month(following.year, following.month, closing_day)
+    due = day_of_month(closing.year, closing.month, due_day)
+    if due <= closing:
+        following = add_months(month_start(closing), 1)
+        due = day_of_month(following.year, following.month, due_day)
+    return closing, due
+
+
+def batched(iterable, size: int):
+    """
+    Yield lists of up to `size` items from `iterable` without materializing it
+    (same as `itertools.batched`, which is only available from Python 3.12).
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def transaction_fingerprint(user_id, date_value, amount, description, credit_card_id=None, occurrence=0) -> str:
+    """
+    Stable hash identifying an imported row.
+
+    The description goes through `norm_str` so case, accents and spacing do not
+    matter. `occurrence` tells apart identical rows of the same file (two equal
+    purchases on the same day), so re-importing the file yields the same hashes.
+    """
+    parts = [
+        str(user_id or ''),
+        to_date(date_value).isoformat(),
+        str(to_decimal(amount)),
+        norm_str(description, remove_punctuation=True),
+        str(credit_card_id or ''),
+        str(occurrence),
+    ]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def encode_cursor(date_value: date, pk: int) -> str:
+    """
+    Encode a (date, id) keyset position as an opaque URL-safe token.
+    """
+    raw = f"{date_value.isoformat()}:{pk}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a token produced by `encode_cursor` back into (date, id).
+    Raises ValueError for malformed tokens.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        date_part, pk = raw.split(':')
+        return date.fromisoformat(date_part), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from cash_flow.models import BankAccount, RecurringTransaction, User
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def init_hook():
+    """
+    Temporarily reinstate the old RecurringTransaction.__init__ override, which
+    recomputed next_occurrence for every instance, including hydrated rows.
+    """
+    original = RecurringTransaction.__init__
+
+    def __init__(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        self.next_occurrence = self.calculate_next_occurrence()
+
+    RecurringTransaction.__init__ = __init__
+    try:
+        yield
+    finally:
+        RecurringTransaction.__init__ = original
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed recurring rules inside a transaction and measure queryset iteration "
+        "throughput (rows/s), with and without the per-instance next_occurrence hook. "
+        "Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, default=50_000)
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per case; the median is reported.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with db_transaction.atomic():
+                self.seed(options)
+                self.run_benchmarks(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Seeded data rolled back.")
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        user = User.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}")
+        account = BankAccount.objects.create(user=user, name="Conta", bank_name="Banco")
+        today = date.today()
+        frequencies = [choice for choice, _ in RecurringTransaction.FREQUENCY_CHOICES]
+        rules = []
+        for i in range(options['rules']):
+            start = today - timedelta(days=rng.randint(0, 365 * 2))
+            rules.append(RecurringTransaction(
+                bank_account=account,
+                description=f"recorrente {i}",
+                type='PIX',
+                amount=Decimal(rng.randint(-50000, 20000)) / 100,
+                frequency=rng.choice(frequencies),
+                interval=rng.randint(1, 3),
+                date=start,
+                next_occurrence=start,
+            ))
+        RecurringTransaction.objects.bulk_create(rules, batch_size=5000)
+        self.stdout.write(f"Seeded {len(rules)} recurring rules.")
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            count = sum(1 for _ in queryset.all().iterator(chunk_size=2000))
+            timings.append(time.perf_counter() - started)
+        return count, statistics.median(timings)
+
+    def run_benchmarks(self, options):
+        queryset = RecurringTransaction.objects.order_by('id')
+        cases = [('plain model', None), ('with __init__ hook', init_hook)]
+        for name, hook in cases:
+            if hook is None:
+                count, median = self.measure(queryset, options['repeat'])
+            else:
+                with hook():
+                    count, median = self.measure(queryset, options['repeat'])
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: {count} rows, median {median * 1000:.1f} ms ({count / median:,.0f} rows/s)"))
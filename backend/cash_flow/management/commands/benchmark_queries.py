@@ -0,0 +1,152 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from cash_flow import cache
+from cash_flow.api import (
+    AccountManager, BalanceSnapshotManager, CategoryRollupManager, InvoiceManager, SearchManager, TransactionManager,
+)
+from cash_flow.helpers import add_months, month_start
+from cash_flow.models import BankAccount, Category, CreditCard, Transaction, User
+
+TRIGRAM_INDEXES = ['tx_description_trgm_idx', 'category_name_trgm_idx', 'tx_search_document_idx']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic ledger inside a transaction and report EXPLAIN plans and timings "
+        "for the queries behind the home and invoices views. Run it with and without "
+        "--without-indexes to compare. Nothing is kept unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=100_000)
+        parser.add_argument('--accounts', type=int, default=4)
+        parser.add_argument('--cards', type=int, default=3)
+        parser.add_argument('--categories', type=int, default=40)
+        parser.add_argument('--noise-users', type=int, default=5,
+                            help="Other users with the same ledger size, so filters have something to skip.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query; the median is reported.")
+        parser.add_argument('--search', default='mercado')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--without-indexes', action='store_true',
+                            help="Drop the ledger indexes (inside the rolled back transaction) before measuring.")
+        parser.add_argument('--keep', action='store_true', help="Commit the seeded data.")
+
+    def handle(self, *args, **options):
+        try:
+            with db_transaction.atomic():
+                user = self.seed(options)
+                if options['without_indexes']:
+                    self.drop_indexes()
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                self.run_benchmarks(user, options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write("Seeded data rolled back.")
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        today = date.today()
+        started = time.perf_counter()
+        categories = Category.objects.bulk_create(
+            [Category(name=f"bench {i} {rng.choice(['mercado', 'farmacia', 'posto', 'restaurante'])}")
+             for i in range(options['categories'])])
+        # only reaches other processes when --keep commits the seeded data
+        cache.bump_version_on_commit('categories')
+        owners = []
+        for n in range(options['noise_users'] + 1):
+            owner = User.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}")
+            owners.append(owner)
+            accounts = BankAccount.objects.bulk_create(
+                [BankAccount(user=owner, name=f"Conta {i}", bank_name=f"Banco {i}") for i in range(options['accounts'])])
+            cards = CreditCard.objects.bulk_create(
+                [CreditCard(bank_account=rng.choice(accounts), name=f"Cartao {i}", limit=5000,
+                            closing_day=rng.randint(1, 28), due_day=rng.randint(1, 28))
+                 for i in range(options['cards'])])
+            batch = []
+            for i in range(options['transactions']):
+                card = rng.choice(cards) if rng.random() < 0.6 else None
+                description = f"compra {rng.choice(['mercado', 'farmacia', 'posto', 'padaria'])} {rng.randint(1, 5000)}"
+                batch.append(Transaction(
+                    bank_account=card.bank_account if card else rng.choice(accounts),
+                    credit_card=card,
+                    category=rng.choice(categories),
+                    description=description,
+                    search_document=SearchManager.document(description),
+                    type='CREDITCARD' if card else rng.choice(['PIX', 'CASH']),
+                    amount=Decimal(rng.randint(-50000, 20000)) / 100,
+                    date=today - timedelta(days=rng.randint(0, 365 * 3)),
+                    status=rng.choice(['PLANNED', 'CONFIRMED', 'CONFIRMED', 'CANCELLED']),
+                ))
+                if len(batch) == 5000:
+                    Transaction.objects.bulk_create(batch)
+                    batch = []
+            Transaction.objects.bulk_create(batch)
+        # aggregates of the seeded users only; the rest of the database is left alone
+        for owner in owners:
+            BalanceSnapshotManager(owner).rebuild()
+            InvoiceManager(owner).rebuild()
+            CategoryRollupManager(owner).rebuild()
+        self.stdout.write(
+            f"Seeded {options['noise_users'] + 1} users x {options['transactions']} transactions "
+            f"in {time.perf_counter() - started:.1f}s."
+        )
+        return owners[0]
+
+    def drop_indexes(self):
+        names = [index.name for index in Transaction._meta.indexes] + TRIGRAM_INDEXES
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        self.stdout.write("Ledger indexes dropped for this run.")
+
+    def querysets(self, user, search):
+        account_ids = list(BankAccount.objects.filter(user=user).values_list('id', flat=True))
+        card = CreditCard.objects.filter(bank_account__user=user).first()
+        first_day = month_start(date.today())
+        home = Transaction.objects.filter(bank_account_id__in=account_ids).order_by('-date')
+        return {
+            'home: first page': home[:10],
+            'home: search (icontains)': (home.filter(category__name__icontains=search)
+                                         | home.filter(bank_account__name__icontains=search))[:10],
+            'home: search (index)': TransactionManager(user).search_filter(home, search)[:10],
+            'invoices: card month': Transaction.objects.filter(
+                credit_card=card, date__gte=first_day, date__lt=add_months(first_day, 1)).order_by('-date'),
+            'invoices: list': InvoiceManager(user).list_invoices(limit=24),
+            'accounts: balances': AccountManager(user).balances_queryset(),
+            'reports: categories, 24 months (rollup)': CategoryRollupManager(user).queryset.filter(
+                month__gte=add_months(first_day, -23)).values('month', 'category_id', 'type').annotate(
+                amount=Sum('amount')).order_by('month'),
+            'reports: categories, 24 months (raw ledger)': Transaction.objects.filter(
+                bank_account_id__in=account_ids, date__gte=add_months(first_day, -23)).exclude(
+                status='CANCELLED').annotate(month=TruncMonth('date')).values('month', 'category_id', 'type').annotate(
+                amount=Sum('amount')).order_by('month'),
+        }
+
+    def run_benchmarks(self, user, options):
+        for name, queryset in self.querysets(user, options['search']).items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: median {statistics.median(timings):.2f} ms (min {min(timings):.2f} ms)"))
+            self.stdout.write(queryset.explain())
+            self.stdout.write("")
@@ -0,0 +1,326 @@
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction as db_transaction
+from openpyxl import Workbook
+
+from cash_flow import cache, schedule
+from cash_flow.api import (
+    BalanceSnapshotManager, CategoryRollupManager, InvoiceManager, RecurrenceManager, SearchManager,
+)
+from cash_flow.helpers import CENTS, add_months, batched
+from cash_flow.models import (
+    BalanceSnapshot, BankAccount, Category, CategoryRollup, CreditCard, Currency, RecurringTransaction, Transaction,
+    User,
+)
+
+# Spending categories: (name, merchants, median amount, log-normal sigma, share of purchases, share paid by card)
+CATEGORY_PROFILES = [
+    ('Mercado', ['Carrefour', 'Pão de Açúcar', 'Assaí Atacadista', 'Hortifruti', 'Padaria Real'], 120, 0.8, 0.24, 0.6),
+    ('Restaurante', ['iFood', 'Outback', 'Madero', 'Lanchonete da Esquina', 'Starbucks'], 55, 0.6, 0.20, 0.8),
+    ('Transporte', ['Uber', '99', 'Posto Shell', 'Posto Ipiranga', 'Sem Parar'], 35, 0.7, 0.16, 0.7),
+    ('Farmácia', ['Drogasil', 'Droga Raia', 'Pague Menos'], 60, 0.6, 0.08, 0.6),
+    ('Lazer', ['Cinemark', 'Ingresso.com', 'Steam', 'Livraria Cultura'], 70, 0.7, 0.08, 0.9),
+    ('Casa', ['Leroy Merlin', 'Tok&Stok', 'Magazine Luiza', 'Mercado Livre'], 200, 1.0, 0.08, 0.8),
+    ('Saúde', ['Laboratório Fleury', 'Clínica Sorriso', 'Academia Smart Fit'], 150, 0.7, 0.06, 0.5),
+    ('Vestuário', ['Renner', 'C&A', 'Zara', 'Centauro'], 150, 0.7, 0.06, 0.9),
+    ('Educação', ['Udemy', 'Alura', 'Papelaria Kalunga'], 120, 0.8, 0.04, 0.7),
+]
+# Recurring rules: (description, category, frequency, day of month, typical amount)
+RECURRING_PROFILES = [
+    ('Salário', 'Salário', 'MONTHLY', 5, Decimal('6500.00')),
+    ('Aluguel', 'Moradia', 'MONTHLY', 10, Decimal('-1900.00')),
+    ('Conta de luz', 'Contas', 'MONTHLY', 15, Decimal('-180.00')),
+    ('Internet', 'Contas', 'MONTHLY', 20, Decimal('-120.00')),
+    ('Streaming', 'Lazer', 'MONTHLY', 8, Decimal('-55.90')),
+    ('Seguro do carro', 'Transporte', 'YEARLY', 3, Decimal('-2400.00')),
+]
+CARD_NAMES = ['Nubank', 'Itaú Click', 'Inter', 'C6 Carbon', 'XP Visa Infinite']
+BANK_NAMES = ['Nubank', 'Itaú', 'Banco Inter', 'C6 Bank', 'XP Investimentos', 'Bradesco']
+STATEMENT_HEADERS = ['Data', 'Descrição', 'Valor', 'Categoria', 'Cartão']
+
+
+def purchase_amount(rng, median, sigma):
+    """
+    Log-normal purchase value: most purchases are near the median, a few are much larger.
+    """
+    return Decimal(rng.lognormvariate(math.log(median), sigma)).quantize(CENTS) or CENTS
+
+
+class LedgerGenerator:
+    """
+    Build the synthetic ledger of one user at a time. Every user gets its own random
+    stream derived from the seed, so a run is reproducible whatever the number of workers.
+    """
+
+    def __init__(self, options, category_ids):
+        """
+        Parameters:
+        - options: parsed command options.
+        - category_ids: {category name: id} for CATEGORY_PROFILES and RECURRING_PROFILES.
+        """
+        self.options = options
+        self.category_ids = category_ids
+        self.today = date.today()
+        self.start = add_months(self.today, -options['months'])
+        self.password = make_password(None)
+        self.weights = [profile[4] for profile in CATEGORY_PROFILES]
+
+    def rng(self, index, salt=''):
+        return random.Random(f"{self.options['seed']}:{index}{salt}")
+
+    def username(self, index):
+        return f"{self.options['prefix']}-{index:06d}"
+
+    def create_user(self, index):
+        """
+        Insert the user, its accounts, cards and recurring rules.
+        Returns (user, accounts, cards, rules).
+        """
+        rng = self.rng(index)
+        user = User.objects.create(username=self.username(index), password=self.password)
+        currency_id = self.options['currency_id']
+        accounts = BankAccount.objects.bulk_create([
+            BankAccount(user=user, name=f"Conta {i + 1}", bank_name=rng.choice(BANK_NAMES), currency_id=currency_id,
+                        balance_initial=Decimal(rng.randint(0, 20000)))
+            for i in range(self.options['accounts'])
+        ])
+        cards = CreditCard.objects.bulk_create([
+            CreditCard(bank_account=accounts[i % len(accounts)], name=CARD_NAMES[i % len(CARD_NAMES)] + (
+                f" {i // len(CARD_NAMES) + 1}" if i >= len(CARD_NAMES) else ''),
+                limit=Decimal(rng.choice([2000, 5000, 8000, 15000])),
+                closing_day=rng.randint(1, 28), due_day=rng.randint(1, 28))
+            for i in range(self.options['cards'])
+        ])
+        rules = RecurringTransaction.objects.bulk_create([
+            RecurringTransaction(
+                bank_account=accounts[0] if amount > 0 else rng.choice(accounts),
+                category_id=self.category_ids[category],
+                description=description,
+                type='PIX',
+                amount=(amount * Decimal(rng.uniform(0.7, 1.5))).quantize(CENTS),
+                frequency=frequency,
+                date=self.start.replace(day=day),
+                next_occurrence=schedule.next_occurrence(self.start.replace(day=day), frequency, 1, self.today),
+            )
+            for description, category, frequency, day, amount in RECURRING_PROFILES[:self.options['recurring']]
+        ])
+        return user, accounts, cards, rules
+
+    def occurrences(self, rules):
+        """
+        Transactions already materialized from the rules, up to today.
+        """
+        manager = RecurrenceManager()
+        for rule in rules:
+            for when in schedule.occurrences(rule.date, rule.frequency, rule.interval, self.start, self.today):
+                yield Transaction(
+                    bank_account_id=rule.bank_account_id,
+                    category_id=rule.category_id,
+                    description=rule.description,
+                    search_document=SearchManager.document(rule.description),
+                    type=rule.type,
+                    amount=rule.amount,
+                    date=when,
+                    status='CONFIRMED',
+                    fingerprint=manager.occurrence_fingerprint(rule, when),
+                )
+
+    def purchases(self, rng, accounts, cards, count, start, end):
+        """
+        `count` purchases dated between `start` and `end`, yielded lazily.
+        """
+        days = (end - start).days
+        for _ in range(count):
+            name, merchants, median, sigma, _share, card_share = rng.choices(CATEGORY_PROFILES, self.weights)[0]
+            card = rng.choice(cards) if cards and rng.random() < card_share else None
+            when = start + timedelta(days=rng.randint(0, days))
+            description = rng.choice(merchants)
+            yield Transaction(
+                bank_account_id=card.bank_account_id if card else rng.choice(accounts).id,
+                credit_card_id=card.id if card else None,
+                category_id=self.category_ids[name],
+                description=description,
+                search_document=SearchManager.document(description),
+                type='CREDITCARD' if card else rng.choice(['PIX', 'PIX', 'CASH']),
+                amount=-purchase_amount(rng, median, sigma),
+                date=when,
+                status='CANCELLED' if rng.random() < 0.02 else 'CONFIRMED' if when <= self.today else 'PLANNED',
+            )
+
+    def generate(self, index):
+        """
+        Create one user with its whole ledger. Returns the number of transactions written.
+        Card purchases are assigned to their invoices chunk by chunk and the aggregate
+        deltas of every chunk are accumulated, then written once for the user (see write_aggregates).
+        """
+        user, accounts, cards, rules = self.create_user(index)
+        rng = self.rng(index, ':purchases')
+        # purchases run a few days past today, so the most recent ones are still PLANNED
+        rows = self.purchases(rng, accounts, cards, self.options['transactions'], self.start, self.today + timedelta(days=3))
+        aggregates = not self.options['skip_aggregates']
+        snapshots, invoices, rollups = {}, {}, {}
+        written = 0
+        for source in (self.occurrences(rules), rows):
+            for batch in batched(source, self.options['batch_size']):
+                if aggregates:
+                    InvoiceManager.assign_invoices(batch)
+                written += len(Transaction.objects.bulk_create(batch))
+                if aggregates:
+                    snapshots = BalanceSnapshotManager.merge_deltas(snapshots, BalanceSnapshotManager.collect_deltas(batch))
+                    invoices = InvoiceManager.merge_deltas(invoices, InvoiceManager.collect_deltas(batch))
+                    rollups = CategoryRollupManager.merge_deltas(
+                        rollups, CategoryRollupManager.collect_deltas(batch, user_id=user.id))
+        if aggregates:
+            self.write_aggregates(snapshots, invoices, rollups)
+        return written
+
+    @staticmethod
+    def write_aggregates(snapshots, invoices, rollups):
+        """
+        Store the accumulated deltas of a new user. None of its snapshot or rollup
+        buckets exist yet, so they are bulk-inserted with their final values instead of
+        going through apply_deltas (one UPDATE per bucket); invoice totals are applied as deltas.
+        """
+        with db_transaction.atomic():
+            BalanceSnapshot.objects.bulk_create([
+                BalanceSnapshot(bank_account_id=account_id, month=month, status=status,
+                                amount=amount, transaction_count=count)
+                for (account_id, month, status), (amount, count) in snapshots.items()
+            ])
+            CategoryRollup.objects.bulk_create([
+                CategoryRollup(user_id=user_id, month=month, category_id=category_id, type=type_,
+                               amount=amount, transaction_count=count)
+                for (user_id, month, category_id, type_), (amount, count) in rollups.items()
+            ])
+            InvoiceManager.apply_deltas(invoices)
+
+    def write_statement(self, path, index, number, rows):
+        """
+        Write an XLSX card statement of `rows` new purchases of user `index`, in the
+        layout read by InvoiceImporter (values are positive, the importer makes them outflows).
+        """
+        rng = self.rng(index, f':statement{number}')
+        cards = list(CreditCard.objects.filter(bank_account__user__username=self.username(index)).order_by('id'))
+        accounts = list(BankAccount.objects.filter(user__username=self.username(index)).order_by('id'))
+        if not cards:
+            raise CommandError("Statements need at least one card (--cards).")
+        names = {category_id: name for name, category_id in self.category_ids.items()}
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(STATEMENT_HEADERS)
+        card_names = {card.id: card.name for card in cards}
+        start = add_months(self.today, number)
+        for tx in self.purchases(rng, accounts, cards, rows, start, add_months(start, 1)):
+            card_id = tx.credit_card_id or rng.choice(cards).id
+            sheet.append([tx.date, tx.description, float(-tx.amount), names[tx.category_id], card_names[card_id]])
+        workbook.save(path)
+
+
+def _init_worker():
+    # spawned workers start without Django; forked ones must not share the parent's connections
+    if not django.apps.apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _generate_users(options, category_ids, indexes):
+    generator = LedgerGenerator(options, category_ids)
+    return sum(generator.generate(index) for index in indexes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic ledger for load testing: users with bank accounts, credit cards, "
+        "recurring rules and purchases with realistic distributions, written with chunked bulk "
+        "inserts (optionally from several processes), plus XLSX card statements for import benchmarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--transactions', type=int, default=10_000, help="Purchases per user.")
+        parser.add_argument('--accounts', type=int, default=2, help="Bank accounts per user.")
+        parser.add_argument('--cards', type=int, default=2, help="Credit cards per user.")
+        parser.add_argument('--recurring', type=int, default=len(RECURRING_PROFILES),
+                            help=f"Recurring rules per user (at most {len(RECURRING_PROFILES)}).")
+        parser.add_argument('--months', type=int, default=24, help="History length.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT.")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes writing users in parallel (PostgreSQL only).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default=None, help="Username prefix (default synthetic-<seed>).")
+        parser.add_argument('--skip-aggregates', action='store_true',
+                            help="Do not assign invoices nor write the snapshots and rollups of the generated users.")
+        parser.add_argument('--statements', type=int, default=0,
+                            help="XLSX statements to write for the first generated user.")
+        parser.add_argument('--statement-rows', type=int, default=1000)
+        parser.add_argument('--output-dir', default='synthetic_statements')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['accounts'] < 1:
+            raise CommandError("--users and --accounts must be at least 1.")
+        options['recurring'] = min(max(options['recurring'], 0), len(RECURRING_PROFILES))
+        options['prefix'] = options['prefix'] or f"synthetic-{options['seed']}"
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Users named {options['prefix']}-* already exist; pick another --prefix or --seed.")
+        workers = max(options['workers'], 1)
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write("SQLite allows a single writer; using one worker.")
+            workers = 1
+
+        currency, _ = Currency.objects.get_or_create(code='BRL', defaults={'symbol': 'R$', 'name': 'Real'})
+        options['currency_id'] = currency.id
+        category_ids = self.categories()
+
+        started = time.perf_counter()
+        indexes = list(range(1, options['users'] + 1))
+        if workers == 1:
+            written = _generate_users(options, category_ids, indexes)
+        else:
+            connections.close_all()
+            context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+            with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker) as pool:
+                written = sum(pool.map(_generate_users, [options] * workers, [category_ids] * workers,
+                                       [indexes[i::workers] for i in range(workers)]))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Wrote {written} transactions for {options['users']} user(s) in {elapsed:.1f}s "
+            f"({written / max(elapsed, 1e-9):,.0f} rows/s)."
+        )
+
+        if options['statements']:
+            generator = LedgerGenerator(options, category_ids)
+            output = Path(options['output_dir'])
+            output.mkdir(parents=True, exist_ok=True)
+            for number in range(1, options['statements'] + 1):
+                path = output / f"{generator.username(1)}-fatura-{number:03d}.xlsx"
+                generator.write_statement(path, 1, number, options['statement_rows'])
+                self.stdout.write(f"Wrote {path}")
+            self.stdout.write(f"Statements use the cards and categories of {generator.username(1)} "
+                              f"(set a password with changepassword to import them from the browser).")
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def categories(self):
+        """
+        Make sure every category used by the profiles exists. Returns {name: id}.
+        """
+        names = [profile[0] for profile in CATEGORY_PROFILES] + [profile[1] for profile in RECURRING_PROFILES]
+        existing = {}
+        for category_id, name in Category.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+            existing[name] = category_id
+        missing = [name for name in dict.fromkeys(names) if name not in existing]
+        for category in Category.objects.bulk_create([Category(name=name, is_approved=True) for name in missing]):
+            existing[category.name] = category.id
+        if missing:
+            # running processes would otherwise keep their category map and create duplicates by name
+            cache.bump_version_on_commit('categories')
+        return existing
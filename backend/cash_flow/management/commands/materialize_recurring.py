@@ -0,0 +1,41 @@
+import time
+from datetime import date
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow import cache
+from cash_flow.api.recurrence_manager import RecurrenceManager
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the transactions of recurring rules that are due and advance their "
+        "next_occurrence. Safe to run from several nodes at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, default=None,
+                            help="Materialize up to this date (YYYY-MM-DD) instead of today.")
+        parser.add_argument('--project-until', type=date.fromisoformat, default=None,
+                            help="Also write PLANNED transactions for the occurrences up to this date (YYYY-MM-DD).")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', type=float, default=None, metavar='SECONDS',
+                            help="Keep running, checking for due rules every SECONDS.")
+
+    def handle(self, *args, **options):
+        try:
+            cache.require_shared()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        manager = RecurrenceManager()
+        while True:
+            rules, created = manager.materialize_due(today=options['date'], batch_size=options['batch_size'])
+            self.stdout.write(f"{rules} recurring rule(s) processed, {created} transaction(s) created.")
+            if options['project_until']:
+                planned = manager.generate_transactions(
+                    options['date'] or date.today(), options['project_until'], batch_size=options['batch_size'])
+                self.stdout.write(f"{len(planned)} planned transaction(s) projected.")
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.api.balance_snapshot_manager import BalanceSnapshotManager
+from cash_flow.models import User
+
+
+class Command(BaseCommand):
+    help = "Verify the balance snapshots against the raw ledger and rebuild them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to restrict the check/rebuild to.")
+        parser.add_argument('--verify', action='store_true',
+                            help="Only report drift; exits with an error when any is found.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User not found: {options['user']}")
+        manager = BalanceSnapshotManager(user)
+
+        drift = manager.verify()
+        for item in drift:
+            account_id, month, status = item['key']
+            self.stdout.write(
+                f"account={account_id} month={month:%Y-%m} status={status} "
+                f"expected={item['expected'][0]} ({item['expected'][1]}) "
+                f"stored={item['stored'][0]} ({item['stored'][1]})"
+            )
+
+        if options['verify']:
+            if drift:
+                raise CommandError(f"{len(drift)} snapshot bucket(s) drifted from the ledger.")
+            self.stdout.write(self.style.SUCCESS("Snapshots match the ledger."))
+            return
+
+        written = manager.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} snapshot bucket(s); {len(drift)} had drifted."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.api.category_rollup_manager import CategoryRollupManager
+from cash_flow.models import User
+
+
+class Command(BaseCommand):
+    help = "Recompute the monthly category rollups from the raw ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to restrict the rebuild to.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User not found: {options['user']}")
+
+        written = CategoryRollupManager(user).rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} category rollup row(s)."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.api.invoice_manager import InvoiceManager
+from cash_flow.models import User
+
+
+class Command(BaseCommand):
+    help = "Assign every card transaction to its invoice and recompute the invoice totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to restrict the rebuild to.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User not found: {options['user']}")
+
+        assigned, invoices = InvoiceManager(user).rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {assigned} card transaction(s); recomputed {invoices} invoice total(s)."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow import cache
+from cash_flow.api.search_manager import SearchManager
+from cash_flow.models import Transaction, User
+
+
+class Command(BaseCommand):
+    help = "Recompute Transaction.search_document (the text indexed by the transaction search)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to restrict the rebuild to.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        transactions = Transaction.objects.all()
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User not found: {options['user']}")
+            transactions = transactions.filter(bank_account__user=user)
+
+        updated = last_id = 0
+        while True:
+            batch = list(transactions.filter(id__gt=last_id).order_by('id')
+                         .only('id', 'description', 'search_document')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            changed = []
+            for tx in batch:
+                document = SearchManager.document(tx.description)
+                if tx.search_document != document:
+                    tx.search_document = document
+                    changed.append(tx)
+            Transaction.objects.bulk_update(changed, ['search_document'])
+            updated += len(changed)
+
+        # the SQLite inverted index is cached per search version
+        user_ids = [user.pk] if user else User.objects.values_list('id', flat=True)
+        for user_id in user_ids:
+            cache.bump_version('search', user_id)
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} search document(s)."))
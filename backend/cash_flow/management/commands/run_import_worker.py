@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow import cache
+from cash_flow.api.import_job_manager import ImportJobManager
+
+
+class Command(BaseCommand):
+    help = "Process queued invoice imports. Run several instances to drain the queue in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=settings.IMPORT_WORKER_POLL_INTERVAL,
+                            help="Seconds to wait before polling an empty queue again.")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--name', default=None, help="Worker name stored on claimed jobs.")
+
+    def handle(self, *args, **options):
+        try:
+            cache.require_shared()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        worker = options['name'] or ImportJobManager.default_worker_name()
+        self.stdout.write(f"Import worker {worker} started.")
+        try:
+            while True:
+                job = ImportJobManager.run_next(worker, batch_size=options['batch_size'])
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                if job.worker != worker:
+                    self.stdout.write(f"Job {job.id} ({job.filename}): lease lost to {job.worker}.")
+                    continue
+                self.stdout.write(
+                    f"Job {job.id} ({job.filename}): {job.status} - "
+                    f"{job.created_count}/{job.rows} rows imported, {job.skipped_count} already imported, "
+                    f"{job.error_count} errors."
+                )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Import worker {worker} stopped.")
@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Per-route aggregates of this process: {route: {...}}, read by the metrics view.
+# Routes are URL pattern names, so the dict is bounded by the URLconf.
+_metrics = defaultdict(lambda: {
+    'requests': 0,
+    'queries': 0,
+    'max_queries': 0,
+    'db_ms': 0.0,
+    'view_ms': 0.0,
+    'max_view_ms': 0.0,
+    'n_plus_one_requests': 0,
+    'n_plus_one': Counter(),
+    'slowest': [],
+})
+_lock = threading.Lock()
+# Requests that did not resolve to a view (404s) share one entry
+UNRESOLVED = '<unresolved>'
+# Distinct N+1 statements kept per route, most frequent first
+MAX_TRACKED_STATEMENTS = 50
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper collecting the statements run while it is installed.
+    Statements are grouped by their SQL text with placeholders, so the same query
+    run with different parameters counts as a repeat.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            self.slowest.append((elapsed, sql))
+            if len(self.slowest) > 2 * settings.QUERY_INSTRUMENTATION_SLOWEST:
+                self.slowest = sorted(self.slowest, reverse=True)[:settings.QUERY_INSTRUMENTATION_SLOWEST]
+
+    def top(self):
+        return sorted(self.slowest, reverse=True)[:settings.QUERY_INSTRUMENTATION_SLOWEST]
+
+    def repeated(self):
+        """
+        Statements run at least QUERY_INSTRUMENTATION_REPEAT_THRESHOLD times: N+1 candidates.
+        """
+        return {sql: count for sql, count in self.statements.items()
+                if count >= settings.QUERY_INSTRUMENTATION_REPEAT_THRESHOLD}
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the number of SQL queries, the database time, the slowest statements and
+    the wall time of every request, add them to a Server-Timing header and to the
+    per-route aggregates served by views.query_metrics.
+    Only active when settings.QUERY_INSTRUMENTATION is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        view_ms = (time.perf_counter() - start) * 1000
+        repeated = recorder.repeated()
+
+        timings = [
+            f'db;dur={recorder.duration:.1f};desc="{recorder.count} queries"',
+            f'view;dur={view_ms:.1f}',
+        ]
+        if repeated:
+            timings.append(f'nplus1;desc="{len(repeated)} repeated statements"')
+        response['Server-Timing'] = ', '.join(timings)
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else UNRESOLVED
+        if route != 'query_metrics':
+            self.record(route, recorder, view_ms, repeated)
+        return response
+
+    @staticmethod
+    def record(route, recorder, view_ms, repeated):
+        with _lock:
+            metrics = _metrics[route]
+            metrics['requests'] += 1
+            metrics['queries'] += recorder.count
+            metrics['max_queries'] = max(metrics['max_queries'], recorder.count)
+            metrics['db_ms'] += recorder.duration
+            metrics['view_ms'] += view_ms
+            metrics['max_view_ms'] = max(metrics['max_view_ms'], view_ms)
+            if repeated:
+                metrics['n_plus_one_requests'] += 1
+                metrics['n_plus_one'].update(repeated.keys())
+                if len(metrics['n_plus_one']) > MAX_TRACKED_STATEMENTS:
+                    metrics['n_plus_one'] = Counter(dict(metrics['n_plus_one'].most_common(MAX_TRACKED_STATEMENTS)))
+            slowest = metrics['slowest'] + [(round(ms, 2), sql) for ms, sql in recorder.top()]
+            metrics['slowest'] = sorted(slowest, reverse=True)[:settings.QUERY_INSTRUMENTATION_SLOWEST]
+
+
+def snapshot():
+    """
+    Aggregates of this process, busiest routes (by database time) first.
+    """
+    with _lock:
+        routes = [
+            {
+                'route': route,
+                'requests': metrics['requests'],
+                'avg_queries': round(metrics['queries'] / metrics['requests'], 1),
+                'max_queries': metrics['max_queries'],
+                'db_ms': round(metrics['db_ms'], 1),
+                'avg_db_ms': round(metrics['db_ms'] / metrics['requests'], 2),
+                'avg_view_ms': round(metrics['view_ms'] / metrics['requests'], 2),
+                'max_view_ms': round(metrics['max_view_ms'], 2),
+                'n_plus_one_requests': metrics['n_plus_one_requests'],
+                'n_plus_one': [{'sql': sql, 'requests': count} for sql, count in metrics['n_plus_one'].most_common(5)],
+                'slowest': [{'ms': ms, 'sql': sql} for ms, sql in metrics['slowest']],
+            }
+            for route, metrics in _metrics.items()
+        ]
+    return {'pid': os.getpid(), 'routes': sorted(routes, key=lambda row: row['db_ms'], reverse=True)}
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
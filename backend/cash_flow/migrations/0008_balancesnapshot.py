@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_snapshots(apps, schema_editor):
+    Transaction = apps.get_model('cash_flow', 'Transaction')
+    BalanceSnapshot = apps.get_model('cash_flow', 'BalanceSnapshot')
+    rows = (
+        Transaction.objects
+        .filter(bank_account__isnull=False)
+        .annotate(month=TruncMonth('date'))
+        .values('bank_account_id', 'month', 'status')
+        .annotate(amount=Sum('amount'), transaction_count=Count('id'))
+        .order_by()
+    )
+    BalanceSnapshot.objects.bulk_create(
+        (BalanceSnapshot(**row) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0007_category_is_approved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('status', models.CharField(choices=[('PLANNED', 'Planned'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('bank_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='cash_flow.bankaccount')),
+            ],
+            options={
+                'unique_together': {('bank_account', 'month', 'status')},
+            },
+        ),
+        migrations.RunPython(build_snapshots, migrations.RunPython.noop),
+    ]
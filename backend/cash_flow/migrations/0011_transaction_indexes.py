@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+# icontains is compiled to UPPER(col::text) LIKE UPPER(%s) on PostgreSQL; these
+# trigram indexes match that expression. Other backends keep sequential scans.
+TRIGRAM_INDEXES = [
+    ('tx_description_trgm_idx', 'cash_flow_transaction', 'description'),
+    ('category_name_trgm_idx', 'cash_flow_category', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0010_transaction_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['bank_account', '-date', '-id'], name='tx_account_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['credit_card', 'date'], name='tx_card_date_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0011_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringtransaction',
+            name='interval',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
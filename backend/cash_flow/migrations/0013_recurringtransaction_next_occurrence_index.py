@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0012_recurringtransaction_interval'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recurringtransaction',
+            name='next_occurrence',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+    ]
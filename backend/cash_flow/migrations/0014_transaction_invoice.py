@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0013_recurringtransaction_next_occurrence_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='invoice',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='cash_flow.creditcardinvoice'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def build_rollups(apps, schema_editor):
+    Transaction = apps.get_model('cash_flow', 'Transaction')
+    CategoryRollup = apps.get_model('cash_flow', 'CategoryRollup')
+    rows = (
+        Transaction.objects
+        .exclude(status='CANCELLED')
+        .annotate(owner=Coalesce('bank_account__user', 'credit_card__bank_account__user'), month=TruncMonth('date'))
+        .filter(owner__isnull=False)
+        .values('owner', 'month', 'category_id', 'type')
+        .annotate(amount=Sum('amount'), transaction_count=Count('id'))
+        .order_by()
+    )
+    CategoryRollup.objects.bulk_create(
+        (CategoryRollup(user_id=row.pop('owner'), **row) for row in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0014_transaction_invoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('type', models.CharField(choices=[('PIX', 'Pix'), ('CASH', 'Cash'), ('CREDITCARD', 'Credit Card')], max_length=12)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rollups', to='cash_flow.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'month'], name='rollup_user_month_idx')],
+                'unique_together': {('user', 'month', 'category', 'type')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+from cash_flow.helpers import search_tokens
+
+# to_tsvector over the normalized document; SearchManager filters with the same expression.
+SEARCH_INDEX = 'tx_search_document_idx'
+
+
+def fill_search_documents(apps, schema_editor):
+    Transaction = apps.get_model('cash_flow', 'Transaction')
+    batch = []
+    for tx in Transaction.objects.only('id', 'description').iterator(chunk_size=2000):
+        tx.search_document = ' '.join(search_tokens(tx.description))
+        batch.append(tx)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['search_document'])
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON cash_flow_transaction "
+        f"USING gin (to_tsvector('simple'::regconfig, search_document))"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0015_categoryrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0016_transaction_search_document'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(blank=True, upload_to='imports/%Y/%m/'),
+        ),
+        migrations.CreateModel(
+            name='ImportJobFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/%Y/%m/')),
+                ('filename', models.CharField(max_length=255)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='cash_flow.importjob')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
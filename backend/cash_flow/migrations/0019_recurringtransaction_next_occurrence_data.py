@@ -0,0 +1,52 @@
+from django.db import migrations
+
+from cash_flow import schedule
+from cash_flow.helpers import transaction_fingerprint
+
+
+def recompute_next_occurrences(apps, schema_editor):
+    """
+    next_occurrence used to hold the occurrence after the rule's first date, and could
+    be NULL; it now holds the first occurrence not yet written as a Transaction
+    (see RecurrenceManager.materialize_due). Rules start over from their first date,
+    or from the occurrence after the latest one the materializer already wrote.
+    """
+    RecurringTransaction = apps.get_model('cash_flow', 'RecurringTransaction')
+    Transaction = apps.get_model('cash_flow', 'Transaction')
+    batch = []
+    for rule in RecurringTransaction.objects.select_related('bank_account').iterator(chunk_size=2000):
+        after = None
+        if rule.bank_account_id:
+            written = (
+                Transaction.objects
+                .filter(bank_account_id=rule.bank_account_id, description=rule.description,
+                        amount=rule.amount, date__gte=rule.date)
+                .order_by('-date')
+                .values_list('date', 'fingerprint')
+            )
+            for day, fingerprint in written.iterator():
+                if fingerprint == transaction_fingerprint(
+                        rule.bank_account.user_id, day, rule.amount, rule.description, f"rt{rule.id}"):
+                    after = day
+                    break
+        if after is None:
+            rule.next_occurrence = rule.date if rule.end_date is None or rule.date <= rule.end_date else None
+        else:
+            rule.next_occurrence = schedule.next_occurrence(
+                rule.date, rule.frequency, rule.interval, after, until=rule.end_date)
+        batch.append(rule)
+        if len(batch) == 2000:
+            RecurringTransaction.objects.bulk_update(batch, ['next_occurrence'])
+            batch = []
+    RecurringTransaction.objects.bulk_update(batch, ['next_occurrence'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0018_importjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_next_occurrences, migrations.RunPython.noop),
+    ]
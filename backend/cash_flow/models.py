@@ -1,7 +1,8 @@
-from datetime import date, timedelta
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+from . import schedule
+
 
 class User(AbstractUser):
     def __str__(self):
@@ -50,7 +51,7 @@ class CreditCardInvoice(models.Model):
     closing_date = models.DateField()
     due_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="OPEN")
-    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # valor devido (compras - estornos)
 
     class Meta:
         unique_together = ("credit_card", "due_date")
@@ -83,6 +84,8 @@ class Transaction(models.Model):
     bank_account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name="transactions", null=True, blank=True)
     credit_card = models.ForeignKey(CreditCard, on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name="transactions")
+    # fatura do cartão à qual a compra pertence (preenchida por InvoiceManager)
+    invoice = models.ForeignKey(CreditCardInvoice, on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions")
 
     # Mandaroty Fields
     description = models.CharField(max_length=255)
@@ -91,11 +94,110 @@ class Transaction(models.Model):
     date = models.DateField()
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PLANNED")
+    # Hash of the normalized source row (see helpers.transaction_fingerprint), used to skip re-imports
+    fingerprint = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # descrição normalizada (helpers.search_tokens) indexada pela busca
+    search_document = models.TextField(blank=True, default="", editable=False)
+
+    class Meta:
+        indexes = [
+            # extrato (home): transações das contas do usuário, mais recentes primeiro
+            models.Index(fields=["bank_account", "-date", "-id"], name="tx_account_date_idx"),
+            # faturas: transações de um cartão dentro de um período
+            models.Index(fields=["credit_card", "date"], name="tx_card_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.amount} ({self.type})"
 
 
+class BalanceSnapshot(models.Model):
+    """
+    Monthly per-account, per-status sum of transaction amounts.
+    Kept current by TransactionManager so balances never need a scan of the raw ledger.
+    """
+    bank_account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name="balance_snapshots")
+    month = models.DateField()  # primeiro dia do mês
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("bank_account", "month", "status")
+
+    def __str__(self):
+        return f"{self.bank_account.name} {self.month:%Y-%m} {self.status}: {self.amount}"
+
+
+class CategoryRollup(models.Model):
+    """
+    Monthly per-user, per-category, per-type sum of the transactions that are not cancelled.
+    Kept current by TransactionManager so spending reports never scan the raw ledger.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="category_rollups")
+    month = models.DateField()  # primeiro dia do mês
+    # NULL = sem categoria (ou categoria excluída)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="rollups")
+    type = models.CharField(max_length=12, choices=Transaction.TYPE_CHOICES)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "month", "category", "type")
+        indexes = [models.Index(fields=["user", "month"], name="rollup_user_month_idx")]
+
+    def __str__(self):
+        return f"{self.user.username} {self.month:%Y-%m} {self.category or '-'} {self.type}: {self.amount}"
+
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="import_jobs")
+    # arquivo único; importações de vários arquivos guardam cada um em ImportJobFile
+    file = models.FileField(upload_to="imports/%Y/%m/", blank=True)
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="QUEUED")
+    worker = models.CharField(max_length=100, blank=True, default="")
+
+    rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # renovado a cada lote; um job RUNNING sem renovação por IMPORT_JOB_LEASE segundos volta para a fila
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"Import {self.id} - {self.filename} ({self.status})"
+
+
+class ImportJobFile(models.Model):
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name="files")
+    file = models.FileField(upload_to="imports/%Y/%m/")
+    filename = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.filename} (import {self.job_id})"
+
+
 class RecurringTransaction(models.Model):
     FREQUENCY_CHOICES = [
         ('DAILY', 'Daily'),
@@ -113,27 +215,34 @@ class RecurringTransaction(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
 
     frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1)  # a cada N períodos; em CUSTOM, a cada N dias
     date = models.DateField()
     end_date = models.DateField(blank=True, null=True)
-    next_occurrence = models.DateField()
+    # próxima ocorrência ainda não lançada como Transaction; NULL quando a recorrência terminou
+    next_occurrence = models.DateField(blank=True, null=True, db_index=True)
 
     def __str__(self):
         return f"{self.description} ({self.frequency})"
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.next_occurrence = self.calculate_next_occurrence()
-
-    def calculate_next_occurrence(self):
-        if self.frequency == 'DAILY':
-            return self.date + timedelta(days=1)
-        elif self.frequency == 'WEEKLY':
-            return self.date + timedelta(weeks=1)
-        elif self.frequency == 'MONTHLY':
-            next_month = self.date.month % 12 + 1
-            next_year = self.date.year + (self.date.month // 12)
-            return self.date.replace(month=next_month, year=next_year)
-        elif self.frequency == 'YEARLY':
-            return self.date.replace(year=self.date.year + 1)
-        else:
-            return None
\ No newline at end of file
+    def save(self, *args, **kwargs):
+        # New rules start at their first date; stored values are left alone because the
+        # materializer advances them. Rows loaded from the database are never touched.
+        if self._state.adding and self.next_occurrence is None:
+            self.next_occurrence = self.date
+        super().save(*args, **kwargs)
+
+    def calculate_next_occurrence(self, after=None):
+        """
+        Next occurrence strictly after `after` (defaults to the rule's first date),
+        or None once the schedule is past end_date.
+        """
+        if self.date is None or not self.frequency:
+            return None
+        return schedule.next_occurrence(
+            self.date, self.frequency, self.interval, after or self.date, until=self.end_date)
+
+    def occurrences(self, start, end):
+        """
+        All occurrences of this rule between start and end (inclusive).
+        """
+        return schedule.occurrences(self.date, self.frequency, self.interval, start, end, until=self.end_date)
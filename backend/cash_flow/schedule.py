@@ -0,0 +1,103 @@
+"""
+Date arithmetic for recurring schedules.
+
+Occurrences are always computed from the rule's anchor date (occurrence k is
+anchor + k steps), never by chaining one step after the previous occurrence, so
+a rule anchored on Jan 31 yields Feb 28/29, Mar 31, Apr 30, ... instead of
+drifting to the 28th. A whole window is produced at once with integer ranges
+over day ordinals or month indexes.
+"""
+from calendar import monthrange
+from datetime import date
+
+# Frequencies stepping a number of days; CUSTOM means "every `interval` days".
+STEP_DAYS = {'DAILY': 1, 'WEEKLY': 7, 'CUSTOM': 1}
+# Frequencies stepping a number of months.
+STEP_MONTHS = {'MONTHLY': 1, 'YEARLY': 12}
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def _month_date(index, day):
+    year, month = divmod(index, 12)
+    month += 1
+    return date(year, month, min(day, monthrange(year, month)[1]))
+
+
+def occurrences(anchor, frequency, interval, start, end, until=None):
+    """
+    All occurrences of a schedule between `start` and `end` (both inclusive).
+    Parameters:
+    - anchor: date of the first occurrence.
+    - frequency: one of RecurringTransaction.FREQUENCY_CHOICES.
+    - interval: number of frequency units between occurrences (days for CUSTOM).
+    - until: optional last allowed date (the rule's end_date).
+    """
+    interval = max(int(interval or 1), 1)
+    if until is not None and until < end:
+        end = until
+    if anchor > start:
+        start = anchor
+    if start > end:
+        return []
+
+    if frequency in STEP_DAYS:
+        step = STEP_DAYS[frequency] * interval
+        first = _ceil_div(start.toordinal() - anchor.toordinal(), step)
+        last = (end.toordinal() - anchor.toordinal()) // step
+        base = anchor.toordinal()
+        return [date.fromordinal(base + k * step) for k in range(first, last + 1)]
+
+    if frequency in STEP_MONTHS:
+        step = STEP_MONTHS[frequency] * interval
+        base = _month_index(anchor)
+        first = _ceil_div(_month_index(start) - base, step)
+        last = (_month_index(end) - base) // step
+        dates = [_month_date(base + k * step, anchor.day) for k in range(first, last + 1)]
+        # The first and last months may hold a clamped day outside the window.
+        return [d for d in dates if start <= d <= end]
+
+    raise ValueError(f"Invalid frequency: {frequency}")
+
+
+def next_occurrence(anchor, frequency, interval, after, until=None):
+    """
+    First occurrence strictly after `after`, or None when the schedule has ended.
+    """
+    interval = max(int(interval or 1), 1)
+    if after < anchor:
+        candidate = anchor
+    elif frequency in STEP_DAYS:
+        step = STEP_DAYS[frequency] * interval
+        k = (after.toordinal() - anchor.toordinal()) // step + 1
+        candidate = date.fromordinal(anchor.toordinal() + k * step)
+    elif frequency in STEP_MONTHS:
+        step = STEP_MONTHS[frequency] * interval
+        k = (_month_index(after) - _month_index(anchor)) // step
+        candidate = _month_date(_month_index(anchor) + k * step, anchor.day)
+        if candidate <= after:
+            candidate = _month_date(_month_index(anchor) + (k + 1) * step, anchor.day)
+    else:
+        raise ValueError(f"Invalid frequency: {frequency}")
+    if until is not None and candidate > until:
+        return None
+    return candidate
+
+
+def expand(rules, start, end):
+    """
+    Expand many recurring rules into (rule, date) pairs inside [start, end], ordered by date.
+    Rules only need `date`, `frequency`, `interval` and `end_date` attributes.
+    """
+    pairs = []
+    for rule in rules:
+        pairs.extend((rule, d) for d in occurrences(
+            rule.date, rule.frequency, rule.interval, start, end, until=rule.end_date))
+    pairs.sort(key=lambda pair: pair[1])
+    return pairs
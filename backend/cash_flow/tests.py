@@ -1,3 +1,1131 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import math
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from cash_flow import cache, middleware, schedule
+from cash_flow.api import (
+    AccountManager, BalanceSnapshotManager, CategoryManager, CategoryRollupManager, ImportJobManager, InvoiceImporter,
+    InvoiceManager, RecurrenceManager, SearchManager, TransactionManager,
+)
+from cash_flow.helpers import CENTS, add_months, invoice_dates, to_decimal
+from cash_flow.models import (
+    BankAccount, Category, CategoryRollup, CreditCard, CreditCardInvoice, Currency, ImportJob, RecurringTransaction,
+    Transaction, User,
+)
+
+# Query budgets: the most queries each operation may run, whatever the number of rows.
+# Aggregate maintenance costs one UPDATE per touched (month, category, invoice) bucket,
+# so the synthetic rows below cycle through a fixed set of months and categories.
+# INSERT statements split by the backend's parameter limit are counted on top
+# (see insert_statements).
+BUDGETS = {
+    'list_accounts': 1,
+    'create_transactions': 26,
+    'import_invoices': 47,
+    'home_cold': 9,
+    'home_warm': 2,
+}
+# Generous wall-time bounds (seconds) that only catch order-of-magnitude regressions
+TIME_BOUNDS = {
+    'list_accounts': 1,
+    'create_transactions': 10,
+    'import_invoices': 15,
+    'home': 2,
+}
+SMALL, LARGE = 100, 2000
+MONTHS, CATEGORIES = 4, 3
+
+
+def seed_ledger(name, transactions, accounts=3, cards=2, seed=0):
+    """
+    Create a user with `accounts` bank accounts, `cards` credit cards and a
+    deterministic ledger of `transactions` rows spread over the last two years.
+    Returns the user.
+    """
+    rng = random.Random(seed)
+    currency, _ = Currency.objects.get_or_create(code='BRL', defaults={'symbol': 'R$'})
+    user = User.objects.create_user(name, f'{name}@example.com', 'password')
+    bank_accounts = BankAccount.objects.bulk_create([
+        BankAccount(user=user, name=f'Conta {i}', bank_name='Banco', balance_initial=1000, currency=currency)
+        for i in range(accounts)
+    ])
+    credit_cards = CreditCard.objects.bulk_create([
+        CreditCard(bank_account=bank_accounts[i % accounts], name=f'Cartao {i}', limit=5000, closing_day=5, due_day=12)
+        for i in range(cards)
+    ])
+    today = date.today()
+    rows = []
+    for i in range(transactions):
+        card = credit_cards[i % cards] if cards and rng.random() < 0.3 else None
+        rows.append(Transaction(
+            bank_account=card.bank_account if card else rng.choice(bank_accounts),
+            credit_card=card,
+            description=f'Compra {rng.randrange(200)}',
+            type='CREDITCARD' if card else rng.choice(['PIX', 'CASH']),
+            amount=Decimal(rng.randrange(-50000, 20000)) / 100,
+            date=today - timedelta(days=rng.randrange(730)),
+            status=rng.choice(['CONFIRMED', 'CONFIRMED', 'PLANNED']),
+        ))
+    TransactionManager.bulk_create_transactions(rows)
+    return user
+
+
+def insert_statements(model, rows):
+    """
+    Number of INSERT statements Django needs to bulk-create `rows` instances of
+    `model` on the current backend: 1 on PostgreSQL, more on SQLite, whose
+    statements are limited to 999 parameters.
+    """
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    return math.ceil(rows / connection.ops.bulk_batch_size(fields, [None] * rows))
+
+
+def statement_xlsx(rows, prefix, seed=0, card='Cartao 0'):
+    """
+    An N-row credit card statement in the layout read by InvoiceImporter.
+    Purchases are spread over MONTHS billing cycles and CATEGORIES categories named after `prefix`.
+    """
+    rng = random.Random(seed)
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Data', 'Descrição', 'Valor', 'Categoria', 'Cartão'])
+    for i in range(rows):
+        sheet.append([
+            date(2024, 1 + i % MONTHS, 10),
+            f'Loja {i}',
+            rng.randrange(100, 50000) / 100,
+            f'{prefix} {i % CATEGORIES}',
+            card,
+        ])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class LedgerAssertions:
+    """
+    Checks that the delta-maintained aggregates (balance snapshots, invoice totals,
+    category rollups) match a recomputation from the raw ledger.
+    """
+
+    @staticmethod
+    def cents(totals):
+        # SQLite sums decimals as floats
+        return {key: (Decimal(amount).quantize(CENTS), count) for key, (amount, count) in totals.items()}
+
+    def assertAggregatesMatchLedger(self, user):
+        snapshots = BalanceSnapshotManager(user)
+        self.assertEqual(self.cents(snapshots.snapshot_totals()), self.cents(snapshots.ledger_totals()))
+
+        rollups = CategoryRollupManager(user).queryset.exclude(amount=0, transaction_count=0).values_list(
+            'user_id', 'month', 'category_id', 'type', 'amount', 'transaction_count')
+        self.assertEqual(
+            self.cents({(user_id, month, category_id, type_): (amount, count)
+                        for user_id, month, category_id, type_, amount, count in rollups}),
+            self.cents(CategoryRollupManager(user).ledger_totals()),
+        )
+
+        card_transactions = Transaction.objects.filter(credit_card__bank_account__user=user).select_related(
+            'credit_card', 'invoice')
+        totals = {}
+        for tx in card_transactions:
+            self.assertIsNotNone(tx.invoice, f"card transaction {tx.id} has no invoice")
+            self.assertEqual(tx.invoice.credit_card_id, tx.credit_card_id)
+            self.assertEqual(
+                (tx.invoice.closing_date, tx.invoice.due_date),
+                invoice_dates(tx.date, tx.credit_card.closing_day, tx.credit_card.due_day),
+            )
+            if tx.status != 'CANCELLED':
+                totals[tx.invoice_id] = totals.get(tx.invoice_id, 0) - tx.amount
+        for invoice_id, total_amount in InvoiceManager(user).queryset.values_list('id', 'total_amount'):
+            self.assertEqual(total_amount, totals.get(invoice_id, 0), f"invoice {invoice_id} total drifted")
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Run an operation against a small and a large ledger and check that both stay
+    within the same query budget.
+    """
+
+    def setUp(self):
+        self.clear_cache()
+
+    @staticmethod
+    def clear_cache():
+        cache.cache.clear()
+        cache._local.clear()
+
+    def measure(self, operation):
+        """
+        Run `operation()` and return (number of queries, seconds).
+        """
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - start
+        return len(queries), elapsed
+
+    def assertBudget(self, name, queries, elapsed, inserts=0, time_bound=None):
+        budget = BUDGETS[name] + inserts
+        time_bound = TIME_BOUNDS[name] if time_bound is None else time_bound
+        self.assertLessEqual(queries, budget, f"{name} ran {queries} queries (budget {budget})")
+        self.assertLess(elapsed, time_bound, f"{name} took {elapsed:.2f}s (bound {time_bound}s)")
+
+    def assertFlat(self, name, small, large):
+        self.assertEqual(small, large, f"{name} queries grow with N: {small} for {SMALL} rows, {large} for {LARGE}")
+
+
+class AccountManagerQueryTests(QueryBudgetTestCase):
+
+    def test_list_accounts(self):
+        counts = []
+        for n in (SMALL, LARGE):
+            user = seed_ledger(f'accounts{n}', n)
+            manager = AccountManager(user)
+            queries, elapsed = self.measure(manager.list_accounts)
+            self.assertBudget('list_accounts', queries, elapsed)
+            counts.append(queries)
+            self.assertEqual(len(manager.list_accounts()), 3)
+        self.assertFlat('list_accounts', *counts)
+
+    def test_list_accounts_balance(self):
+        user = seed_ledger('balance', 200)
+        balances = AccountManager(user).list_accounts()
+        for account_id, account in balances.items():
+            expected = 1000 + sum(Transaction.objects.filter(bank_account_id=account_id).values_list('amount', flat=True))
+            self.assertEqual(account['balance'], expected)
+
+
+class TransactionManagerQueryTests(QueryBudgetTestCase):
+
+    def rows(self, n):
+        return [
+            {
+                'bank_account': 'Conta 0' if i % 2 else 'Conta 1',
+                'category': f'Categoria {n}-{i % CATEGORIES}',
+                'description': f'Transação {i}',
+                'type': 'PIX',
+                'amount': '-12.34',
+                'date': date(2024, 1 + i % MONTHS, 15),
+                'status': 'CONFIRMED',
+            }
+            for i in range(n)
+        ]
+
+    @override_settings(IMPORT_BATCH_SIZE=LARGE)
+    def test_create_transactions(self):
+        counts = []
+        for n in (SMALL, LARGE):
+            user = seed_ledger(f'create{n}', 10)
+            manager = TransactionManager(user)
+            rows = self.rows(n)
+            queries, elapsed = self.measure(lambda: manager.create_transactions(rows))
+            inserts = insert_statements(Transaction, n)
+            self.assertBudget('create_transactions', queries, elapsed, inserts=inserts)
+            counts.append(queries - inserts)
+            self.assertEqual(manager.queryset.count(), 10 + n)
+        self.assertFlat('create_transactions', *counts)
+
+
+@override_settings(IMPORT_BATCH_SIZE=LARGE)
+class ImportInvoicesQueryTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_import_invoices(self):
+        counts = []
+        for n in (SMALL, LARGE):
+            user = seed_ledger(f'import{n}', 10)
+            self.client.force_login(user)
+            upload = SimpleUploadedFile(f'fatura{n}.xlsx', statement_xlsx(n, prefix=f'Categoria {n}'))
+
+            def run():
+                response = self.client.post(reverse('import_invoices'), {'imported_file': upload})
+                self.assertEqual(response.status_code, 200)
+                # the lookup maps are invalidated when the import commits
+                with self.captureOnCommitCallbacks(execute=True):
+                    job = ImportJobManager.run_next(worker='test')
+                self.assertEqual(job.status, 'DONE', job.message)
+                self.assertEqual(job.created_count, n)
+
+            queries, elapsed = self.measure(run)
+            inserts = insert_statements(Transaction, n)
+            self.assertBudget('import_invoices', queries, elapsed, inserts=inserts)
+            counts.append(queries - inserts)
+        self.assertFlat('import_invoices', *counts)
+
+    @override_settings(IMPORT_PARSE_WORKERS=2)
+    def test_import_multiple_files(self):
+        user = seed_ledger('importfiles', 10)
+        self.client.force_login(user)
+        # the second statement holds every purchase of the first one plus 50 new ones
+        first = statement_xlsx(SMALL, prefix='Arquivos')
+        second = statement_xlsx(SMALL + 50, prefix='Arquivos')
+        uploads = [SimpleUploadedFile('fatura1.xlsx', first), SimpleUploadedFile('fatura2.xlsx', second)]
+        response = self.client.post(reverse('import_invoices'), {'imported_file': uploads})
+        self.assertEqual(response.status_code, 200)
+        job = ImportJobManager.run_next(worker='test')
+        self.assertEqual(job.status, 'DONE', job.message)
+        self.assertEqual(job.rows, 2 * SMALL + 50)
+        self.assertEqual(job.created_count, SMALL + 50)
+        self.assertEqual(job.skipped_count, SMALL)
+        files = ImportJobManager(user).get_status(job.id)['files']
+        self.assertEqual([file['rows'] for file in files], [SMALL, SMALL + 50])
+
+
+class HomeViewQueryTests(QueryBudgetTestCase):
+
+    def test_home(self):
+        counts = []
+        for n in (SMALL, LARGE):
+            user = seed_ledger(f'home{n}', n)
+            self.client.force_login(user)
+            url = reverse('home')
+            self.clear_cache()
+            cold, elapsed = self.measure(lambda: self.assertEqual(self.client.get(url).status_code, 200))
+            self.assertBudget('home_cold', cold, elapsed, time_bound=TIME_BOUNDS['home'])
+            warm, elapsed = self.measure(lambda: self.assertEqual(self.client.get(url).status_code, 200))
+            self.assertBudget('home_warm', warm, elapsed, time_bound=TIME_BOUNDS['home'])
+            counts.append((cold, warm))
+        self.assertFlat('home', *counts)
+
+    def test_home_write_invalidates_dashboard(self):
+        user = seed_ledger('homewrite', 50)
+        self.client.force_login(user)
+        self.client.get(reverse('home'))
+        # the dashboard is invalidated when the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            TransactionManager(user).create_transactions([{
+                'bank_account': 'Conta 0', 'description': 'Depósito novo', 'type': 'PIX',
+                'amount': '99.99', 'date': date.today().isoformat(), 'status': 'CONFIRMED',
+            }])
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Depósito novo')
+
+
+class ViewAuthenticationTests(TestCase):
+
+    def test_anonymous_json_requests_get_401(self):
+        job = ImportJob.objects.create(user=seed_ledger('anonymous', 0, accounts=1, cards=0), filename='fatura.xlsx')
+        for url in (reverse('transactions_api'), reverse('search_api') + '?q=compra', reverse('forecast_api'),
+                    reverse('category_report_api'), reverse('query_metrics'),
+                    reverse('import_status', args=[job.id])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response.json(), {'error': 'Authentication required'})
+
+    def test_anonymous_pages_redirect_to_login(self):
+        for url in (reverse('home'), reverse('invoices'), reverse('import_invoices'), reverse('add_transaction')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response['Location'].startswith(reverse('admin:login')))
+
+
+class IngestOwnershipTests(TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+
+    def test_ingest_rejects_other_users_account_and_card(self):
+        owner = seed_ledger('ingestowner', 0, accounts=1, cards=1)
+        other = seed_ledger('ingestother', 0, accounts=1, cards=1)
+        other_account = BankAccount.objects.get(user=other)
+        other_card = CreditCard.objects.get(bank_account=other_account)
+        own_account = BankAccount.objects.get(user=owner)
+        row = {'description': 'Compra', 'type': 'PIX', 'amount': '-10.00', 'date': '2024-01-10', 'status': 'CONFIRMED'}
+        body = '\n'.join(json.dumps(data) for data in [
+            {**row, 'bank_account': other_account.id},
+            {**row, 'type': 'CREDITCARD', 'credit_card': other_card.id},
+            {**row, 'bank_account': {'id': other_account.id}},
+            {**row, 'bank_account': own_account.id},
+        ])
+        token = RefreshToken.for_user(owner).access_token
+        response = self.client.post(reverse('api_ingest_transactions'), body, content_type='application/x-ndjson',
+                                    HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual([result['status'] for result in report['results']], ['error', 'error', 'error', 'created'])
+        self.assertIn('Unknown bank account', report['results'][0]['error'])
+        self.assertIn('Unknown credit card', report['results'][1]['error'])
+        self.assertFalse(Transaction.objects.filter(bank_account=other_account).exists())
+        self.assertEqual(Transaction.objects.filter(bank_account=own_account).count(), 1)
+
+
+    def test_ingest_reports_invalid_status_and_long_text_per_row(self):
+        user = seed_ledger('ingestvalues', 0, accounts=1, cards=0)
+        account = BankAccount.objects.get(user=user)
+        row = {'bank_account': account.id, 'description': 'Compra', 'type': 'PIX', 'amount': '-10.00',
+               'date': '2024-01-10'}
+        body = json.dumps([
+            {**row, 'status': 'PAGO'},
+            {**row, 'description': 'x' * 256},
+            {**row, 'status': 'X' * 30},
+            {**row, 'status': 'CONFIRMED'},
+            {**row, 'description': None, 'date': '2024-01-11'},
+        ])
+        token = RefreshToken.for_user(user).access_token
+        response = self.client.post(reverse('api_ingest_transactions'), body, content_type='application/json',
+                                    HTTP_AUTHORIZATION=f'Bearer {token}')
+        report = response.json()
+        self.assertEqual([result['status'] for result in report['results']],
+                         ['error', 'error', 'error', 'created', 'created'])
+        self.assertIn('Invalid transaction status: PAGO', report['results'][0]['error'])
+        self.assertIn('description is longer than 255 characters', report['results'][1]['error'])
+        self.assertEqual(sorted(TransactionManager(user).queryset.values_list('status', 'description')),
+                         [('CONFIRMED', 'Compra'), ('PLANNED', '')])
+        with self.assertRaisesMessage(ValueError, 'Invalid transaction status'):
+            TransactionManager(user).update_transactions([{'transaction_id': report['results'][3]['id'], 'status': 'PAGO'}])
+
+
+class AsyncApiTests(TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+        self.user = seed_ledger('asyncapi', 0, accounts=2, cards=0)
+        accounts = list(BankAccount.objects.filter(user=self.user).order_by('id'))
+        # several rows per day in both accounts, so pages end in the middle of a date
+        TransactionManager.bulk_create_transactions([
+            Transaction(bank_account=accounts[i % 2], description=f'Compra {i}', type='PIX', amount=Decimal('-10.00'),
+                        date=date(2024, 1, 1 + i // 3), status='CONFIRMED')
+            for i in range(9)
+        ])
+        other = seed_ledger('asyncother', 3, accounts=1, cards=0)
+        self.assertTrue(TransactionManager(other).queryset.exists())
+        self.expected = list(TransactionManager(self.user).queryset.order_by('-date', '-id').values_list('id', flat=True))
+        self.token = RefreshToken.for_user(self.user).access_token
+
+    def get(self, **params):
+        return self.client.get(reverse('api_transactions'), params, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_anonymous_gets_401_and_post_gets_405(self):
+        response = self.client.get(reverse('api_transactions'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'Authentication required'})
+        response = self.client.post(reverse('api_transactions'), HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 405)
+
+    def test_bad_cursor_and_limit_get_400(self):
+        for params in ({'cursor': 'not-a-cursor'}, {'limit': 'ten'}, {'date_from': '2024-13-01'}):
+            with self.subTest(params=params):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_pages_cover_the_ledger_once_across_cursor_boundaries(self):
+        ids, cursor = [], None
+        while True:
+            response = self.get(limit=2, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids += [row['id'] for row in body['results']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected)
+
+        manager = TransactionManager(self.user)
+        ids, cursor = [], None
+        while True:
+            page = manager.page(cursor=cursor, limit=2)
+            ids += [tx.id for tx in page['results']]
+            cursor = page['next_cursor']
+            if not page['has_next']:
+                break
+        self.assertEqual(ids, self.expected)
+
+    def test_filters_apply_with_the_cursor(self):
+        account = BankAccount.objects.filter(user=self.user).order_by('id').first()
+        first = self.get(account=account.id, date_to='2024-01-02', limit=2).json()
+        rest = self.get(account=account.id, date_to='2024-01-02', cursor=first['next_cursor']).json()
+        expected = list(
+            Transaction.objects.filter(bank_account=account, date__lte=date(2024, 1, 2))
+            .order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in first['results'] + rest['results']], expected)
+        self.assertIsNone(rest['next_cursor'])
+
+
+class InvoiceImporterTests(TestCase):
+
+    clear_cache = staticmethod(QueryBudgetTestCase.clear_cache)
+
+    def setUp(self):
+        self.clear_cache()
+
+    def import_statement(self, user, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return InvoiceImporter(user).run(io.BytesIO(data), 'fatura.xlsx')
+
+    def test_new_card_is_linked_to_the_only_account(self):
+        user = seed_ledger('newcard', 0, accounts=1, cards=0)
+        report = self.import_statement(user, statement_xlsx(2, prefix='Novo cartão', card='Nubank'))
+        self.assertEqual(report['created'], 2)
+        card = CreditCard.objects.get(name='Nubank')
+        self.assertEqual(card.bank_account, BankAccount.objects.get(user=user))
+        self.assertEqual(TransactionManager(user).queryset.filter(credit_card=card).count(), 2)
+        self.assertFalse(Transaction.objects.filter(bank_account__isnull=True).exists())
+
+    def test_new_card_without_account_to_pick_is_an_error(self):
+        user = seed_ledger('newcardmany', 0, accounts=2, cards=0)
+        report = self.import_statement(user, statement_xlsx(2, prefix='Novo cartão', card='Nubank'))
+        self.assertEqual((report['created'], report['error_count']), (0, 2))
+        self.assertIn('Unknown credit card: Nubank', report['errors'][0]['error'])
+        self.assertFalse(CreditCard.objects.filter(name='Nubank').exists())
+
+    def test_long_description_is_a_row_error(self):
+        user = seed_ledger('longtext', 0, accounts=1, cards=1)
+        workbook = Workbook()
+        workbook.active.append(['Data', 'Descrição', 'Valor', 'Cartão', 'Status'])
+        workbook.active.append([date(2024, 1, 10), 'Loja ' * 60, 10.5, 'Cartao 0', ''])
+        workbook.active.append([date(2024, 1, 11), 'Loja', 20, 'Cartao 0', 'PENDENTE'])
+        workbook.active.append([date(2024, 1, 12), 'Loja', 30, 'Cartao 0', ''])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        report = self.import_statement(user, buffer.getvalue())
+        self.assertEqual((report['created'], report['error_count']), (1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3])
+        self.assertIn('description is longer than 255 characters', report['errors'][0]['error'])
+        self.assertEqual(TransactionManager(user).queryset.get().status, 'PLANNED')
+
+    def test_csv_statement_reports_bad_rows(self):
+        user = seed_ledger('csvstatement', 0, accounts=1, cards=1)
+        # semicolon-separated with decimal commas, as exported by Brazilian banks
+        data = '\n'.join([
+            'Data;Descrição;Valor;Categoria;Cartão',
+            '10/01/2024;Mercado;1.234,56;Mercado CSV;Cartao 0',
+            '31/02/2024;Padaria;12,50;Mercado CSV;Cartao 0',
+            '12/01/2024;Farmácia;doze reais;Saúde CSV;Cartao 0',
+            ';;;;',
+            '2024-01-15;Posto;R$ 80,00;Transporte CSV;Cartao 0',
+        ]).encode('utf-8-sig')
+        with self.captureOnCommitCallbacks(execute=True):
+            report = InvoiceImporter(user).run(io.BytesIO(data), 'fatura.csv')
+        self.assertEqual((report['rows'], report['created'], report['error_count']), (4, 2, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+        self.assertIn('Invalid date: 31/02/2024', report['errors'][0]['error'])
+        self.assertIn('doze reais', report['errors'][1]['error'])
+        self.assertEqual(
+            sorted(TransactionManager(user).queryset.values_list('date', 'description', 'amount', 'category__name')),
+            [(date(2024, 1, 10), 'Mercado', Decimal('-1234.56'), 'Mercado CSV'),
+             (date(2024, 1, 15), 'Posto', Decimal('-80.00'), 'Transporte CSV')])
+
+    def test_reimport_is_idempotent(self):
+        user = seed_ledger('reimport', 0, accounts=1, cards=0)
+        # the card is created by the first import and reused by the second one
+        data = statement_xlsx(SMALL, prefix='Reimportação', card='Nubank')
+        first = self.import_statement(user, data)
+        self.assertEqual((first['created'], first['skipped']), (SMALL, 0))
+        self.clear_cache()
+        second = self.import_statement(user, data)
+        self.assertEqual((second['created'], second['skipped'], second['error_count']), (0, SMALL, 0))
+        self.assertEqual(CreditCard.objects.filter(name='Nubank').count(), 1)
+        self.assertEqual(TransactionManager(user).queryset.count(), SMALL)
+
+
+class TransactionUpdateTests(LedgerAssertions, TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+        self.user = seed_ledger('update', 60, accounts=2, cards=2)
+        self.manager = TransactionManager(self.user)
+
+    def test_update_rejects_other_users_references(self):
+        other = seed_ledger('updateother', 5, accounts=1, cards=1)
+        other_account = BankAccount.objects.get(user=other)
+        other_card = CreditCard.objects.get(bank_account=other_account)
+        other_invoice = CreditCardInvoice.objects.create(
+            credit_card=other_card, closing_date=date(2024, 1, 5), due_date=date(2024, 1, 12))
+        tx = self.manager.queryset.filter(credit_card__isnull=True).first()
+        for change in ({'bank_account': other_account.id}, {'bank_account': other_account},
+                       {'credit_card': other_card.id}, {'invoice': other_invoice.id}):
+            with self.subTest(change=change), self.assertRaises(ValueError):
+                self.manager.update_transactions([{'transaction_id': tx.id, **change}])
+        tx.refresh_from_db()
+        self.assertEqual(tx.bank_account.user, self.user)
+        self.assertEqual(TransactionManager(other).queryset.count(), 5)
+        self.assertAggregatesMatchLedger(self.user)
+        self.assertAggregatesMatchLedger(other)
+
+    def test_update_groups_by_changed_fields(self):
+        ids = list(self.manager.queryset.order_by('id').values_list('id', flat=True)[:30])
+        updates = [{'transaction_id': pk, 'status': 'CONFIRMED'} for pk in ids[:20]]
+        updates += [{'transaction_id': pk, 'amount': f'-{i + 1}.50'} for i, pk in enumerate(ids[20:])]
+        # merged with the status change above: a group of its own
+        updates.append({'transaction_id': ids[0], 'description': 'Nova descrição'})
+        with CaptureQueriesContext(connection) as queries:
+            self.manager.update_transactions(updates)
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        statements = [query['sql'] for query in queries if query['sql'].startswith(f'UPDATE {table} SET')]
+        self.assertEqual(len(statements), 3, statements)
+        # same new value for the whole group: one plain UPDATE, no per-row CASE
+        self.assertEqual(sum('CASE' in sql for sql in statements), 1)
+        self.assertEqual(self.manager.queryset.filter(id__in=ids[:20], status='CONFIRMED').count(), 20)
+        self.assertEqual(self.manager.queryset.get(id=ids[21]).amount, Decimal('-2.50'))
+        first = self.manager.queryset.get(id=ids[0])
+        self.assertEqual((first.description, first.search_document), ('Nova descrição', 'nova descricao'))
+        self.assertAggregatesMatchLedger(self.user)
+
+    def test_update_keeps_aggregates_current(self):
+        category = Category.objects.create(name='Atualização')
+        accounts = list(AccountManager(self.user).queryset.order_by('id'))
+        cards = list(CreditCard.objects.filter(bank_account__user=self.user).order_by('id'))
+        plain = list(self.manager.queryset.filter(credit_card__isnull=True).order_by('id')[:4])
+        card = list(self.manager.queryset.filter(credit_card=cards[0]).order_by('id')[:3])
+        self.manager.update_transactions([
+            {'transaction_id': plain[0].id, 'amount': '-999.99'},
+            {'transaction_id': plain[1].id, 'date': plain[1].date - timedelta(days=40)},
+            {'transaction_id': plain[2].id, 'bank_account': accounts[1].id if plain[2].bank_account_id == accounts[0].id else accounts[0].id},
+            {'transaction_id': plain[3].id, 'category': category.id, 'status': 'CANCELLED'},
+            {'transaction_id': card[0].id, 'credit_card': cards[1].id},
+            {'transaction_id': card[1].id, 'date': card[1].date + timedelta(days=35)},
+            {'transaction_id': card[2].id, 'status': 'CANCELLED', 'amount': '-1.00'},
+        ])
+        moved = self.manager.queryset.get(id=card[0].id)
+        self.assertEqual((moved.credit_card_id, moved.bank_account_id), (cards[1].id, cards[1].bank_account_id))
+        # cancelled transactions are left out of the rollups
+        self.assertFalse(CategoryRollup.objects.filter(user=self.user, category=category).exists())
+        self.assertAggregatesMatchLedger(self.user)
+
+
+class InvoiceTests(LedgerAssertions, TestCase):
+
+    def test_purchase_on_closing_day_goes_to_next_invoice(self):
+        self.assertEqual(invoice_dates(date(2024, 3, 4), 5, 12), (date(2024, 3, 5), date(2024, 3, 12)))
+        self.assertEqual(invoice_dates(date(2024, 3, 5), 5, 12), (date(2024, 4, 5), date(2024, 4, 12)))
+        self.assertEqual(invoice_dates(date(2024, 12, 5), 5, 12), (date(2025, 1, 5), date(2025, 1, 12)))
+        # the due date is the first due_day strictly after the closing date
+        self.assertEqual(invoice_dates(date(2024, 3, 10), 25, 5), (date(2024, 3, 25), date(2024, 4, 5)))
+        self.assertEqual(invoice_dates(date(2024, 3, 1), 10, 10), (date(2024, 3, 10), date(2024, 4, 10)))
+
+    def test_days_beyond_month_end_are_clamped(self):
+        self.assertEqual(invoice_dates(date(2024, 2, 10), 31, 10), (date(2024, 2, 29), date(2024, 3, 10)))
+        # Feb 29 is the clamped closing day itself
+        self.assertEqual(invoice_dates(date(2024, 2, 29), 31, 10), (date(2024, 3, 31), date(2024, 4, 10)))
+        self.assertEqual(invoice_dates(date(2023, 2, 28), 30, 8), (date(2023, 3, 30), date(2023, 4, 8)))
+        self.assertEqual(invoice_dates(date(2024, 4, 30), 31, 10), (date(2024, 5, 31), date(2024, 6, 10)))
+        self.assertEqual(invoice_dates(date(2024, 4, 1), 5, 31), (date(2024, 4, 5), date(2024, 4, 30)))
+        # clamped due day that would fall on the clamped closing day moves a month
+        self.assertEqual(invoice_dates(date(2023, 2, 1), 29, 31), (date(2023, 2, 28), date(2023, 3, 31)))
+
+    def invoice_totals(self):
+        return {
+            (card_id, due_date): total
+            for card_id, due_date, total in InvoiceManager(self.user).queryset.exclude(total_amount=0).values_list(
+                'credit_card_id', 'due_date', 'total_amount')
+        }
+
+    def test_totals_follow_create_update_and_delete(self):
+        QueryBudgetTestCase.clear_cache()
+        self.user = seed_ledger('invoices', 0, accounts=2, cards=2)
+        first, second = CreditCard.objects.filter(bank_account__user=self.user).order_by('id')
+        manager = TransactionManager(self.user)
+        purchase, closing_day, refund = manager.create_transactions([
+            {'credit_card': first, 'type': 'CREDITCARD', 'description': 'Mercado', 'amount': '-100.00',
+             'date': date(2024, 3, 4)},
+            {'credit_card': first, 'type': 'CREDITCARD', 'description': 'Farmácia', 'amount': '-50.00',
+             'date': date(2024, 3, 5)},
+            {'credit_card': first, 'type': 'CREDITCARD', 'description': 'Estorno', 'amount': '20.00',
+             'date': date(2024, 3, 1)},
+        ])
+        march, april = date(2024, 3, 12), date(2024, 4, 12)
+        self.assertEqual(self.invoice_totals(), {(first.id, march): Decimal('80.00'), (first.id, april): Decimal('50.00')})
+        self.assertAggregatesMatchLedger(self.user)
+
+        manager.update_transactions([{'transaction_id': purchase.id, 'date': date(2024, 3, 10)}])
+        self.assertEqual(self.invoice_totals(), {(first.id, march): Decimal('-20.00'), (first.id, april): Decimal('150.00')})
+        manager.update_transactions([{'transaction_id': closing_day.id, 'credit_card': second.id}])
+        self.assertEqual(self.invoice_totals(), {
+            (first.id, march): Decimal('-20.00'), (first.id, april): Decimal('100.00'),
+            (second.id, april): Decimal('50.00'),
+        })
+        manager.update_transactions([{'transaction_id': refund.id, 'status': 'CANCELLED'}])
+        self.assertEqual(self.invoice_totals(), {(first.id, april): Decimal('100.00'), (second.id, april): Decimal('50.00')})
+        self.assertAggregatesMatchLedger(self.user)
+
+        self.assertEqual(manager.delete_transactions([purchase.id, refund.id])[0], 2)
+        self.assertEqual(self.invoice_totals(), {(second.id, april): Decimal('50.00')})
+        self.assertAggregatesMatchLedger(self.user)
+
+
+class DeleteTransactionsTests(LedgerAssertions, TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+        self.user = seed_ledger('delete', 80, accounts=2, cards=2)
+        self.other = seed_ledger('deleteother', 20, accounts=1, cards=1, seed=1)
+        self.manager = TransactionManager(self.user)
+
+    def delete_and_check(self):
+        mine = list(self.manager.queryset.order_by('id')[:45])
+        theirs = list(TransactionManager(self.other).queryset.values_list('id', flat=True)[:10])
+        expected = {}
+        for tx in mine:
+            key = (tx.bank_account_id, tx.date.replace(day=1))
+            expected[key] = expected.get(key, 0) + tx.amount
+        with self.captureOnCommitCallbacks(execute=True):
+            count, deltas = self.manager.delete_transactions(
+                [tx.id for tx in mine] + theirs + [str(mine[0].id)], batch_size=20)
+        self.assertEqual(count, len(mine))
+        self.assertEqual(deltas, expected)
+        self.assertFalse(Transaction.objects.filter(id__in=[tx.id for tx in mine]).exists())
+        self.assertEqual(self.manager.queryset.count(), 80 - len(mine))
+        self.assertEqual(TransactionManager(self.other).queryset.count(), 20)
+        self.assertAggregatesMatchLedger(self.user)
+        self.assertAggregatesMatchLedger(self.other)
+
+    def test_delete_returning(self):
+        if not TransactionManager.can_delete_returning():
+            self.skipTest("DELETE ... RETURNING is not supported by this database")
+        self.delete_and_check()
+
+    def test_delete_without_returning(self):
+        with mock.patch.object(TransactionManager, 'can_delete_returning', return_value=False):
+            self.delete_and_check()
+
+    def test_delete_only_foreign_ids(self):
+        theirs = list(TransactionManager(self.other).queryset.values_list('id', flat=True))
+        self.assertEqual(self.manager.delete_transactions(theirs), (0, {}))
+        self.assertEqual(TransactionManager(self.other).queryset.count(), 20)
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+        self.user = seed_ledger('search', 50, accounts=1, cards=1)
+        self.manager = TransactionManager(self.user)
+
+    def search(self, query):
+        with mock.patch.object(SearchManager, 'use_tsvector', False), \
+                mock.patch.object(SearchManager, 'build_index', autospec=True,
+                                  side_effect=SearchManager.build_index) as build_index:
+            ids = {tx.id for tx in TransactionManager(self.user).search(query, limit=100)}
+        return ids, build_index.call_count
+
+    def test_index_is_rebuilt_only_when_documents_change(self):
+        self.assertEqual(self.search('compra')[1], 1)
+        self.assertEqual(self.search('compra')[1], 0)
+        tx, gone = self.manager.queryset.order_by('id')[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.update_transactions([{'transaction_id': tx.id, 'amount': '-1.00', 'status': 'CONFIRMED'}])
+            self.manager.delete_transactions([gone.id])
+        ids, builds = self.search('compra')
+        self.assertEqual(builds, 0)
+        self.assertNotIn(gone.id, ids)
+        self.assertEqual(ids, set(self.manager.queryset.values_list('id', flat=True)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.update_transactions([{'transaction_id': tx.id, 'description': 'Padaria Central'}])
+        self.assertEqual(self.search('padaria'), ({tx.id}, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            added, = self.manager.create_transactions([{
+                'bank_account': tx.bank_account, 'type': 'PIX', 'description': 'Padaria Nova',
+                'amount': '-8.00', 'date': date(2024, 5, 2)}])
+        self.assertEqual(self.search('padaria'), ({tx.id, added.id}, 1))
+
+    def test_index_is_not_stored_in_the_shared_cache(self):
+        self.search('compra')
+        with mock.patch.object(cache._local, 'get', return_value=None), \
+                mock.patch.object(SearchManager, 'build_index', autospec=True,
+                                  side_effect=SearchManager.build_index) as build_index:
+            SearchManager(self.user, self.manager.queryset, None, None).index()
+        self.assertEqual(build_index.call_count, 1)
+
+
+class LedgerCacheTests(TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+
+    def test_local_copies_expire(self):
+        self.assertEqual(cache.get_or_build('ledger', 'ttl', lambda: 'built'), 'built')
+        shared_key = f"zf:ledger:ttl:v{cache.get_version('ledger', 'ttl')}"
+        cache.cache.set(shared_key, 'shared')
+        # the process-local copy wins while it is fresh...
+        self.assertEqual(cache.get_or_build('ledger', 'ttl', lambda: 'rebuilt'), 'built')
+        # ...and is dropped after LOOKUP_CACHE_TIMEOUT
+        later = time.monotonic() + settings.LOOKUP_CACHE_TIMEOUT + 1
+        with mock.patch.object(cache.time, 'monotonic', return_value=later):
+            self.assertEqual(cache.get_or_build('ledger', 'ttl', lambda: 'rebuilt'), 'shared')
+
+    @override_settings(LOCAL_CACHE_MAX_ENTRIES=3)
+    def test_local_copies_are_bounded(self):
+        for search in range(5):
+            cache.get_or_build('ledger', 'lru', lambda: search, key=f'home:page:{search}')
+        self.assertEqual(len(cache._local), 3)
+        # least recently used first out
+        self.assertIsNone(cache._local.get(('ledger', 'lru', 'home:page:0')))
+        self.assertIsNotNone(cache._local.get(('ledger', 'lru', 'home:page:4')))
+
+    def test_name_maps_are_invalidated_on_commit(self):
+        user = seed_ledger('maps', 0, accounts=1, cards=0)
+        accounts = AccountManager(user)
+        categories = CategoryManager(user)
+        versions = (cache.get_version('categories'), cache.get_version('credit_cards', accounts.cache_scope))
+        with self.captureOnCommitCallbacks() as callbacks:
+            categories.create_category('Viagem')
+            categories.resolve_references([{'category': 'Pets'}])
+            accounts.create_credit_card('Cartao Novo')
+            # a process reading the maps now still gets the committed ones, under the old version
+            self.assertEqual(
+                (cache.get_version('categories'), cache.get_version('credit_cards', accounts.cache_scope)), versions)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get_version('categories'), versions[0])
+        self.assertNotEqual(cache.get_version('credit_cards', accounts.cache_scope), versions[1])
+        self.assertIsNotNone(CategoryManager(user).get_category_by_name('pets'))
+        self.assertIn('cartaonovo', AccountManager(user).credit_cards_by_name)
+
+    def test_rebuilds_invalidate_cached_ledger_views(self):
+        user = seed_ledger('rebuilds', 40, accounts=1, cards=1)
+        other = seed_ledger('rebuildsother', 5, accounts=1, cards=0)
+        invoice = CreditCardInvoice.objects.filter(credit_card__bank_account__user=user).exclude(total_amount=0).first()
+        manager = TransactionManager(user)
+        total = lambda: CreditCardInvoice.objects.get(id=invoice.id).total_amount
+        # a drifted total cached by the dashboard is replaced by the rebuilt one
+        CreditCardInvoice.objects.filter(id=invoice.id).update(total_amount=0)
+        self.assertEqual(manager.cached('invoice', total), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_invoices', stdout=io.StringIO())
+        self.assertEqual(manager.cached('invoice', total), invoice.total_amount)
+        for command, options in (('rebuild_balance_snapshots', {}), ('rebuild_category_rollups', {}),
+                                 ('rebuild_invoices', {'user': 'rebuilds'})):
+            with self.subTest(command=command):
+                versions = (cache.get_version('ledger', user.pk), cache.get_version('ledger', other.pk))
+                with self.captureOnCommitCallbacks(execute=True):
+                    call_command(command, stdout=io.StringIO(), **options)
+                self.assertNotEqual(cache.get_version('ledger', user.pk), versions[0])
+                # --user only drops that user's entries
+                self.assertEqual(cache.get_version('ledger', other.pk) != versions[1], not options)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_workers_require_a_shared_cache(self):
+        for command, *args in (('run_import_worker', '--once'), ('materialize_recurring',)):
+            with self.subTest(command=command), self.assertRaisesMessage(CommandError, 'local to each process'):
+                call_command(command, *args)
+
+
+@override_settings(QUERY_INSTRUMENTATION=True)
+class QueryInstrumentationTests(TestCase):
+
+    def setUp(self):
+        middleware.reset()
+        self.addCleanup(middleware.reset)
+
+    def test_unresolved_requests_share_one_route(self):
+        for i in range(5):
+            response = self.client.get(f'/no-such-page-{i}/')
+            self.assertEqual(response.status_code, 404)
+            self.assertIn('Server-Timing', response)
+        self.assertEqual([row['route'] for row in middleware.snapshot()['routes']], [middleware.UNRESOLVED])
+
+    def test_metrics_are_staff_only(self):
+        user = User.objects.create_user('metrics', 'metrics@example.com', 'password')
+        self.client.force_login(user)
+        # the test client connects from 127.0.0.1, which is no longer enough
+        self.assertEqual(self.client.get(reverse('query_metrics')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(reverse('query_metrics')).status_code, 200)
+
+
+class ImportJobLeaseTests(TestCase):
+
+    def setUp(self):
+        self.user = seed_ledger('lease', 0, accounts=1, cards=1)
+        self.job = ImportJob.objects.create(user=self.user, filename='fatura.xlsx')
+
+    def test_stalled_job_is_reclaimed(self):
+        job = ImportJobManager.claim_next(worker='crashed')
+        self.assertEqual(job.id, self.job.id)
+        # a live lease keeps the job with its worker
+        self.assertIsNone(ImportJobManager.claim_next(worker='other'))
+        ImportJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(seconds=601))
+        with override_settings(IMPORT_JOB_LEASE=600):
+            reclaimed = ImportJobManager.claim_next(worker='other')
+        self.assertEqual((reclaimed.id, reclaimed.status, reclaimed.worker), (job.id, 'RUNNING', 'other'))
+        self.assertIn('Reclaimed from crashed', reclaimed.message)
+
+    def reclaim(self, worker='other'):
+        ImportJob.objects.filter(id=self.job.id).update(worker=worker, heartbeat_at=timezone.now())
+
+    def enqueue_statement(self, rows):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.job.delete()
+        self.job = ImportJobManager(self.user).enqueue(
+            SimpleUploadedFile('fatura.xlsx', statement_xlsx(rows, prefix='Lease')))
+
+    def assertLeftToOtherWorker(self, job, rows=0):
+        stored = ImportJob.objects.get(id=self.job.id)
+        for current in (job, stored):
+            self.assertEqual((current.status, current.worker, current.rows, current.finished_at),
+                             ('RUNNING', 'other', rows, None))
+
+    def test_lost_lease_stops_the_import(self):
+        self.enqueue_statement(30)
+        job = ImportJobManager.claim_next(worker='slow')
+        self.reclaim()
+        job = ImportJobManager.run(job, batch_size=10)
+        # the first chunk is written, then the progress update finds the job taken
+        self.assertEqual(TransactionManager(self.user).queryset.count(), 10)
+        self.assertLeftToOtherWorker(job)
+
+    def test_finishing_after_a_lost_lease_leaves_the_job_alone(self):
+        self.enqueue_statement(5)
+        job = ImportJobManager.claim_next(worker='slow')
+        run = InvoiceImporter.run
+
+        def reclaimed_while_running(importer, file, filename):
+            report = run(importer, file, filename)
+            self.reclaim()
+            return report
+
+        with mock.patch.object(InvoiceImporter, 'run', autospec=True, side_effect=reclaimed_while_running):
+            job = ImportJobManager.run(job)
+        self.assertEqual(TransactionManager(self.user).queryset.count(), 5)
+        # progress recorded before the reclaim stays, DONE is never written
+        self.assertLeftToOtherWorker(job, rows=5)
+
+    def test_parsing_renews_the_lease(self):
+        files = [(f'fatura{i}.xlsx', statement_xlsx(5, prefix='Parse', seed=i)) for i in range(3)]
+        for workers in (1, 2):
+            heartbeat = mock.Mock()
+            with self.subTest(workers=workers), override_settings(IMPORT_PARSE_WORKERS=workers):
+                parsed = InvoiceImporter(self.user, heartbeat=heartbeat).parse_files(files)
+                self.assertEqual([len(rows) for rows in parsed], [5, 5, 5])
+                self.assertGreaterEqual(heartbeat.call_count, 1 if workers > 1 else 3)
+
+    def test_job_claimed_without_heartbeat_is_reclaimed(self):
+        ImportJob.objects.filter(id=self.job.id).update(
+            status='RUNNING', worker='old', started_at=timezone.now() - timedelta(hours=1))
+        reclaimed = ImportJobManager.claim_next(worker='new', lease=600)
+        self.assertEqual((reclaimed.id, reclaimed.worker), (self.job.id, 'new'))
+        self.assertIsNotNone(reclaimed.heartbeat_at)
+
+
+class AmountParsingTests(TestCase):
+
+    def test_last_separator_is_the_decimal_one(self):
+        for value, expected in (
+            ('1,234.56', '1234.56'), ('1.234,56', '1234.56'), ('R$ 1.234,56', '1234.56'),
+            ('-R$ 1.234.567,89', '-1234567.89'), ('1,234,567', '1234567.00'), ('1.234.567', '1234567.00'),
+            ('1234,5', '1234.50'), ('0,125', '0.12'), ('12345.678', '12345.68'), ('-1500', '-1500.00'),
+            (Decimal('10.005'), '10.00'), (2.5, '2.50'), (7, '7.00'),
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(to_decimal(value), Decimal(expected))
+        self.assertIsNone(to_decimal(''))
+
+    def test_ambiguous_and_invalid_amounts_raise(self):
+        for value in ('1.234', '1,234', '-2.500', '1,2,3', '1.23.4', '12,34.5', '1.2.3,45', 'abc', 'NaN', '-',
+                      float('nan'), float('inf'), Decimal('NaN'), Decimal('-Infinity')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                to_decimal(value)
+
+
+class GenerateLedgerTests(LedgerAssertions, TestCase):
+
+    def test_small_ledger(self):
+        QueryBudgetTestCase.clear_cache()
+        version = cache.get_version('categories')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('generate_ledger', users=2, transactions=40, months=3, accounts=2, cards=2, batch_size=25,
+                         prefix='smoke', stdout=io.StringIO())
+        self.assertNotEqual(cache.get_version('categories'), version)
+        users = list(User.objects.filter(username__startswith='smoke-').order_by('username'))
+        self.assertEqual([user.username for user in users], ['smoke-000001', 'smoke-000002'])
+        today = date.today()
+        for user in users:
+            rules = RecurringTransaction.objects.filter(bank_account__user=user)
+            occurrences = sum(len(schedule.occurrences(rule.date, rule.frequency, rule.interval,
+                                                       add_months(today, -3), today)) for rule in rules)
+            self.assertEqual(BankAccount.objects.filter(user=user).count(), 2)
+            self.assertEqual(CreditCard.objects.filter(bank_account__user=user).count(), 2)
+            self.assertEqual(rules.count(), 6)
+            self.assertEqual(TransactionManager(user).queryset.count(), 40 + occurrences)
+            self.assertEqual(BalanceSnapshotManager(user).verify(), [])
+            self.assertAggregatesMatchLedger(user)
+
+
+class ScheduleTests(TestCase):
+
+    def test_month_end_anchor_does_not_drift(self):
+        anchor = date(2024, 1, 31)
+        self.assertEqual(
+            schedule.occurrences(anchor, 'MONTHLY', 1, date(2024, 1, 1), date(2024, 5, 31)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31)],
+        )
+        self.assertEqual(schedule.next_occurrence(anchor, 'MONTHLY', 1, date(2024, 2, 29)), date(2024, 3, 31))
+        self.assertEqual(schedule.next_occurrence(anchor, 'MONTHLY', 1, date(2024, 2, 28)), date(2024, 2, 29))
+        # the clamped day of the window's first month lies before the window
+        self.assertEqual(
+            schedule.occurrences(anchor, 'MONTHLY', 1, date(2023, 2, 28), date(2023, 3, 31)), [],
+        )
+        self.assertEqual(
+            schedule.occurrences(date(2023, 1, 31), 'MONTHLY', 1, date(2023, 3, 1), date(2023, 4, 29)),
+            [date(2023, 3, 31)],
+        )
+
+    def test_leap_day_anchor(self):
+        anchor = date(2024, 2, 29)
+        self.assertEqual(
+            schedule.occurrences(anchor, 'YEARLY', 1, date(2024, 1, 1), date(2028, 12, 31)),
+            [date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29)],
+        )
+        self.assertEqual(schedule.next_occurrence(anchor, 'YEARLY', 1, date(2025, 2, 28)), date(2026, 2, 28))
+        self.assertEqual(schedule.next_occurrence(anchor, 'YEARLY', 1, date(2027, 3, 1)), date(2028, 2, 29))
+
+    def test_custom_interval_steps_days(self):
+        anchor = date(2024, 1, 1)
+        self.assertEqual(
+            schedule.occurrences(anchor, 'CUSTOM', 10, date(2024, 1, 5), date(2024, 2, 1)),
+            [date(2024, 1, 11), date(2024, 1, 21), date(2024, 1, 31)],
+        )
+        self.assertEqual(schedule.next_occurrence(anchor, 'CUSTOM', 10, date(2024, 1, 10)), date(2024, 1, 11))
+        self.assertEqual(schedule.next_occurrence(anchor, 'CUSTOM', 10, date(2024, 1, 11)), date(2024, 1, 21))
+        self.assertEqual(
+            schedule.occurrences(anchor, 'MONTHLY', 2, date(2024, 1, 1), date(2024, 6, 30)),
+            [date(2024, 1, 1), date(2024, 3, 1), date(2024, 5, 1)],
+        )
+
+    def test_until_ends_the_schedule(self):
+        anchor = date(2024, 1, 1)
+        self.assertEqual(
+            schedule.occurrences(anchor, 'WEEKLY', 1, date(2024, 1, 1), date(2024, 2, 29), until=date(2024, 1, 20)),
+            [date(2024, 1, 1), date(2024, 1, 8), date(2024, 1, 15)],
+        )
+        self.assertEqual(
+            schedule.next_occurrence(anchor, 'WEEKLY', 1, date(2024, 1, 8), until=date(2024, 1, 20)), date(2024, 1, 15))
+        self.assertIsNone(schedule.next_occurrence(anchor, 'WEEKLY', 1, date(2024, 1, 15), until=date(2024, 1, 20)))
+        self.assertEqual(schedule.occurrences(anchor, 'DAILY', 1, date(2024, 2, 1), date(2024, 2, 5),
+                                              until=date(2024, 1, 31)), [])
+
+    def test_window_before_anchor(self):
+        anchor = date(2024, 6, 15)
+        self.assertEqual(schedule.occurrences(anchor, 'DAILY', 1, date(2024, 1, 1), date(2024, 6, 1)), [])
+        self.assertEqual(schedule.next_occurrence(anchor, 'MONTHLY', 1, date(2024, 1, 1)), anchor)
+
+
+class RecurrenceGenerationTests(LedgerAssertions, TestCase):
+
+    def setUp(self):
+        QueryBudgetTestCase.clear_cache()
+        self.user = seed_ledger('recurring', 0, accounts=1, cards=0)
+        self.rule = RecurringTransaction.objects.create(
+            bank_account=BankAccount.objects.get(user=self.user), description='Aluguel', type='PIX',
+            amount=Decimal('-1500.00'), frequency='MONTHLY', date=date(2024, 1, 31),
+        )
+
+    def planned(self):
+        return list(Transaction.objects.filter(bank_account__user=self.user).order_by('date').values_list(
+            'date', flat=True))
+
+    def test_generating_the_same_window_twice_is_a_noop(self):
+        manager = RecurrenceManager(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = manager.generate_transactions(date(2024, 1, 1), date(2024, 4, 30))
+        self.assertEqual(len(created), 4)
+        self.assertEqual(self.planned(), [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(manager.generate_transactions(date(2024, 1, 1), date(2024, 4, 30)), [])
+            # an overlapping window only adds the new occurrences
+            self.assertEqual(len(manager.generate_transactions(date(2024, 3, 1), date(2024, 5, 31))), 1)
+        self.assertEqual(len(self.planned()), 5)
+        self.assertAggregatesMatchLedger(self.user)
+
+    def test_migration_restarts_existing_rules(self):
+        migration = importlib.import_module('cash_flow.migrations.0019_recurringtransaction_next_occurrence_data')
+        account = self.rule.bank_account
+        # rules saved before the materializer: anchor + 1 step, or NULL
+        RecurringTransaction.objects.filter(id=self.rule.id).update(next_occurrence=date(2024, 2, 29))
+        unset = RecurringTransaction.objects.create(
+            bank_account=account, description='Academia', type='PIX', amount=Decimal('-90.00'),
+            frequency='WEEKLY', date=date(2024, 3, 4), end_date=date(2024, 3, 20))
+        ended = RecurringTransaction.objects.create(
+            bank_account=account, description='Curso', type='PIX', amount=Decimal('-300.00'),
+            frequency='MONTHLY', date=date(2024, 5, 10), end_date=date(2024, 4, 1))
+        RecurringTransaction.objects.filter(id__in=[unset.id, ended.id]).update(next_occurrence=None)
+        # a rule the materializer already caught up to March
+        written = RecurringTransaction.objects.create(
+            bank_account=account, description='Internet', type='PIX', amount=Decimal('-120.00'),
+            frequency='MONTHLY', date=date(2024, 1, 15))
+        RecurrenceManager(self.user).generate_transactions(date(2024, 1, 1), date(2024, 3, 31), rules=[written])
+
+        migration.recompute_next_occurrences(apps, None)
+        next_occurrences = dict(RecurringTransaction.objects.values_list('id', 'next_occurrence'))
+        self.assertEqual(next_occurrences, {
+            self.rule.id: date(2024, 1, 31), unset.id: date(2024, 3, 4), ended.id: None, written.id: date(2024, 4, 15),
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            RecurrenceManager(self.user).materialize_due(today=date(2024, 3, 31))
+        self.assertEqual(
+            list(Transaction.objects.filter(description='Aluguel').order_by('date').values_list('date', flat=True)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)],
+        )
+        self.assertEqual(Transaction.objects.filter(description='Academia').count(), 3)
+        self.assertEqual(Transaction.objects.filter(description='Internet').count(), 3)
+
+    def test_add_transaction_view_creates_rules_and_transactions(self):
+        category = Category.objects.create(name='Moradia')
+        account = self.rule.bank_account
+        self.client.force_login(self.user)
+        form = {'account': account.id, 'category': category.id, 'description': 'Condomínio', 'type': 'PIX',
+                'amount': '450.00', 'date': '2024-02-10', 'status': 'CONFIRMED'}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('add_transaction'), {
+                **form, 'recurring': '1', 'frequency': 'MONTHLY', 'end_date': ''})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        rule = RecurringTransaction.objects.get(description='Condomínio')
+        self.assertEqual((rule.frequency, rule.interval, rule.date, rule.next_occurrence, rule.end_date),
+                         ('MONTHLY', 1, date(2024, 2, 10), date(2024, 2, 10), None))
+        self.assertEqual((rule.bank_account, rule.category, rule.amount), (account, category, Decimal('450.00')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('add_transaction'), {**form, 'recurring': ''})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        tx = Transaction.objects.get(description='Condomínio')
+        self.assertEqual((tx.status, tx.credit_card, tx.amount), ('CONFIRMED', None, Decimal('450.00')))
+
+    def test_materializing_projected_occurrences_adds_nothing(self):
+        with mock.patch.object(cache, 'require_shared'), self.captureOnCommitCallbacks(execute=True):
+            call_command('materialize_recurring', date=date(2024, 2, 29), project_until=date(2024, 4, 30),
+                         stdout=io.StringIO())
+            # the scheduled run reaching the projected dates finds them already written
+            call_command('materialize_recurring', date=date(2024, 4, 30), stdout=io.StringIO())
+        self.assertEqual(self.planned(), [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)])
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.next_occurrence, date(2024, 5, 31))
+        self.assertAggregatesMatchLedger(self.user)
@@ -1,10 +1,21 @@
 from django.urls import path
-from . import views
+from . import api_views, views
 
 urlpatterns = [
     path("", views.home, name="home"),
     path("invoices/", views.invoices, name="invoices"),
+    path("api/transactions/", views.transactions_api, name="transactions_api"),
+    path("api/search/", views.search_api, name="search_api"),
+    path("api/forecast/", views.forecast_api, name="forecast_api"),
+    path("api/v1/accounts/", api_views.accounts, name="api_accounts"),
+    path("api/v1/balances/", api_views.balances, name="api_balances"),
+    path("api/v1/transactions/", api_views.transactions, name="api_transactions"),
+    path("api/v1/transactions/ingest/", api_views.ingest_transactions, name="api_ingest_transactions"),
+    path("api/v1/invoices/", api_views.invoices, name="api_invoices"),
+    path("api/reports/categories/", views.category_report_api, name="category_report_api"),
+    path("metrics/queries/", views.query_metrics, name="query_metrics"),
     path("import_invoices/", views.import_invoices, name="import_invoices"),
+    path("import_invoices/<int:job_id>/", views.import_status, name="import_status"),
     path("adicionar-pedido/", views.add_transaction, name="add_transaction"),
     path("adicionar-produto/", views.add_product, name="add_product"),
     path("update_transaction/<int:transaction_id>/", views.update_transaction, name="update_transaction"),
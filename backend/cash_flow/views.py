@@ -1,120 +1,201 @@
-import io
-from django.core.paginator import Paginator
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 
 from cash_flow.api.transaction_manager import TransactionManager
-from cash_flow.api import AccountManager
-from cash_flow.models import Category, Transaction
-from .helpers import norm_str
+from cash_flow.api.import_job_manager import ImportJobManager
+from cash_flow.api.invoice_manager import InvoiceManager
+from cash_flow.api.forecast_manager import ForecastManager
+from cash_flow.api.category_rollup_manager import CategoryRollupManager
+from cash_flow.models import Category
+from . import middleware
+from .helpers import CENTS
 
 from datetime import datetime
-from openpyxl import load_workbook
-
-def home(request):
-    search = request.GET.get('q', '')
 
-    accounts = AccountManager(request.user.id).list_accounts()  # Prevent linter error, should be imported if used
-    transactions = Transaction.objects.filter(bank_account_id__in=accounts.keys()).order_by('-date')
 
-    if search:
-        transactions = transactions.filter(category__name__icontains=search) | transactions.filter(bank_account__name__icontains=search)
+def api_login_required(view):
+    """
+    JSON counterpart of login_required: 401 instead of a redirect for anonymous requests.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
 
-    paginator = Paginator(transactions, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
 
+@login_required
+def home(request):
+    search = request.GET.get('q', '')
+    cursor = request.GET.get('cursor')
 
-    amount = 0
-    for account in accounts.values():
-        amount += account['balance'] or 0
+    tm = TransactionManager(request.user)
+    dashboard = tm.dashboard(search=search, first_page=not cursor)
+    page = dashboard['page']
+    if cursor:
+        try:
+            page = tm.page(cursor=cursor, search=search)
+        except ValueError:
+            cursor = None
+            page = tm.dashboard(search=search)['page']
 
     return render(request, 'home.html', {
-        'transactions': page_obj,
-        'accounts': accounts,
-        'total_accounts': amount,
+        'transactions': page['results'],
+        'next_cursor': page['next_cursor'],
+        'is_first_page': not cursor,
+        'approximate_count': dashboard['approximate_count'] if not search else None,
+        'accounts': dashboard['accounts'],
+        'total_accounts': dashboard['total'],
         'user': request.user,
     })
 
-def invoices(request):
-    date = datetime.fromisoformat(request.GET.get('date')) if request.GET.get('date') else datetime.now()
-    filter = {
-        'date__year': date.year,
-        'date__month': date.month,
+
+def _transaction_to_dict(transaction):
+    return {
+        'id': transaction.id,
+        'date': transaction.date.isoformat(),
+        'description': transaction.description,
+        'amount': str(transaction.amount),
+        'type': transaction.type,
+        'status': transaction.status,
+        'bank_account': transaction.bank_account.name if transaction.bank_account else None,
+        'credit_card': transaction.credit_card.name if transaction.credit_card else None,
+        'category': transaction.category.name if transaction.category else None,
     }
-    if request.GET.get('credit_card'):
-        filter['credit_card'] = request.GET.get('credit_card')
 
-    transactions = Transaction.objects.filter(**filter)
 
-    transactions = transactions.order_by('-date')
+@api_login_required
+def transactions_api(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 500)
+        tm = TransactionManager(request.user)
+        page = tm.page(cursor=request.GET.get('cursor'), limit=limit, search=request.GET.get('q'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'results': [_transaction_to_dict(tx) for tx in page['results']],
+        'next_cursor': page['next_cursor'],
+        'approximate_count': tm.approximate_count(),
+    })
+
+@api_login_required
+def search_api(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    results = TransactionManager(request.user).search(request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'results': [_transaction_to_dict(tx) for tx in results]})
+
+
+@api_login_required
+def forecast_api(request):
+    try:
+        months = int(request.GET.get('months', 12))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(ForecastManager(request.user).forecast(months=months))
+
+
+@api_login_required
+def category_report_api(request):
+    try:
+        months = min(max(int(request.GET.get('months', 24)), 1), 120)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rows = CategoryRollupManager(request.user).report(months=months, type=request.GET.get('type'))
+    return JsonResponse({
+        'months': months,
+        'results': [
+            {
+                'month': row['month'].strftime('%Y-%m'),
+                'category_id': row['category_id'],
+                'category': row['category_name'],
+                'type': row['type'],
+                'amount': str(row['amount'].quantize(CENTS)),
+                'count': row['count'],
+            }
+            for row in rows
+        ],
+    })
+
+
+@api_login_required
+def query_metrics(request):
+    """
+    Query and latency aggregates of this process, recorded by QueryInstrumentationMiddleware.
+    Only served to staff users: the aggregates include SQL text.
+    """
+    if not settings.QUERY_INSTRUMENTATION:
+        raise Http404
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse(middleware.snapshot())
+
+
+@login_required
+def invoices(request):
+    date = datetime.fromisoformat(request.GET.get('date')) if request.GET.get('date') else None
+    invoices = InvoiceManager(request.user).list_invoices(
+        credit_card=request.GET.get('credit_card'),
+        month=date.date() if date else None,
+        limit=None if date else 24,
+    )
 
     return render(request, 'invoices.html', {
-        'invoices': []
+        'invoices': invoices,
     })
 
+@login_required
 def import_invoices(request):
-    mapping_dict = {
-        'data': 'date',
-        'descricao': 'description',
-        'valor': 'amount',
-        'categoria': 'category',
-        'cartao': 'credit_card',
-    }
     if request.method == 'POST' and request.FILES.get('imported_file'):
-        uploaded = request.FILES['imported_file']
+        uploads = request.FILES.getlist('imported_file')
         try:
-            raw = uploaded.read()
-            wb = load_workbook(filename=io.BytesIO(raw), data_only=True)
-            ws = wb.active
-            rows = list(ws.values)
-
-            if not rows:
-                messages.error(request, f'Arquivo "{uploaded.name}" vazio.')
+            job = ImportJobManager(request.user).enqueue_files(uploads)
+            if len(uploads) == 1:
+                messages.success(request, f'Arquivo "{uploads[0].name}" recebido. Importação #{job.id} na fila.')
             else:
-                headers = []
-                for i, h in enumerate(rows[0]):
-                    if h is None:
-                        headers.append(f'col_{i}')
-                    else:
-                        headers.append(mapping_dict.get(norm_str(str(h)), norm_str(str(h))))
-
-                transactions = []
-                for row in rows[1:]:
-                    rowdict = {headers[i]: (row[i] if i < len(row) and row[i] is not None else '') for i in range(len(headers))}
-                    rowdict['type'] = 'CREDITCARD'
-                    rowdict['amount'] = -abs(rowdict['amount'])
-                    transactions.append(rowdict)
-
-                messages.success(request, f'Arquivo "{uploaded.name}" lido. {len(transactions)} linhas encontradas.')
-                TransactionManager(request.user).create_transactions(transactions)
-                return render(request, 'invoices.html')
+                messages.success(request, f'{len(uploads)} arquivos recebidos. Importação #{job.id} na fila.')
+            return render(request, 'invoices.html', {'import_job': job})
         except Exception as e:
-            messages.error(request, f'Erro ao ler arquivo: {e}')
+            messages.error(request, f'Erro ao enviar arquivo: {e}')
     return render(request, 'home.html')
 
 
+@api_login_required
+def import_status(request, job_id):
+    return JsonResponse(ImportJobManager(request.user).get_status(job_id))
+
+
+@login_required
 def add_transaction(request):
     categories = Category.objects.all()
-    account_manager = AccountManager(request.user.id)
-    accounts = account_manager.queryset
-    credit_cards = account_manager.get_credit_cards()
+    tm = TransactionManager(request.user)
+    accounts = tm.account_manager.queryset
+    credit_cards = tm.account_manager.credit_cards
 
     if request.method == 'POST':
-        tm = TransactionManager(request.user)
         try:
+            credit_card = request.POST.get('credit_card')
             data = {
                     'bank_account': accounts.get(id=request.POST.get('account')),
                     'category': categories.get(id=request.POST.get('category')),
-                    'credit_card': credit_cards.get(int(request.POST.get('credit_card',None))),
+                    'credit_card': credit_cards.get(int(credit_card)) if credit_card else None,
                     'description': request.POST.get('description'),
                     'type': request.POST.get('type'),
-                    'amount': float(request.POST.get('amount')),
+                    'amount': request.POST.get('amount'),
                     'date': request.POST.get('date'),
                     'status': request.POST.get('status'),
             }
             if request.POST.get('recurring'):
-                data['frequence'] = request.POST.get('frequence')
+                data['frequency'] = request.POST.get('frequency')
+                data['interval'] = request.POST.get('interval')
                 data['end_date'] = request.POST.get('end_date')
                 tm.create_recurrent_transactions([data])
             else:                
@@ -150,9 +231,11 @@ def add_product(request):
     #     return redirect("stock")
     return render(request, "product_form.html")
 
+@login_required
 def update_transaction(request, transaction_id):
     return home(request)
 
+@login_required
 def delete_transaction(request, transaction_id):
     return home(request)
 